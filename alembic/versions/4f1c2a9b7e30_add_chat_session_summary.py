@@ -0,0 +1,43 @@
+"""add_chat_session_summary
+
+Revision ID: 4f1c2a9b7e30
+Revises: a1c3e5b7d902
+Create Date: 2026-10-19 09:12:04.518233
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f1c2a9b7e30'
+down_revision: Union[str, Sequence[str], None] = 'a1c3e5b7d902'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Bảng có thể đã được tạo bởi create_all với các cột mới
+    inspector = sa.inspect(op.get_bind())
+    if "chat_sessions" not in inspector.get_table_names():
+        return
+    existing = {c["name"] for c in inspector.get_columns("chat_sessions")}
+    if "summary" not in existing:
+        op.add_column('chat_sessions', sa.Column('summary', sa.Text(), nullable=True))
+    if "summary_message_count" not in existing:
+        op.add_column('chat_sessions', sa.Column('summary_message_count', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if "chat_sessions" not in inspector.get_table_names():
+        return
+    existing = {c["name"] for c in inspector.get_columns("chat_sessions")}
+    if "summary_message_count" in existing:
+        op.drop_column('chat_sessions', 'summary_message_count')
+    if "summary" in existing:
+        op.drop_column('chat_sessions', 'summary')
@@ -0,0 +1,61 @@
+"""add_headphone_search_text
+
+Revision ID: 9b3e5d7a1c42
+Revises: 4f1c2a9b7e30
+Create Date: 2026-10-19 14:37:51.902114
+
+"""
+import re
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b3e5d7a1c42'
+down_revision: Union[str, Sequence[str], None] = '4f1c2a9b7e30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _fold(value):
+    # Giống services.product_search.fold_text (migration không import code ứng dụng)
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFD", value.lower().replace("đ", "d")).encode("ascii", "ignore").decode("utf-8")
+    return " ".join(re.findall(r"[a-z0-9]+", value))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    existing = {c["name"] for c in sa.inspect(bind).get_columns("headphones")}
+    if "search_text" not in existing:
+        op.add_column('headphones', sa.Column('search_text', sa.Text(), nullable=True))
+
+    # Backfill cho các sản phẩm hiện có
+    rows = bind.execute(sa.text("""
+        SELECT h.id, h.name, b.name AS brand_name, t.name AS type_name
+        FROM headphones h
+        LEFT JOIN brands b ON b.id = h.brand_id
+        LEFT JOIN types t ON t.id = h.type_id
+    """)).mappings().all()
+    for row in rows:
+        search_text = " ".join(p for p in (_fold(row["name"]), _fold(row["brand_name"]), _fold(row["type_name"])) if p)
+        bind.execute(sa.text("UPDATE headphones SET search_text = :s WHERE id = :id"), {"s": search_text, "id": row["id"]})
+
+    if bind.dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_headphones_search_text_trgm "
+            "ON headphones USING gin (search_text gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_headphones_search_text_trgm")
+    op.drop_column('headphones', 'search_text')
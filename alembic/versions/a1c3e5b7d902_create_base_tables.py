@@ -0,0 +1,109 @@
+"""create_base_tables
+
+Revision ID: a1c3e5b7d902
+Revises: d233571188b8
+Create Date: 2026-10-19 20:41:08.315927
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1c3e5b7d902'
+down_revision: Union[str, Sequence[str], None] = 'd233571188b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Các revision trước để trống (bảng từng do create_all tạo). Migration này tạo schema gốc
+# trên DB mới; các revision sau thêm cột/index/partition. DB cũ đã có bảng thì bỏ qua.
+def _create_brands():
+    op.create_table(
+        'brands',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('slug', sa.String(), nullable=True),
+    )
+    op.create_index('ix_brands_id', 'brands', ['id'])
+    op.create_index('ix_brands_name', 'brands', ['name'], unique=True)
+    op.create_index('ix_brands_slug', 'brands', ['slug'], unique=True)
+
+
+def _create_types():
+    op.create_table(
+        'types',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('slug', sa.String(), nullable=True),
+    )
+    op.create_index('ix_types_id', 'types', ['id'])
+    op.create_index('ix_types_name', 'types', ['name'], unique=True)
+    op.create_index('ix_types_slug', 'types', ['slug'], unique=True)
+
+
+def _create_headphones():
+    op.create_table(
+        'headphones',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('slug', sa.String(), nullable=True),
+        sa.Column('price', sa.Integer(), nullable=True),
+        sa.Column('brand_id', sa.String(), sa.ForeignKey('brands.id'), nullable=True),
+        sa.Column('type_id', sa.String(), sa.ForeignKey('types.id'), nullable=True),
+    )
+    op.create_index('ix_headphones_id', 'headphones', ['id'])
+    op.create_index('ix_headphones_name', 'headphones', ['name'])
+    op.create_index('ix_headphones_slug', 'headphones', ['slug'], unique=True)
+
+
+def _create_chat_sessions():
+    op.create_table(
+        'chat_sessions',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('user_id', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_chat_sessions_id', 'chat_sessions', ['id'])
+    op.create_index('ix_chat_sessions_user_id', 'chat_sessions', ['user_id'])
+
+
+def _create_chat_messages():
+    # Bảng thường; c5d8e2f4a613 chuyển sang partition theo tháng trên PostgreSQL
+    op.create_table(
+        'chat_messages',
+        sa.Column('id', sa.String(), primary_key=True),
+        sa.Column('session_id', sa.String(), sa.ForeignKey('chat_sessions.id'), nullable=False),
+        sa.Column('role', sa.String(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_chat_messages_id', 'chat_messages', ['id'])
+
+
+TABLES = [
+    ("brands", _create_brands),
+    ("types", _create_types),
+    ("headphones", _create_headphones),
+    ("chat_sessions", _create_chat_sessions),
+    ("chat_messages", _create_chat_messages),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    for name, create in TABLES:
+        if name not in existing:
+            create()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    for name, _ in reversed(TABLES):
+        if name in existing:
+            op.drop_table(name)
@@ -0,0 +1,123 @@
+"""partition_chat_messages_by_month
+
+Revision ID: c5d8e2f4a613
+Revises: 9b3e5d7a1c42
+Create Date: 2026-10-19 16:05:12.274519
+
+"""
+from datetime import date, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d8e2f4a613'
+down_revision: Union[str, Sequence[str], None] = '9b3e5d7a1c42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Số tháng tạo sẵn phía trước (job bảo trì services.chat_retention tạo tiếp về sau)
+MONTHS_AHEAD = 3
+
+
+def _add_months(month: date, n: int) -> date:
+    # Giống services.chat_retention.add_months (migration không import code ứng dụng)
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_partition(month: date):
+    name = f"chat_messages_p{month:%Y_%m}"
+    op.execute(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF chat_messages "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = inspector.get_table_names()
+
+    if bind.dialect.name != "postgresql":
+        # SQLite dev: không có partition, chỉ thêm index tra cứu theo session
+        if "chat_messages" in tables:
+            indexes = {i["name"] for i in inspector.get_indexes("chat_messages")}
+            if "ix_chat_messages_session_created" not in indexes:
+                op.create_index('ix_chat_messages_session_created', 'chat_messages', ['session_id', 'created_at'])
+        return
+
+    relkind = bind.execute(sa.text("SELECT relkind FROM pg_class WHERE relname = 'chat_messages'")).scalar()
+    if relkind == "p":
+        return
+
+    # Bảng cũ (do create_all tạo) được đổi tên, copy sang bảng partition rồi xoá
+    if relkind is not None:
+        op.execute("ALTER TABLE chat_messages RENAME TO chat_messages_unpartitioned")
+        op.execute("ALTER INDEX IF EXISTS chat_messages_pkey RENAME TO chat_messages_unpartitioned_pkey")
+        op.execute("ALTER INDEX IF EXISTS ix_chat_messages_id RENAME TO ix_chat_messages_unpartitioned_id")
+
+    # Khoá chính phải chứa cột partition; id vẫn là UUID nên (id, created_at) vẫn duy nhất theo id
+    op.execute("""
+        CREATE TABLE chat_messages (
+            id VARCHAR NOT NULL,
+            session_id VARCHAR NOT NULL REFERENCES chat_sessions (id),
+            role VARCHAR NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("CREATE INDEX ix_chat_messages_session_created ON chat_messages (session_id, created_at)")
+
+    current = datetime.utcnow().date().replace(day=1)
+    first = current
+    if relkind is not None:
+        oldest = bind.execute(sa.text("SELECT min(created_at) FROM chat_messages_unpartitioned")).scalar()
+        if oldest is not None:
+            first = min(first, oldest.date().replace(day=1))
+    month = first
+    while month <= _add_months(current, MONTHS_AHEAD):
+        _create_partition(month)
+        month = _add_months(month, 1)
+    # Tháng chưa có partition (job bảo trì không chạy) rơi vào DEFAULT thay vì làm insert lỗi;
+    # services.chat_retention tách các dòng này ra khi tạo partition của tháng đó
+    op.execute("CREATE TABLE IF NOT EXISTS chat_messages_default PARTITION OF chat_messages DEFAULT")
+
+    if relkind is not None:
+        op.execute(f"""
+            INSERT INTO chat_messages (id, session_id, role, content, created_at)
+            SELECT id, session_id, role, content, COALESCE(created_at, TIMESTAMP '{datetime.utcnow():%Y-%m-%d %H:%M:%S}')
+            FROM chat_messages_unpartitioned
+        """)
+        op.execute("DROP TABLE chat_messages_unpartitioned")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        op.drop_index('ix_chat_messages_session_created', table_name='chat_messages')
+        return
+
+    op.execute("ALTER TABLE chat_messages RENAME TO chat_messages_partitioned")
+    op.execute("ALTER INDEX chat_messages_pkey RENAME TO chat_messages_partitioned_pkey")
+    op.execute("ALTER INDEX ix_chat_messages_session_created RENAME TO ix_chat_messages_partitioned_session_created")
+    op.execute("""
+        CREATE TABLE chat_messages (
+            id VARCHAR NOT NULL PRIMARY KEY,
+            session_id VARCHAR NOT NULL REFERENCES chat_sessions (id),
+            role VARCHAR NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE
+        )
+    """)
+    op.execute("CREATE INDEX ix_chat_messages_id ON chat_messages (id)")
+    op.execute("""
+        INSERT INTO chat_messages (id, session_id, role, content, created_at)
+        SELECT id, session_id, role, content, created_at FROM chat_messages_partitioned
+    """)
+    op.execute("DROP TABLE chat_messages_partitioned")
@@ -0,0 +1,47 @@
+"""add_chat_session_listing_indexes
+
+Revision ID: e7a3f9c2d814
+Revises: c5d8e2f4a613
+Create Date: 2026-10-19 18:12:40.518236
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a3f9c2d814'
+down_revision: Union[str, Sequence[str], None] = 'c5d8e2f4a613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# GET /chat/sessions phân trang keyset theo updated_at (lọc theo user_id hoặc không);
+# job archive cũng quét chat_sessions theo updated_at
+INDEXES = {
+    "ix_chat_sessions_user_updated": ["user_id", "updated_at"],
+    "ix_chat_sessions_updated_at": ["updated_at"],
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if "chat_sessions" not in inspector.get_table_names():
+        return
+    existing = {i["name"] for i in inspector.get_indexes("chat_sessions")}
+    for name, columns in INDEXES.items():
+        if name not in existing:
+            op.create_index(name, 'chat_sessions', columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if "chat_sessions" not in inspector.get_table_names():
+        return
+    existing = {i["name"] for i in inspector.get_indexes("chat_sessions")}
+    for name in INDEXES:
+        if name in existing:
+            op.drop_index(name, table_name='chat_sessions')
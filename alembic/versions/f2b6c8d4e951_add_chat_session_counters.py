@@ -0,0 +1,65 @@
+"""add_chat_session_counters
+
+Revision ID: f2b6c8d4e951
+Revises: e7a3f9c2d814
+Create Date: 2026-10-19 19:03:27.640152
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b6c8d4e951'
+down_revision: Union[str, Sequence[str], None] = 'e7a3f9c2d814'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Giống crud.chat.PREVIEW_CHARS (migration không import code ứng dụng)
+PREVIEW_CHARS = 200
+
+
+def _columns():
+    return [
+        sa.Column('message_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_message_at', sa.DateTime(), nullable=True),
+        sa.Column('last_message_role', sa.String(), nullable=True),
+        sa.Column('last_message_preview', sa.String(), nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "chat_sessions" not in inspector.get_table_names():
+        return
+    existing = {c["name"] for c in inspector.get_columns("chat_sessions")}
+    for column in _columns():
+        if column.name not in existing:
+            op.add_column('chat_sessions', column)
+
+    if "chat_messages" not in inspector.get_table_names():
+        return
+    # Backfill một lần từ chat_messages; về sau crud.chat cập nhật cùng lúc với INSERT tin nhắn
+    last = "SELECT {} FROM chat_messages m WHERE m.session_id = chat_sessions.id ORDER BY m.created_at DESC LIMIT 1"
+    bind.execute(sa.text(f"""
+        UPDATE chat_sessions SET
+            message_count = (SELECT count(*) FROM chat_messages m WHERE m.session_id = chat_sessions.id),
+            last_message_at = ({last.format("m.created_at")}),
+            last_message_role = ({last.format("m.role")}),
+            last_message_preview = ({last.format(f"substr(m.content, 1, {PREVIEW_CHARS})")})
+    """))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if "chat_sessions" not in inspector.get_table_names():
+        return
+    existing = {c["name"] for c in inspector.get_columns("chat_sessions")}
+    for column in reversed(_columns()):
+        if column.name in existing:
+            op.drop_column('chat_sessions', column.name)
@@ -0,0 +1,155 @@
+"""
+Sinh catalog giả lập (brands, types, headphones) với tên Việt/Anh và giá thực tế.
+
+    python -m benchmarks.catalog_generator --products 10000 --out catalog.json
+    python -m benchmarks.catalog_generator --products 10000 --database-url sqlite:///./bench.db
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REAL_BRANDS = [
+    "Sony", "Apple", "Samsung", "JBL", "Bose", "Sennheiser", "Asus", "Beats", "Audio-Technica",
+    "Marshall", "Xiaomi", "Soundpeats", "Anker Soundcore", "HyperX", "Logitech", "Razer",
+    "SteelSeries", "Corsair", "Skullcandy", "Jabra", "Bang & Olufsen", "Shure", "AKG", "Edifier",
+]
+TYPES = [
+    "Bluetooth", "Wireless", "Gaming", "Có dây", "Over-ear", "True Wireless", "Chống ồn",
+    "Thể thao", "Kiểm âm", "Earbuds", "Dẫn truyền xương", "In-ear",
+]
+SERIES = [
+    "WH", "WF", "Buds", "Pro", "Tune", "Live", "QuietComfort", "Momentum", "ROG Delta", "Cloud",
+    "Arctis", "Studio", "Major", "Liberty", "Elite", "Quantum", "Kraken", "FreeBuds", "Redmi Buds",
+]
+SUFFIXES = ["", " Pro", " Max", " Lite", " Plus", " SE", " 2", " 3", " Gen 2", " NC", " X"]
+COLORS = ["", "", " – Đen", " – Trắng", " – Bạc ánh trăng", " – Xanh dương", " – Hồng phấn", " – Đỏ đô", " (Black)", " (Midnight)"]
+VI_PREFIX = ["", "", "", "Tai nghe ", "Tai nghe không dây ", "Tai nghe chụp tai ", "Tai nghe gaming "]
+
+# Khoảng giá (VND) theo loại
+PRICE_RANGES = {
+    "Gaming": (490_000, 9_990_000),
+    "Kiểm âm": (1_990_000, 19_990_000),
+    "Over-ear": (990_000, 13_990_000),
+    "Chống ồn": (1_490_000, 10_990_000),
+}
+DEFAULT_PRICE_RANGE = (190_000, 7_990_000)
+
+
+def generate_catalog(products: int, brands: int = None, types: int = None, seed: int = 42) -> dict:
+    """Sinh catalog dạng dict: {"brands": [...], "types": [...], "headphones": [...]}"""
+    rng = random.Random(seed)
+    n_brands = brands or min(len(REAL_BRANDS) + products // 500, 2000)
+    n_types = types or len(TYPES)
+
+    brand_names = REAL_BRANDS[:n_brands] + [f"Brand {i:04d}" for i in range(max(0, n_brands - len(REAL_BRANDS)))]
+    type_names = TYPES[:n_types] + [f"Loại {i:03d}" for i in range(max(0, n_types - len(TYPES)))]
+
+    headphones = []
+    for i in range(products):
+        brand = rng.choice(brand_names)
+        type_name = rng.choice(type_names)
+        model = f"{rng.choice(SERIES)} {rng.randint(1, 9999)}{rng.choice(SUFFIXES)}"
+        # Số thứ tự ở cuối giữ tên luôn unique (create_headphone yêu cầu tên unique)
+        name = f"{rng.choice(VI_PREFIX)}{brand} {model}{rng.choice(COLORS)} #{i}"
+        low, high = PRICE_RANGES.get(type_name, DEFAULT_PRICE_RANGE)
+        price = rng.randrange(low, high, 10_000)
+        headphones.append({"name": name, "price": price, "brand_name": brand, "type_name": type_name})
+
+    return {
+        "brands": [{"name": n} for n in brand_names],
+        "types": [{"name": n} for n in type_names],
+        "headphones": headphones,
+    }
+
+
+def seed_database(db, catalog: dict, batch_size: int = 5000) -> dict:
+    """Ghi catalog vào DB bằng bulk insert (không qua CRUD từng item).
+
+    Trả về số lượng bản ghi đã tạo theo từng bảng.
+    """
+    import uuid
+    import models
+    from crud.headphone import create_slug_from_name
+    from services.product_search import build_search_text
+
+    def unique_slugs(names):
+        seen = {}
+        for name in names:
+            base = create_slug_from_name(name) or "item"
+            count = seen.get(base, 0)
+            seen[base] = count + 1
+            yield base if count == 0 else f"{base}-{count}"
+
+    brand_rows = [
+        {"id": str(uuid.uuid4()), "name": b["name"], "slug": slug}
+        for b, slug in zip(catalog["brands"], unique_slugs(b["name"] for b in catalog["brands"]))
+    ]
+    type_rows = [
+        {"id": str(uuid.uuid4()), "name": t["name"], "slug": slug}
+        for t, slug in zip(catalog["types"], unique_slugs(t["name"] for t in catalog["types"]))
+    ]
+    brand_ids = {r["name"]: r["id"] for r in brand_rows}
+    type_ids = {r["name"]: r["id"] for r in type_rows}
+
+    db.bulk_insert_mappings(models.Brand, brand_rows)
+    db.bulk_insert_mappings(models.Type, type_rows)
+
+    items = catalog["headphones"]
+    slugs = unique_slugs(h["name"] for h in items)
+    for start in range(0, len(items), batch_size):
+        batch = []
+        for h in items[start:start + batch_size]:
+            batch.append({
+                "id": str(uuid.uuid4()),
+                "name": h["name"],
+                "slug": next(slugs),
+                "price": h["price"],
+                "brand_id": brand_ids.get(h["brand_name"]),
+                "type_id": type_ids.get(h["type_name"]),
+                "search_text": build_search_text(h["name"], h["brand_name"], h["type_name"]),
+            })
+        db.bulk_insert_mappings(models.Headphone, batch)
+    db.commit()
+    return {"brands": len(brand_rows), "types": len(type_rows), "headphones": len(items)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh catalog tai nghe giả lập")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--brands", type=int)
+    parser.add_argument("--types", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Ghi catalog ra file JSON")
+    parser.add_argument("--database-url", help="Seed trực tiếp vào database (tạo bảng nếu chưa có)")
+    args = parser.parse_args()
+
+    catalog = generate_catalog(args.products, args.brands, args.types, args.seed)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(catalog, f, ensure_ascii=False)
+        print(f"Đã ghi {len(catalog['headphones'])} sản phẩm vào {args.out}")
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+        sys.path.insert(0, ROOT)
+        from database import Base, SessionLocal, engine
+        import models  # noqa: F401 (đăng ký bảng trước create_all)
+
+        Base.metadata.create_all(bind=engine)
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            counts = seed_database(db, catalog)
+            print(f"Đã seed {counts} trong {time.perf_counter() - started:.2f}s")
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
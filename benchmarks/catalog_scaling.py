@@ -0,0 +1,146 @@
+"""
+Benchmark khả năng mở rộng theo kích thước catalog.
+
+    python -m benchmarks.catalog_scaling                       # 1k, 10k, 100k trên SQLite tạm
+    python -m benchmarks.catalog_scaling --sizes 1000,10000 --max-import 2000
+
+Với mỗi kích thước, một process con tạo database mới, seed catalog bằng bulk
+insert rồi đo:
+- GET /headphones/ và GET /chat/db-info (thời gian, kích thước response)
+- get_db_context: thời gian dựng và độ dài context (~token)
+- create_headphones_bulk: import N sản phẩm mới qua CRUD (N <= --max-import)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stats import format_table
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _timed(fn, repeat: int = 3):
+    """(kết quả, thời gian tốt nhất tính bằng ms)"""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def run_single(size: int, database_url: str, max_import: int, repeat: int) -> dict:
+    """Chạy trong process con: DATABASE_URL phải được đặt trước khi import app"""
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, ROOT)
+    from fastapi.testclient import TestClient
+    from database import Base, SessionLocal, engine
+    import models  # noqa: F401 (đăng ký bảng trước create_all)
+    from benchmarks.catalog_generator import generate_catalog, seed_database
+
+    Base.metadata.create_all(bind=engine)
+    result = {"size": size}
+
+    catalog = generate_catalog(size)
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        seed_database(db, catalog)
+        result["seed_s"] = time.perf_counter() - started
+    finally:
+        db.close()
+
+    from main import app
+    from routers.chatbot import get_db_context
+
+    client = TestClient(app)
+    resp, result["headphones_ms"] = _timed(lambda: client.get("/headphones/"), repeat)
+    result["headphones_kb"] = len(resp.content) / 1024
+    resp, result["db_info_ms"] = _timed(lambda: client.get("/chat/db-info"), repeat)
+    result["db_info_kb"] = len(resp.content) / 1024
+
+    db = SessionLocal()
+    try:
+        context, result["context_ms"] = _timed(lambda: get_db_context(db), repeat)
+        result["context_chars"] = len(context)
+        result["context_tokens"] = len(context) // 4  # ước lượng ~4 ký tự / token
+    finally:
+        db.close()
+
+    import_n = min(size, max_import)
+    if import_n:
+        from crud.headphone import create_headphones_bulk
+        from schemas.headphone import HeadphoneCreate
+
+        extra = generate_catalog(import_n, seed=size + 1)["headphones"]
+        brand_slugs = [b["name"] for b in catalog["brands"]]
+        type_slugs = [t["name"] for t in catalog["types"]]
+        items = [
+            HeadphoneCreate(
+                name=f"Import {h['name']}",
+                price=h["price"],
+                brand_slug=brand_slugs[i % len(brand_slugs)],
+                type_slug=type_slugs[i % len(type_slugs)],
+            )
+            for i, h in enumerate(extra)
+        ]
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            created, errors = create_headphones_bulk(db, items)
+            result["bulk_import_n"] = len(created)
+            result["bulk_import_s"] = time.perf_counter() - started
+            result["bulk_import_errors"] = len(errors)
+        finally:
+            db.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark theo kích thước catalog")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--max-import", type=int, default=10000, help="Giới hạn số item import qua CRUD")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--database-url", help="Database trống dùng cho MỖI kích thước (mặc định SQLite tạm)")
+    parser.add_argument("--json-out")
+    parser.add_argument("--single-size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single_size:
+        result = run_single(args.single_size, args.database_url, args.max_import, args.repeat)
+        print("RESULT " + json.dumps(result))
+        return
+
+    tmpdir = tempfile.mkdtemp(prefix="chatbot-catalog-")
+    results = []
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmpdir, f'catalog_{size}.db')}"
+        print(f"Catalog {size:,} sản phẩm...")
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.catalog_scaling", "--single-size", str(size),
+             "--database-url", database_url, "--max-import", str(args.max_import), "--repeat", str(args.repeat)],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("RESULT ")]
+        if proc.returncode != 0 or not lines:
+            print(proc.stderr[-2000:])
+            results.append({"size": size, "error": f"exit {proc.returncode}"})
+            continue
+        results.append(json.loads(lines[-1][len("RESULT "):]))
+
+    columns = ["size", "seed_s", "headphones_ms", "headphones_kb", "db_info_ms", "context_ms",
+               "context_tokens", "bulk_import_n", "bulk_import_s"]
+    print()
+    print(format_table(results, columns))
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Fake OpenAI-compatible model server cho load test (không cần GPU).
+
+Chạy:
+    FAKE_MODEL_TTFB=0.2 FAKE_MODEL_TPS=40 uvicorn benchmarks.fake_model_server:app --port 9100
+
+Environment variables:
+- `FAKE_MODEL_TTFB`: độ trễ trước token đầu tiên (giây, default 0.2)
+- `FAKE_MODEL_TPS`: tốc độ sinh token (tokens/giây, default 50)
+- `FAKE_MODEL_COMPLETION_TOKENS`: số token cho câu trả lời chat thường (default 120)
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="Fake OpenAI-compatible model")
+
+TTFB = float(os.getenv("FAKE_MODEL_TTFB", "0.2"))
+TOKENS_PER_SECOND = float(os.getenv("FAKE_MODEL_TPS", "50"))
+COMPLETION_TOKENS = int(os.getenv("FAKE_MODEL_COMPLETION_TOKENS", "120"))
+
+CHAT_WORDS = (
+    "Dạ, với nhu cầu của anh/chị em gợi ý Sony WH-1000XM5 chống ồn rất tốt, "
+    "pin 30 giờ, hoặc JBL Tune 760NC giá mềm hơn. Nếu chơi game thì Asus ROG Delta S "
+    "có micro rõ và độ trễ thấp. "
+).split()
+
+# Sau JSON, model thật hay viết thêm giải thích -> client phải tự dừng stream
+CRUD_REPLY = '{"action": "read", "resource": "brand", "id": null}'
+CRUD_TRAILER = " Giải thích: yêu cầu này liệt kê toàn bộ thương hiệu trong cửa hàng." * 5
+
+
+def _prompt_text(body: dict) -> str:
+    return "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+
+
+def _completion_tokens(body: dict) -> list:
+    """Danh sách 'token' trả về tuỳ theo loại request"""
+    text = _prompt_text(body)
+    max_tokens = int(body.get("max_tokens") or COMPLETION_TOKENS)
+    if "response_format" in body or "grammar" in body or "JSON" in text:
+        tokens = [c + " " for c in CRUD_REPLY.split(" ")] + [w + " " for w in CRUD_TRAILER.split()]
+    else:
+        tokens = [CHAT_WORDS[i % len(CHAT_WORDS)] + " " for i in range(COMPLETION_TOKENS)]
+    return tokens[:max_tokens]
+
+
+def _usage(body: dict, completion: int) -> dict:
+    prompt = max(1, len(_prompt_text(body)) // 4)  # ~4 ký tự / token
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "fake-model", "object": "model"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    tokens = _completion_tokens(body)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    model = body.get("model", "fake-model")
+
+    if not body.get("stream"):
+        await asyncio.sleep(TTFB + len(tokens) / TOKENS_PER_SECOND)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens).strip()}, "finish_reason": "stop"}],
+            "usage": _usage(body, len(tokens)),
+        }
+
+    async def events():
+        await asyncio.sleep(TTFB)
+        for token in tokens:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(1 / TOKENS_PER_SECOND)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {json.dumps({'id': completion_id, 'choices': [], 'usage': _usage(body, len(tokens))})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
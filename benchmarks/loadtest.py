@@ -0,0 +1,261 @@
+"""
+End-to-end load test: fake model server + database local + FastAPI app.
+
+Ví dụ:
+    python -m benchmarks.loadtest --concurrency 16 --requests 400
+    python -m benchmarks.loadtest --database-url postgresql://localhost/chatbot_bench --workers 4 \\
+        --model-ttfb 0.5 --model-tps 30 --json-out out.json
+
+Mặc định dùng SQLite trong thư mục tạm, fake model ở cổng 9100 và app ở cổng 9000.
+Báo cáo throughput, p50/p95/p99 cho từng kịch bản và thời gian từng stage
+(đọc từ header Server-Timing).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.stats import format_table, parse_server_timing, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHAT_MESSAGES = [
+    "Tư vấn cho mình tai nghe chống ồn dưới 5 triệu",
+    "Mình cần tai nghe gaming có mic tốt",
+    "Recommend me wireless headphones for music under $200",
+    "Tai nghe nào phù hợp để làm việc ở văn phòng?",
+    "So sánh giúp mình Sony và Bose",
+    "I want something good for running",
+]
+CRUD_MESSAGES = [
+    "xem danh sách thương hiệu",
+    "list all brands",
+    "show types",
+    "xem danh sách tai nghe",
+]
+
+DEFAULT_BRANDS = ["Sony", "Apple", "Samsung", "JBL", "Bose", "Sennheiser", "Asus", "Beats"]
+DEFAULT_TYPES = ["Bluetooth", "Wireless", "Gaming", "Wired", "Over-ear"]
+
+
+def prepare_database(database_url: str, catalog_size: int):
+    """Tạo schema và seed catalog nhỏ nếu database còn trống"""
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, ROOT)
+    from database import Base, engine, SessionLocal
+    import models
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(models.Brand).count():
+            return
+        brands = [models.Brand(name=n, slug=n.lower()) for n in DEFAULT_BRANDS]
+        types = [models.Type(name=n, slug=n.lower()) for n in DEFAULT_TYPES]
+        db.add_all(brands + types)
+        db.flush()
+        rng = random.Random(42)
+        for i in range(catalog_size):
+            brand = brands[i % len(brands)]
+            db.add(models.Headphone(
+                name=f"{brand.name} Model {i:04d}",
+                slug=f"{brand.slug}-model-{i:04d}",
+                price=rng.randrange(300_000, 15_000_000, 10_000),
+                brand_id=brand.id,
+                type_id=types[i % len(types)].id,
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def start_process(args: list, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", *args, "--log-level", "warning"],
+        cwd=ROOT,
+        env={**os.environ, **env},
+    )
+
+
+def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Service không sẵn sàng: {url}")
+
+
+def parse_mix(mix: str) -> list:
+    """`chat=6,headphones=3,crud=1` -> danh sách kịch bản theo trọng số"""
+    weighted = []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weighted += [name.strip()] * int(weight or 1)
+    return weighted
+
+
+async def run_load(base_url: str, total: int, concurrency: int, mix: list, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    plan = [rng.choice(mix) for _ in range(total)]
+    queue = asyncio.Queue()
+    for i, scenario in enumerate(plan):
+        queue.put_nowait((i, scenario))
+    results = []
+
+    async def worker(worker_id: int):
+        session_id = None  # Mỗi virtual user giữ một phiên chat
+        async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+            while not queue.empty():
+                i, scenario = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    if scenario == "headphones":
+                        resp = await client.get("/headphones/")
+                    else:
+                        messages = CRUD_MESSAGES if scenario == "crud" else CHAT_MESSAGES
+                        payload = {"message": messages[i % len(messages)], "session_id": session_id}
+                        resp = await client.post("/chat/", json=payload)
+                        if resp.status_code == 200 and scenario == "chat":
+                            session_id = resp.json().get("session_id") or session_id
+                    status = resp.status_code
+                    stages = parse_server_timing(resp.headers.get("server-timing", ""))
+                except httpx.HTTPError as e:
+                    status, stages = f"error:{type(e).__name__}", {}
+                results.append({
+                    "scenario": scenario,
+                    "status": status,
+                    "latency_ms": (time.perf_counter() - started) * 1000,
+                    "stages": stages,
+                })
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    for r in results:
+        r["elapsed_s"] = elapsed
+    return results
+
+
+def build_report(results: list) -> dict:
+    elapsed = results[0]["elapsed_s"] if results else 0
+    by_scenario = defaultdict(list)
+    for r in results:
+        by_scenario[r["scenario"]].append(r)
+    by_scenario["all"] = results
+
+    report = {"elapsed_s": elapsed, "scenarios": {}}
+    for scenario, rows in by_scenario.items():
+        latencies = [r["latency_ms"] for r in rows]
+        stages = defaultdict(list)
+        for r in rows:
+            for name, dur in r["stages"].items():
+                stages[name].append(dur)
+        report["scenarios"][scenario] = {
+            "requests": len(rows),
+            "errors": sum(1 for r in rows if r["status"] != 200),
+            "throughput_rps": len(rows) / elapsed if elapsed else 0.0,
+            "latency_ms": summarize(latencies),
+            "stages_ms": {name: summarize(values) for name, values in stages.items()},
+        }
+    return report
+
+
+def print_report(report: dict):
+    rows = []
+    for scenario, data in report["scenarios"].items():
+        lat = data["latency_ms"]
+        rows.append({
+            "scenario": scenario, "requests": data["requests"], "errors": data["errors"],
+            "rps": data["throughput_rps"], "p50": lat["p50"], "p95": lat["p95"], "p99": lat["p99"], "max": lat["max"],
+        })
+    print(f"\nTổng thời gian: {report['elapsed_s']:.1f}s\n")
+    print(format_table(rows, ["scenario", "requests", "errors", "rps", "p50", "p95", "p99", "max"]))
+
+    stage_rows = []
+    for scenario, data in report["scenarios"].items():
+        if scenario == "all":
+            continue
+        for name, s in data["stages_ms"].items():
+            stage_rows.append({"scenario": scenario, "stage": name, "mean": s["mean"], "p50": s["p50"], "p95": s["p95"], "p99": s["p99"]})
+    if stage_rows:
+        print("\nStage breakdown (ms, từ Server-Timing):\n")
+        print(format_table(stage_rows, ["scenario", "stage", "mean", "p50", "p95", "p99"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test chatbot với fake model server")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", default="chat=6,headphones=3,crud=1", help="Trọng số kịch bản")
+    parser.add_argument("--database-url", help="Mặc định: SQLite trong thư mục tạm")
+    parser.add_argument("--catalog-size", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=1, help="Số uvicorn worker của app")
+    parser.add_argument("--app-port", type=int, default=9000)
+    parser.add_argument("--model-port", type=int, default=9100)
+    parser.add_argument("--model-ttfb", type=float, default=0.2)
+    parser.add_argument("--model-tps", type=float, default=50)
+    parser.add_argument("--model-tokens", type=int, default=120)
+    parser.add_argument("--app-url", help="Dùng app đang chạy sẵn thay vì tự khởi động")
+    parser.add_argument("--json-out", help="Ghi báo cáo JSON ra file")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="chatbot-loadtest-")
+    database_url = args.database_url or f"sqlite:///{os.path.join(tmpdir, 'loadtest.db')}"
+    processes = []
+    try:
+        base_url = args.app_url
+        if not base_url:
+            prepare_database(database_url, args.catalog_size)
+            processes.append(start_process(
+                ["benchmarks.fake_model_server:app", "--port", str(args.model_port)],
+                {
+                    "FAKE_MODEL_TTFB": str(args.model_ttfb),
+                    "FAKE_MODEL_TPS": str(args.model_tps),
+                    "FAKE_MODEL_COMPLETION_TOKENS": str(args.model_tokens),
+                },
+            ))
+            processes.append(start_process(
+                ["main:app", "--port", str(args.app_port), "--workers", str(args.workers)],
+                {
+                    "DATABASE_URL": database_url,
+                    "AI_API_URL": f"http://127.0.0.1:{args.model_port}/v1/chat/completions",
+                    "AI_MODEL": "fake-model",
+                },
+            ))
+            wait_ready(f"http://127.0.0.1:{args.model_port}/v1/models")
+            base_url = f"http://127.0.0.1:{args.app_port}"
+            wait_ready(f"{base_url}/")
+
+        print(f"Load test {args.requests} requests, concurrency {args.concurrency}, mix {args.mix} -> {base_url}")
+        results = asyncio.run(run_load(base_url, args.requests, args.concurrency, parse_mix(args.mix)))
+        report = build_report(results)
+        print_report(report)
+        if args.json_out:
+            with open(args.json_out, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\nĐã ghi báo cáo: {args.json_out}")
+    finally:
+        # Dừng app trước fake model để background task (summary) không lỗi kết nối
+        for proc in reversed(processes):
+            proc.terminate()
+        for proc in processes:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Microbenchmark cho các hàm thuần trên hot path của chat.
+
+    python -m benchmarks.microbench                 # chạy và so sánh với baseline
+    python -m benchmarks.microbench --save          # ghi lại baseline
+    python -m benchmarks.microbench --filter catalog --max-size 10000
+
+Baseline lưu ở benchmarks/baseline_micro.json (commit cùng thay đổi hiệu năng để
+reviewer thấy được chênh lệch). Exit code 1 nếu có benchmark chậm hơn baseline
+quá ngưỡng `--threshold`.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# crud.* import database -> cần DATABASE_URL; benchmark không chạm tới DB
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_micro.json")
+CATALOG_SIZES = (10, 100, 1_000, 10_000, 100_000)
+
+MESSAGES = [
+    "Tư vấn cho mình tai nghe chống ồn dưới 2 triệu để nghe nhạc",
+    "xem danh sách thương hiệu",
+    "Thêm tai nghe Sony WH-1000XM5 giá 8990000",
+    "Recommend me wireless headphones for gaming under $100",
+    "Xin chào, cửa hàng mở cửa mấy giờ?",
+    "so sánh AirPods Pro 2 và Galaxy Buds 3 Pro giúp mình",
+    "xóa brand 3f2b8c1e-9d4a-4c55-a0f1-2b7e5d9c1a00",
+    "I need something comfortable for long work calls",
+]
+
+PRODUCT_NAMES = [
+    "Tai nghe Sony WH-1000XM5 chống ồn – Đen",
+    "Apple AirPods Pro 2 (USB-C)",
+    "Samsung Galaxy Buds 3 Pro   Bạc ánh trăng",
+    "JBL Tune 760NC — Xanh dương",
+    "Tai nghe chơi game Asus ROG Delta S Animate",
+    "Sennheiser Momentum 4 Wireless_Trắng",
+]
+
+CRUD_REPLY = """```json
+{
+  "action": "create_bulk",
+  "resource": "headphone",
+  "items": [
+    {"name": "Sony WH-1000XM5", "price": 8990000, "brand_slug": "sony", "type_slug": "bluetooth"},
+    {"name": "Sony WF-1000XM5", "price": 6990000, "brand_slug": "sony", "type_slug": "bluetooth"},
+    {"name": "Sony LinkBuds S \\"Đen\\" {bản 2024}", "price": 4490000, "brand_slug": "sony", "type_slug": "bluetooth"},
+  ]
+}
+```
+Giải thích: mình đã tạo 3 mẫu tai nghe Sony bluetooth phổ biến nhất hiện nay, giá theo thị trường Việt Nam.
+"""
+
+BRAND_NAMES = ["Sony", "Apple", "Samsung", "JBL", "Bose", "Sennheiser", "Asus", "Beats", "Audio-Technica", "Marshall"]
+TYPE_NAMES = ["Bluetooth", "Wireless", "Gaming", "Wired", "Over-ear", "True Wireless"]
+
+_benchmarks = []
+
+
+def bench(name: str, sizes=None):
+    """Đăng ký benchmark. Hàm nhận `size` (nếu có) và trả về callable cần đo."""
+    def decorator(setup):
+        _benchmarks.append((name, setup, sizes))
+        return setup
+    return decorator
+
+
+def make_catalog(size: int, seed: int = 7):
+    """Catalog giả lập (object giống ORM) để dựng context không cần DB"""
+    rng = random.Random(seed)
+    brands = [SimpleNamespace(name=n) for n in BRAND_NAMES]
+    types = [SimpleNamespace(name=n) for n in TYPE_NAMES]
+    headphones = [
+        SimpleNamespace(
+            id=f"id-{i}",
+            name=f"{rng.choice(PRODUCT_NAMES)} #{i}",
+            price=rng.choice([None, rng.randrange(300_000, 15_000_000, 10_000)]),
+            brand=rng.choice(brands + [None]),
+            type=rng.choice(types),
+        )
+        for i in range(size)
+    ]
+    return brands, types, headphones
+
+
+@bench("detect_intent")
+def bench_detect_intent():
+    from services.headphone_prompts import detect_intent
+    return lambda: [detect_intent(m) for m in MESSAGES]
+
+
+@bench("create_slug_from_name")
+def bench_create_slug():
+    from crud.headphone import create_slug_from_name
+    return lambda: [create_slug_from_name(n) for n in PRODUCT_NAMES]
+
+
+@bench("crud_json_extract")
+def bench_json_extract():
+    from services.json_stream import extract_json_object, parse_json_object
+    return lambda: parse_json_object(extract_json_object(CRUD_REPLY).result)
+
+
+@bench("crud_json_stream_feed")
+def bench_json_stream():
+    from services.json_stream import JSONObjectExtractor
+    chunks = [CRUD_REPLY[i:i + 4] for i in range(0, len(CRUD_REPLY), 4)]
+
+    def run():
+        extractor = JSONObjectExtractor()
+        for chunk in chunks:
+            if extractor.feed(chunk):
+                break
+        return extractor.result
+    return run
+
+
+@bench("fallback_products")
+def bench_fallback_products():
+    from services.web_search import WebSearchClient
+    client = WebSearchClient(api_key="")
+    pairs = [("Sony", "gaming"), ("Apple", "bluetooth"), ("JBL", "wireless"), ("Unknown", "bluetooth")]
+    return lambda: [client._get_fallback_products(b, t, 3) for b, t in pairs]
+
+
+@bench("catalog_context", sizes=CATALOG_SIZES)
+def bench_catalog_context(size: int):
+    from services.catalog_context import build_catalog_context
+    brands, types, headphones = make_catalog(size)
+    return lambda: build_catalog_context(brands, types, headphones)
+
+
+def measure(fn, min_time: float) -> float:
+    """Thời gian tốt nhất cho một lần gọi (µs)"""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=5, number=number)) / number
+    return best * 1e6
+
+
+def run(filter_text: str, max_size: int, min_time: float) -> dict:
+    results = {}
+    for name, setup, sizes in _benchmarks:
+        for size in sizes or (None,):
+            if size is not None and size > max_size:
+                continue
+            key = name if size is None else f"{name}[{size}]"
+            if filter_text and filter_text not in key:
+                continue
+            fn = setup(size) if size is not None else setup()
+            results[key] = round(measure(fn, min_time), 3)
+            print(f"{key:<32} {results[key]:>14,.3f} µs/call")
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    regressions = []
+    print(f"\n{'benchmark':<32} {'baseline µs':>14} {'now µs':>14} {'ratio':>8}")
+    for key, now in results.items():
+        before = baseline.get(key)
+        if not before:
+            print(f"{key:<32} {'-':>14} {now:>14,.3f} {'new':>8}")
+            continue
+        ratio = now / before
+        flag = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{key:<32} {before:>14,.3f} {now:>14,.3f} {ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append(key)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark chậm hơn baseline > {threshold:.0%}: {', '.join(regressions)}")
+    return not regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark hot-path functions")
+    parser.add_argument("--save", action="store_true", help="Ghi kết quả làm baseline mới")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--filter", default="", help="Chỉ chạy benchmark có tên chứa chuỗi này")
+    parser.add_argument("--max-size", type=int, default=max(CATALOG_SIZES))
+    parser.add_argument("--min-time", type=float, default=0.2, help="Thời gian tối thiểu mỗi lượt đo (giây)")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Tỉ lệ chậm hơn coi là regression")
+    args = parser.parse_args()
+
+    results = run(args.filter, args.max_size, args.min_time)
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f).get("results", {})
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "results": dict(sorted(baseline.items())),
+            }, f, indent=2)
+            f.write("\n")
+        print(f"\nĐã lưu baseline: {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+        if not compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Replay traffic chat đã ghi (TRAFFIC_CAPTURE_DIR) lên một instance và so sánh latency.
+
+    python -m benchmarks.replay capture/*.ndjson --target http://127.0.0.1:8000 --json-out run_a.json
+    python -m benchmarks.replay capture/*.ndjson --target http://staging:8000 --speed 4 --json-out run_b.json
+    python -m benchmarks.replay --compare run_a.json run_b.json
+
+`--speed 1` giữ nguyên nhịp gửi gốc, `--speed 4` nhanh gấp 4 lần, `--speed 0` gửi
+liên tục (chỉ giới hạn bởi `--concurrency`). Các lượt trong cùng một phiên luôn được
+gửi tuần tự và dùng chung session_id mới trên target để giữ nguyên history.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Optional
+
+import httpx
+
+from benchmarks.stats import format_table, parse_server_timing, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.traffic_capture import read_capture  # noqa: E402
+
+
+def _next_session_id(resp: httpx.Response, current: Optional[str]) -> Optional[str]:
+    """session_id cho lượt tiếp theo của chain.
+
+    Lượt CRUD trả về session_id=None (hoặc body không phải JSON object) thì giữ
+    session hiện tại, để các lượt sau vẫn chạy trên cùng history thay vì tạo session mới.
+    """
+    try:
+        body = resp.json()
+    except ValueError:
+        return current
+    if isinstance(body, dict) and body.get("session_id"):
+        return body["session_id"]
+    return current
+
+
+async def replay(entries: list, target: str, speed: float, concurrency: int, limit: int = 0) -> list:
+    if limit:
+        entries = entries[:limit]
+    if not entries:
+        return []
+    origin = entries[0]["ts"]
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    # Gom theo phiên; request không có session chạy độc lập
+    chains = defaultdict(list)
+    for i, entry in enumerate(entries):
+        chains[entry.get("session") or f"single-{i}"].append(entry)
+
+    async with httpx.AsyncClient(base_url=target, timeout=300.0) as client:
+        started = time.perf_counter()
+
+        async def run_chain(chain: list):
+            session_id = None
+            for entry in chain:
+                if speed > 0:
+                    delay = (entry["ts"] - origin) / speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                async with semaphore:
+                    sent = time.perf_counter()
+                    try:
+                        resp = await client.post("/chat/", json={"message": entry["message"], "session_id": session_id})
+                        status = resp.status_code
+                        stages = parse_server_timing(resp.headers.get("server-timing", ""))
+                        if status == 200:
+                            session_id = _next_session_id(resp, session_id)
+                    except httpx.HTTPError as e:
+                        status, stages = f"error:{type(e).__name__}", {}
+                    results.append({
+                        "intent": entry.get("intent") or "unknown",
+                        "status": status,
+                        "latency_ms": (time.perf_counter() - sent) * 1000,
+                        "recorded_ms": entry.get("latency_ms"),
+                        "lag_ms": max(0.0, (sent - started) - (entry["ts"] - origin) / speed) * 1000 if speed > 0 else 0.0,
+                        "stages": stages,
+                    })
+
+        await asyncio.gather(*(run_chain(chain) for chain in chains.values()))
+        elapsed = time.perf_counter() - started
+
+    for r in results:
+        r["elapsed_s"] = elapsed
+    return results
+
+
+def build_report(results: list, target: str = None, speed: float = None) -> dict:
+    elapsed = results[0]["elapsed_s"] if results else 0
+    groups = defaultdict(list)
+    for r in results:
+        groups[r["intent"]].append(r)
+    groups["all"] = results
+
+    report = {"target": target, "speed": speed, "elapsed_s": elapsed, "intents": {}}
+    for intent, rows in groups.items():
+        recorded = [r["recorded_ms"] for r in rows if r.get("recorded_ms") is not None]
+        stages = defaultdict(list)
+        for r in rows:
+            for name, dur in r["stages"].items():
+                stages[name].append(dur)
+        report["intents"][intent] = {
+            "requests": len(rows),
+            "errors": sum(1 for r in rows if r["status"] != 200),
+            "throughput_rps": len(rows) / elapsed if elapsed else 0.0,
+            "latency_ms": summarize([r["latency_ms"] for r in rows]),
+            "recorded_ms": summarize(recorded),
+            "schedule_lag_ms": summarize([r["lag_ms"] for r in rows]),
+            "stages_ms": {name: summarize(values) for name, values in stages.items()},
+        }
+    return report
+
+
+def print_report(report: dict):
+    rows = []
+    for intent, data in report["intents"].items():
+        lat, rec = data["latency_ms"], data["recorded_ms"]
+        rows.append({
+            "intent": intent, "requests": data["requests"], "errors": data["errors"],
+            "p50": lat["p50"], "p95": lat["p95"], "p99": lat["p99"],
+            "rec_p50": rec["p50"], "rec_p95": rec["p95"], "lag_p95": data["schedule_lag_ms"]["p95"],
+        })
+    print(f"\nReplay xong trong {report['elapsed_s']:.1f}s (latency ms; rec_* = latency lúc ghi)\n")
+    print(format_table(rows, ["intent", "requests", "errors", "p50", "p95", "p99", "rec_p50", "rec_p95", "lag_p95"]))
+
+
+def compare_reports(before: dict, after: dict) -> str:
+    """So sánh phân bố latency giữa hai lần replay theo từng intent"""
+    rows = []
+    for intent in sorted(set(before["intents"]) | set(after["intents"])):
+        a = before["intents"].get(intent, {}).get("latency_ms")
+        b = after["intents"].get(intent, {}).get("latency_ms")
+        row = {"intent": intent}
+        for pct in ("p50", "p95", "p99"):
+            row[f"{pct}_a"] = a[pct] if a else None
+            row[f"{pct}_b"] = b[pct] if b else None
+            if a and b and a[pct]:
+                row[f"{pct}_delta"] = f"{(b[pct] - a[pct]) / a[pct]:+.0%}"
+        rows.append(row)
+    columns = ["intent"] + [f"{p}_{s}" for p in ("p50", "p95", "p99") for s in ("a", "b", "delta")]
+    return format_table(rows, columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay traffic chat đã ghi")
+    parser.add_argument("files", nargs="*", help="File NDJSON (hỗ trợ glob)")
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = nhịp gốc, 2 = nhanh gấp đôi, 0 = liên tục")
+    parser.add_argument("--concurrency", type=int, default=64, help="Số request đồng thời tối đa")
+    parser.add_argument("--limit", type=int, default=0, help="Chỉ replay N request đầu")
+    parser.add_argument("--json-out", help="Ghi báo cáo JSON ra file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="So sánh hai báo cáo JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            before = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f:
+            after = json.load(f)
+        print(f"A = {args.compare[0]}, B = {args.compare[1]}\n")
+        print(compare_reports(before, after))
+        return
+
+    paths = sorted({p for pattern in args.files for p in glob.glob(pattern)})
+    if not paths:
+        parser.error("Không tìm thấy file capture nào")
+    entries = read_capture(paths)
+    print(f"Replay {len(entries)} request từ {len(paths)} file -> {args.target} (speed {args.speed})")
+
+    results = asyncio.run(replay(entries, args.target, args.speed, args.concurrency, args.limit))
+    report = build_report(results, args.target, args.speed)
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nĐã ghi báo cáo: {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 import models
+from services.catalog_bus import mark_catalog_changed
 from schemas import brand as schemas
 import re
 
@@ -58,6 +59,7 @@ def create_brand(db: Session, brand: schemas.BrandCreate):
     )
     
     db.add(db_brand)
+    mark_catalog_changed(db, "brand")
     db.commit()
     db.refresh(db_brand)
     return db_brand
@@ -82,6 +84,12 @@ def update_brand(db: Session, brand_id: str, brand_update: schemas.BrandUpdate):
         db_brand.slug = unique_slug
         print(f"Cập nhật brand '{brand_update.name}' với slug mới: '{unique_slug}'")
     
+    if db.is_modified(db_brand):
+        # Tên brand nằm trong nội dung tìm kiếm của các tai nghe thuộc brand này
+        from crud.headphone import refresh_search_text
+        refresh_search_text(db, brand_id=brand_id)
+    
+    mark_catalog_changed(db, "brand")
     db.commit()
     db.refresh(db_brand)
     return db_brand
@@ -117,6 +125,7 @@ def create_brands_bulk(db: Session, brands: list[schemas.BrandCreate]):
             errors.append(f"Lỗi tạo brand '{brand.name}': {str(e)}")
     
     if created_brands:
+        mark_catalog_changed(db, "brand")
         db.commit()
         for brand in created_brands:
             db.refresh(brand)
@@ -129,6 +138,7 @@ def delete_brand(db: Session, brand_id: str):
         raise ValueError(f"Brand với ID '{brand_id}' không tồn tại")
 
     db.delete(db_brand)
+    mark_catalog_changed(db, "brand")
     db.commit()
     print(f"Đã xóa brand với ID: '{brand_id}'")
     return db_brand
\ No newline at end of file
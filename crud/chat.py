@@ -1,7 +1,19 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import and_, bindparam, desc, insert, or_, update
+from datetime import datetime
+import uuid
 import models
 from schemas import chat as schemas
+from services.session_store import CachedSession, RECENT_LIMIT, get_session_store, make_state
+
+
+def _cache(method: str, *args):
+    """Gọi session store; lỗi store (vd. Redis mất kết nối) không làm hỏng request, chỉ đọc SQL"""
+    try:
+        return getattr(get_session_store(), method)(*args)
+    except Exception as e:
+        print(f"Session store error ({method}): {e}")
+        return None
 
 
 def create_session(db: Session, user_id: str = None):
@@ -10,16 +22,65 @@ def create_session(db: Session, user_id: str = None):
     db.add(db_session)
     db.commit()
     db.refresh(db_session)
+    _cache("set", db_session.id, make_state(db_session.id, None, 0, 0, []))
     return db_session
 
 
+# Độ dài last_message_preview lưu trên chat_sessions
+PREVIEW_CHARS = 200
+
+_BUMP_COUNTERS = update(models.ChatSession)\
+    .where(models.ChatSession.id == bindparam("sid"))\
+    .values(
+        message_count=models.ChatSession.message_count + bindparam("added"),
+        last_message_at=bindparam("at"),
+        last_message_role=bindparam("last_role"),
+        last_message_preview=bindparam("preview"),
+        updated_at=bindparam("at"),
+    )
+
+
+def _bump_counters(db: Session, rows: list):
+    """Một câu UPDATE mỗi session cho các tin nhắn vừa INSERT (cùng transaction).
+
+    rows: (session_id, role, content, created_at) theo đúng thứ tự hội thoại.
+    """
+    params = {}
+    for session_id, role, content, created_at in rows:
+        entry = params.setdefault(session_id, {"sid": session_id, "added": 0})
+        entry.update(added=entry["added"] + 1, at=created_at, last_role=role, preview=content[:PREVIEW_CHARS])
+    db.connection().execute(_BUMP_COUNTERS, list(params.values()))
+
+
+def create_sessions(db: Session, count: int, user_id: str = None) -> list[str]:
+    """Tạo nhiều session bằng một câu INSERT (chat batch), trả về danh sách ID"""
+    now = datetime.utcnow()
+    ids = [str(uuid.uuid4()) for _ in range(count)]
+    if ids:
+        db.execute(insert(models.ChatSession), [
+            {"id": session_id, "user_id": user_id, "created_at": now, "updated_at": now} for session_id in ids
+        ])
+        db.commit()
+        for session_id in ids:
+            _cache("set", session_id, make_state(session_id, None, 0, 0, []))
+    return ids
+
+
 def get_session(db: Session, session_id: str):
     """Lấy session theo ID"""
     return db.query(models.ChatSession).filter(models.ChatSession.id == session_id).first()
 
 
 def get_session_with_messages(db: Session, session_id: str, limit: int = 20):
-    """Lấy session với lịch sử tin nhắn (giới hạn số lượng)"""
+    """Lấy session với lịch sử tin nhắn (giới hạn số lượng).
+
+    Có session store thì đọc từ cache (không chạm DB); cache miss thì đọc SQL
+    rồi nạp lại cache.
+    """
+    state = _cache("get", session_id)
+    if state and len(state["recent"]) >= min(limit, state["message_count"]):
+        return CachedSession.from_state(state, limit)
+
     session = db.query(models.ChatSession).filter(models.ChatSession.id == session_id).first()
     if not session:
         return None
@@ -28,45 +89,131 @@ def get_session_with_messages(db: Session, session_id: str, limit: int = 20):
     messages = db.query(models.ChatMessage)\
         .filter(models.ChatMessage.session_id == session_id)\
         .order_by(desc(models.ChatMessage.created_at))\
-        .limit(limit)\
+        .limit(max(limit, RECENT_LIMIT))\
         .all()
     
-    # Đảo ngược để có thứ tự từ cũ đến mới
-    session.messages = list(reversed(messages))
+    # Đảo ngược để có thứ tự từ cũ đến mới.
+    # Gán vào thuộc tính riêng: gán list con vào relationship `messages`
+    # (cascade delete-orphan) sẽ xoá các tin nhắn cũ hơn khi commit.
+    messages = list(reversed(messages))
+    session.recent_messages = messages[-limit:] if limit else []
+
+    if get_session_store().name != "sql":
+        # set_if_absent: không ghi đè entry mới hơn do lượt khác nạp/append
+        message_count, summary_message_count = session.message_count or 0, session.summary_message_count or 0
+        _cache("set_if_absent", session_id, make_state(session_id, session.summary, summary_message_count, message_count, messages))
+        # Tin nhắn/summary commit giữa lúc đọc SQL và lúc nạp cache không được ghi vào cache
+        # (key chưa có) -> đọc lại bộ đếm, lệch thì bỏ entry để lượt sau đọc lại SQL
+        current = db.query(models.ChatSession.message_count, models.ChatSession.summary_message_count)\
+            .filter(models.ChatSession.id == session_id)\
+            .first()
+        if current is None or (current[0] or 0, current[1] or 0) != (message_count, summary_message_count):
+            _cache("delete", session_id)
     return session
 
 
 def add_message(db: Session, session_id: str, role: str, content: str):
-    """Thêm tin nhắn vào session"""
+    """Thêm tin nhắn vào session: INSERT tin nhắn + UPDATE bộ đếm của session, một lần commit"""
     db_message = models.ChatMessage(
         session_id=session_id,
         role=role,
-        content=content
+        content=content,
+        created_at=datetime.utcnow(),
     )
     db.add(db_message)
+    db.flush()
+    _bump_counters(db, [(session_id, role, content, db_message.created_at)])
     db.commit()
-    db.refresh(db_message)
-    
-    # Cập nhật updated_at của session
+
+    # Write-through: SQL đã commit, cập nhật cache của phiên (nếu đang được cache)
+    _cache("append_message", session_id, role, content)
+    return db_message
+
+
+def add_messages_bulk(db: Session, rows: list):
+    """Ghi nhiều tin nhắn trong một transaction (chat batch).
+
+    rows: (session_id, role, content, created_at) theo đúng thứ tự hội thoại.
+    """
+    if not rows:
+        return
+    db.execute(insert(models.ChatMessage), [
+        {"session_id": session_id, "role": role, "content": content, "created_at": created_at}
+        for session_id, role, content, created_at in rows
+    ])
+    _bump_counters(db, rows)
+    db.commit()
+
+    for session_id, role, content, _ in rows:
+        _cache("append_message", session_id, role, content)
+
+
+def count_messages(db: Session, session_id: str, use_cache: bool = True) -> int:
+    """Số tin nhắn của session (bộ đếm chat_sessions.message_count, không quét chat_messages)"""
+    if use_cache:
+        state = _cache("get", session_id)
+        if state:
+            return state["message_count"]
+    return db.query(models.ChatSession.message_count)\
+        .filter(models.ChatSession.id == session_id)\
+        .scalar() or 0
+
+
+def get_messages_range(db: Session, session_id: str, offset: int, limit: int):
+    """Lấy tin nhắn theo thứ tự thời gian, từ vị trí offset"""
+    return db.query(models.ChatMessage)\
+        .filter(models.ChatMessage.session_id == session_id)\
+        .order_by(models.ChatMessage.created_at)\
+        .offset(offset)\
+        .limit(limit)\
+        .all()
+
+
+def update_session_summary(db: Session, session_id: str, summary: str, summary_message_count: int):
+    """Lưu rolling summary của session"""
     session = get_session(db, session_id)
     if session:
-        from datetime import datetime
-        session.updated_at = datetime.utcnow()
+        session.summary = summary
+        session.summary_message_count = summary_message_count
         db.commit()
-    
-    return db_message
+        _cache("update_summary", session_id, summary, summary_message_count)
+    return session
 
 
 def delete_session(db: Session, session_id: str):
     """Xóa session và tất cả messages"""
     session = get_session(db, session_id)
     if session:
+        # Xoá tin nhắn bằng một câu DELETE thay vì nạp từng object qua ORM cascade
+        db.query(models.ChatMessage)\
+            .filter(models.ChatMessage.session_id == session_id)\
+            .delete(synchronize_session=False)
         db.delete(session)
         db.commit()
+        _cache("delete", session_id)
         return True
     return False
 
 
+def list_sessions(db: Session, user_id: str = None, limit: int = 20, before: tuple = None):
+    """Session mới cập nhật nhất kèm số tin nhắn và tin nhắn cuối (bộ đếm trên chat_sessions).
+
+    Chỉ đọc chat_sessions, không chạm chat_messages. Phân trang keyset: `before`
+    là (updated_at, id) của dòng cuối trang trước.
+    """
+    s = models.ChatSession
+    query = db.query(
+        s.id, s.user_id, s.created_at, s.updated_at,
+        s.message_count, s.last_message_at, s.last_message_role, s.last_message_preview,
+    )
+    if user_id is not None:
+        query = query.filter(s.user_id == user_id)
+    if before:
+        updated_at, session_id = before
+        query = query.filter(or_(s.updated_at < updated_at, and_(s.updated_at == updated_at, s.id < session_id)))
+    return query.order_by(desc(s.updated_at), desc(s.id)).limit(limit).all()
+
+
 def get_recent_sessions(db: Session, limit: int = 10):
     """Lấy các session gần nhất"""
     return db.query(models.ChatSession)\
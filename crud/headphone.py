@@ -1,5 +1,7 @@
 from sqlalchemy.orm import Session, joinedload
 import models
+from services.catalog_bus import mark_catalog_changed
+from services.product_search import build_search_text
 from schemas import headphone as schemas
 from .brand import get_brand_by_slug, get_brand_by_name
 from .type import get_type_by_slug, get_type_by_name
@@ -90,6 +92,22 @@ def resolve_type_id(db: Session, type_identifier: str) -> str:
     
     return None
 
+def get_search_text(db: Session, name: str, brand_id: str, type_id: str) -> str:
+    """Nội dung tìm kiếm (đã bỏ dấu) của tai nghe: tên + brand + type"""
+    brand = db.get(models.Brand, brand_id) if brand_id else None
+    type_ = db.get(models.Type, type_id) if type_id else None
+    return build_search_text(name, brand.name if brand else None, type_.name if type_ else None)
+
+def refresh_search_text(db: Session, brand_id: str = None, type_id: str = None):
+    """Cập nhật search_text khi brand/type đổi tên (chưa commit)"""
+    query = db.query(models.Headphone).options(joinedload(models.Headphone.brand), joinedload(models.Headphone.type))
+    if brand_id:
+        query = query.filter(models.Headphone.brand_id == brand_id)
+    if type_id:
+        query = query.filter(models.Headphone.type_id == type_id)
+    for h in query.all():
+        h.search_text = build_search_text(h.name, h.brand.name if h.brand else None, h.type.name if h.type else None)
+
 def create_headphone(db: Session, headphone: schemas.HeadphoneCreate):
     existing_headphone = db.query(models.Headphone).filter(models.Headphone.name == headphone.name).first()
     if existing_headphone:
@@ -124,10 +142,12 @@ def create_headphone(db: Session, headphone: schemas.HeadphoneCreate):
         brand_id=brand_uuid,
         type_id=type_uuid,
         price=headphone.price,
-        slug=unique_slug
+        slug=unique_slug,
+        search_text=get_search_text(db, headphone.name, brand_uuid, type_uuid)
     )
     
     db.add(db_headphone)
+    mark_catalog_changed(db, "headphone")
     db.commit()
     db.refresh(db_headphone)
     return db_headphone
@@ -153,7 +173,9 @@ def update_headphone(db: Session, id: str, headphone_update: schemas.HeadphoneUp
     db_headphone.brand_id = headphone_update.brand_id
     db_headphone.type_id = headphone_update.type_id
     db_headphone.price = headphone_update.price
+    db_headphone.search_text = get_search_text(db, db_headphone.name, db_headphone.brand_id, db_headphone.type_id)
     
+    mark_catalog_changed(db, "headphone")
     db.commit()
     db.refresh(db_headphone)
     return db_headphone
@@ -197,7 +219,8 @@ def create_headphones_bulk(db: Session, headphones: list[schemas.HeadphoneCreate
                 brand_id=brand_uuid,
                 type_id=type_uuid,
                 price=headphone.price,
-                slug=unique_slug
+                slug=unique_slug,
+                search_text=get_search_text(db, headphone.name, brand_uuid, type_uuid)
             )
             
             db.add(db_headphone)
@@ -213,6 +236,7 @@ def create_headphones_bulk(db: Session, headphones: list[schemas.HeadphoneCreate
     
     if created_headphones:
         try:
+            mark_catalog_changed(db, "headphone")
             db.commit()
             for headphone in created_headphones:
                 db.refresh(headphone)
@@ -229,6 +253,7 @@ def delete_headphone(db: Session, id: str):
         raise ValueError(f"Tai nghe với id '{id}' không tồn tại")
 
     db.delete(db_headphone)
+    mark_catalog_changed(db, "headphone")
     db.commit()
     print(f"Đã xóa tai nghe với id: '{id}'")
     return db_headphone
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 import models
+from services.catalog_bus import mark_catalog_changed
 from schemas import type as schemas
 import re
 
@@ -57,6 +58,7 @@ def create_type(db: Session, type: schemas.TypeCreate):
     )
     
     db.add(db_type)
+    mark_catalog_changed(db, "type")
     db.commit()
     db.refresh(db_type)
     return db_type
@@ -80,6 +82,12 @@ def update_type(db: Session, id: str, type_update: schemas.TypeUpdate):
         unique_slug = generate_unique_slug(db, base_slug)
         db_type.slug = unique_slug
     
+    if db.is_modified(db_type):
+        # Tên type nằm trong nội dung tìm kiếm của các tai nghe thuộc type này
+        from crud.headphone import refresh_search_text
+        refresh_search_text(db, type_id=id)
+    
+    mark_catalog_changed(db, "type")
     db.commit()
     db.refresh(db_type)
     return db_type
@@ -115,6 +123,7 @@ def create_types_bulk(db: Session, types: list[schemas.TypeCreate]):
             errors.append(f"Lỗi tạo type '{type_item.name}': {str(e)}")
     
     if created_types:
+        mark_catalog_changed(db, "type")
         db.commit()
         for type_obj in created_types:
             db.refresh(type_obj)
@@ -127,5 +136,6 @@ def delete_type(db: Session, id: str):
         raise ValueError(f"Type với id '{id}' không tồn tại")
 
     db.delete(db_type)
+    mark_catalog_changed(db, "type")
     db.commit()
     return db_type
@@ -2,23 +2,42 @@ import os
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import NullPool, QueuePool
 from dotenv import load_dotenv
 
 load_dotenv()
 
-engine = create_engine(
-    os.getenv("DATABASE_URL"),
-    poolclass=NullPool,  # Tắt connection pooling để tránh lỗi SSL
-    pool_pre_ping=True,  # Kiểm tra connection trước khi sử dụng
-    connect_args={
-        "options": "-c timezone=utc",
-        "keepalives": 1,
-        "keepalives_idle": 30,
-        "keepalives_interval": 10,
-        "keepalives_count": 5,
-    }
-)
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+if DATABASE_URL.startswith("sqlite"):
+    # SQLite cho dev/benchmark local (xem .env.example)
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+else:
+    # DB_POOL_SIZE > 0: giữ connection giữa các request (warmup mở sẵn lúc khởi động).
+    # pool_recycle thay connection cũ trước khi server/proxy cắt SSL idle.
+    pool_size = int(os.getenv("DB_POOL_SIZE", "0"))
+    pool_args = (
+        {
+            "poolclass": QueuePool,
+            "pool_size": pool_size,
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "300")),
+        }
+        if pool_size > 0
+        else {"poolclass": NullPool}  # Tắt connection pooling để tránh lỗi SSL
+    )
+    engine = create_engine(
+        DATABASE_URL,
+        **pool_args,
+        pool_pre_ping=True,  # Kiểm tra connection trước khi sử dụng
+        connect_args={
+            "options": "-c timezone=utc",
+            "keepalives": 1,
+            "keepalives_idle": 30,
+            "keepalives_interval": 10,
+            "keepalives_count": 5,
+        }
+    )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -1,15 +1,35 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from routers import brand, type, headphone
 from database import Base, engine
 from services.ai_client import AIClient
 import os
-from routers import chatbot
+from routers import chatbot, metrics
 from contextlib import asynccontextmanager
+from services.timing import StageTimer, init_tracing
+from services.catalog_bus import start_catalog_listener, stop_catalog_listener
+from services.chat_retention import MAINTENANCE_INTERVAL, maintenance_loop
+from services.warmup import warm_database, warm_up, warmup_enabled
+from services.traffic_capture import CAPTURE_PATHS, TrafficRecorder, build_entry
+import time
+import asyncio
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    startup = StageTimer("startup")
+    init_tracing()
+
+    # Schema do Alembic quản lý (`alembic upgrade head`); create_all chỉ dành cho dev
+    if os.getenv("DB_CREATE_ALL", "").lower() in ("1", "true", "yes"):
+        with startup.stage("create_all"):
+            import models  # noqa: F401
+            Base.metadata.create_all(bind=engine)
+
+    app.state.traffic_recorder = TrafficRecorder.from_env()
+    if app.state.traffic_recorder:
+        print(f"Traffic capture enabled: {app.state.traffic_recorder.directory}")
+
     ai_url = os.getenv("AI_API_URL")
     ai_model = os.getenv("AI_MODEL")
     ai_key = os.getenv("AI_API_KEY")
@@ -25,11 +45,46 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"Failed to initialize AI client: {e}")
         app.state.ai_client = None
+
+    # Nhận thông báo catalog đổi từ worker khác (PostgreSQL LISTEN/NOTIFY)
+    start_catalog_listener()
+
+    # Tạo partition chat_messages cho các tháng tới + retention
+    app.state.maintenance_task = None
+    if MAINTENANCE_INTERVAL > 0:
+        app.state.maintenance_task = asyncio.create_task(maintenance_loop())
+
+    # Warmup: connection DB, rồi catalog context + model (dựng catalog trong thread, không chặn event loop)
+    app.state.warmup_task = None
+    if warmup_enabled():
+        try:
+            with startup.stage("db_connect"):
+                warm_database()
+        except Exception as e:
+            print(f"Database warmup failed: {e}")
+
+        model_mode = os.getenv("WARMUP_MODEL", "background").lower()
+        ai = app.state.ai_client if model_mode != "off" else None
+        if model_mode == "blocking":
+            with startup.stage("warmup"):
+                await warm_up(ai)
+        else:
+            app.state.warmup_task = asyncio.create_task(warm_up(ai))
+
+    startup.finish()
+    print(f"Startup timing: {startup.server_timing_header()}")
     
     yield
     
     # Shutdown
     print("Shutting down...")
+    stop_catalog_listener()
+    if app.state.maintenance_task:
+        app.state.maintenance_task.cancel()
+    if app.state.warmup_task and not app.state.warmup_task.done():
+        app.state.warmup_task.cancel()
+    if app.state.traffic_recorder:
+        app.state.traffic_recorder.close()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -44,9 +99,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
-Base.metadata.create_all(bind=engine)
+@app.middleware("http")
+async def server_timing_middleware(request: Request, call_next):
+    """Gắn StageTimer cho mỗi request và trả về header Server-Timing"""
+    timer = StageTimer(f"{request.method} {request.url.path}")
+    request.state.timer = timer
+    try:
+        response = await call_next(request)
+    finally:
+        timer.finish()
+    response.headers["Server-Timing"] = timer.server_timing_header()
+    return response
+
+@app.middleware("http")
+async def traffic_capture_middleware(request: Request, call_next):
+    """Ghi lại request chat (ẩn danh) khi bật TRAFFIC_CAPTURE_DIR"""
+    recorder = getattr(request.app.state, "traffic_recorder", None)
+    if recorder is None or request.method != "POST" or request.url.path not in CAPTURE_PATHS or not recorder.should_record():
+        return await call_next(request)
+
+    body = await request.body()
+    started_at = time.time()
+    started = time.perf_counter()
+    response = await call_next(request)
+    try:
+        entry = build_entry(recorder, started_at, body, request.state, response.status_code, time.perf_counter() - started)
+        if entry:
+            recorder.record(entry)
+    except Exception as e:
+        print(f"Traffic capture error: {e}")
+    return response
 
 @app.get("/")
 async def read_root():
@@ -55,4 +140,5 @@ async def read_root():
 app.include_router(brand.router)
 app.include_router(headphone.router)
 app.include_router(type.router)
-app.include_router(chatbot.router)
\ No newline at end of file
+app.include_router(chatbot.router)
+app.include_router(metrics.router)
\ No newline at end of file
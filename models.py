@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime, Index
 from sqlalchemy.orm import relationship
 from database import Base
 import uuid
@@ -34,6 +34,8 @@ class Headphone(Base):
     name = Column(String, index=True)
     slug = Column(String, unique=True, index=True)
     price = Column(Integer)
+    # Tên + brand + type đã bỏ dấu (services.product_search.build_search_text), GIN trigram index trên PostgreSQL
+    search_text = Column(Text, nullable=True)
 
     brand_id = Column(String, ForeignKey("brands.id"), nullable=True)
     type_id = Column(String, ForeignKey("types.id"), nullable=True)
@@ -45,23 +47,42 @@ class Headphone(Base):
 # Bảng Chat Session - Lưu trữ phiên chat
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # GET /chat/sessions: keyset theo updated_at (migration e7a3f9c2d814)
+        Index("ix_chat_sessions_user_updated", "user_id", "updated_at"),
+        Index("ix_chat_sessions_updated_at", "updated_at"),
+    )
     
     id = Column(String, primary_key=True, index=True, default=lambda:str(uuid.uuid4()))
     user_id = Column(String, index=True, nullable=True)  # Optional user tracking
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Tóm tắt các lượt cũ (rolling summary) và số tin nhắn đã được tóm tắt
+    summary = Column(Text, nullable=True)
+    summary_message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Bộ đếm cập nhật cùng transaction với INSERT tin nhắn (crud.chat), đọc một dòng thay vì quét chat_messages
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_at = Column(DateTime, nullable=True)
+    last_message_role = Column(String, nullable=True)
+    last_message_preview = Column(String, nullable=True)
     
-    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
+    # passive_deletes: không nạp hết tin nhắn khi xoá session (crud.chat.delete_session xoá hàng loạt)
+    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan", passive_deletes=True)
 
 
 # Bảng Chat Message - Lưu trữ từng tin nhắn
+# PostgreSQL: partition theo tháng trên created_at, khoá chính (id, created_at)
+# (migration c5d8e2f4a613, bảo trì bằng services.chat_retention)
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        Index("ix_chat_messages_session_created", "session_id", "created_at"),
+    )
     
     id = Column(String, primary_key=True, index=True, default=lambda:str(uuid.uuid4()))
     session_id = Column(String, ForeignKey("chat_sessions.id"), nullable=False)
     role = Column(String, nullable=False)  # "user" or "assistant"
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     
     session = relationship("ChatSession", back_populates="messages")
@@ -1,117 +1,269 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from schemas.chatbot import ChatRequest, ChatResponse
+from schemas.chatbot import ChatRequest, ChatResponse, ChatBatchResult, CRUDRequest, CRUDResponse
 import database
 from services.ai_client import AIClient
-from services.headphone_prompts import get_prompt_for_intent, detect_intent
+from services.headphone_prompts import get_prompt_for_intent, detect_intent, CRUD_STRUCTURED_PROMPT
 from services.web_search import WebSearchClient
+from services.json_stream import parse_json_object
+from services.catalog_context import build_catalog_context, build_candidate_context, build_candidate_turn
+from services.recommendation import RECO_ENABLED, TOP_K, get_recommender
+from services.constraints import parse_constraints
+from services.command_parser import parse_command
+from services.crud_dispatch import CRUDInputError, normalize_crud, execute_crud, format_crud_reply
+from services.catalog_bus import CatalogCache, catalog_version, discard_catalog_changes, publish_catalog_changes
+from services.structured_output import crud_json_schema, crud_gbnf_grammar, parse_crud_request
+from pydantic import ValidationError
 import json
 import re
-from crud.brand import create_brand, delete_brand, get_brands, get_brand_by_id, update_brand, create_brands_bulk
-from crud.type import create_type, delete_type, get_types, get_type_by_id, update_type, create_types_bulk
-from crud.headphone import create_headphone, delete_headphone, get_headphones, get_headphone_by_id, update_headphone, create_headphones_bulk
-from crud.chat import create_session, get_session_with_messages, add_message
-# Import schemas cho CRUD operations
-from schemas.brand import BrandCreate, BrandUpdate
-from schemas.type import TypeCreate, TypeUpdate
-from schemas.headphone import HeadphoneCreate, HeadphoneUpdate
+from crud.brand import get_brands
+from crud.type import get_types
+from crud.headphone import get_headphones
+from schemas.brand import Brand as BrandSchema
+from schemas.type import Type as TypeSchema
+from schemas.headphone import Headphone as HeadphoneSchema
+from crud.chat import (
+    create_session, create_sessions, get_session, get_session_with_messages, add_message, add_messages_bulk,
+    count_messages, get_messages_range, list_sessions,
+)
+from schemas.chat import ChatSession as ChatSessionSchema, ChatSessionListItem, ChatSessionPage
+from services.session_archive import load_archived_session, restore_session
+from services.session_memory import HISTORY_LIMIT, needs_summary_refresh, refresh_session_summary, unsummarized
+from services.timing import StageTimer, get_stage_timer
+from contextlib import aclosing
+from typing import Optional
+import base64
+import binascii
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import asyncio
+import os
+import time
 
 router = APIRouter(prefix="/chat", tags=["Chatbot"])
 
+# /chat/batch: số lượt xử lý song song, số request tối đa, số tin nhắn mỗi lần ghi DB
+BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "1000"))
+BATCH_FLUSH_SIZE = int(os.getenv("CHAT_BATCH_FLUSH_SIZE", "200"))
+
+# Cache theo catalog version: worker nào ghi catalog cũng làm mới cache ở mọi worker
+_db_context_cache = CatalogCache()
+_db_info_cache = CatalogCache()
+
+
+def _build_db_context(db: Session) -> str:
+    # Sắp xếp cố định để context giống hệt nhau giữa các lượt (prefix cache)
+    brands = sorted(get_brands(db), key=lambda b: b.name or "")
+    types = sorted(get_types(db), key=lambda t: t.name or "")
+    headphones = sorted(get_headphones(db), key=lambda h: (h.name or "", h.id))
+    return build_catalog_context(brands, types, headphones)
+
+
 def get_db_context(db: Session) -> str:
     """Lấy context từ database để cung cấp cho AI"""
     try:
-        brands = get_brands(db)
-        types = get_types(db)
-        headphones = get_headphones(db)
+        return _db_context_cache.get(lambda: _build_db_context(db))
         
-        context = """
-THÔNG TIN CỬA HÀNG TAI NGHE:
+    except Exception as e:
+        return f"\nLỗi đọc database: {str(e)}\n💡 Hãy liên hệ quản lý để cập nhật thông tin kho hàng."
 
-TỔNG QUAN:"""
-        
-        context += f"\n- Có {len(brands)} thương hiệu: {', '.join([b.name for b in brands])}"
-        context += f"\n- Có {len(types)} loại sản phẩm: {', '.join([t.name for t in types])}"
-        context += f"\n- Có {len(headphones)} tai nghe trong kho"
-        
-        context += """
 
-TAI NGHE HIỆN CÓ:"""
-        
-        if headphones:
-            for h in headphones:
-                brand_name = h.brand.name if h.brand else "Không rõ"
-                type_name = h.type.name if h.type else "Không rõ" 
-                price_str = f"{h.price:,.0f}đ" if h.price else "Liên hệ"
-                context += f"\n- {h.name} ({brand_name} - {type_name}): {price_str}"
+def build_chat_messages(system_prompt: str, db_context: str, history: list, message: str, summary: str = None,
+                        turn_context: str = None) -> list[dict]:
+    """Tạo message list với phần cố định (system prompt + catalog) đứng đầu.
+
+    Prefix không đổi giữa các lượt nên backend (llama.cpp, vLLM, LM Studio)
+    dùng lại được KV cache, chỉ phải prefill phần lịch sử và câu hỏi mới.
+    Summary của các lượt cũ được nối sau catalog nên không phá prefix.
+    `turn_context` (vd. sản phẩm gợi ý cho lượt này) đi kèm câu hỏi mới,
+    không nằm trong system để prefix không đổi giữa các lượt.
+    """
+    system_content = f"{system_prompt}\n{db_context}"
+    if summary:
+        system_content += f"\n\nTÓM TẮT HỘI THOẠI TRƯỚC ĐÓ:\n{summary}\n"
+    messages = [{"role": "system", "content": system_content}]
+
+    for msg in history:
+        role = "user" if msg.role == "user" else "assistant"
+        # Chat template yêu cầu user/assistant xen kẽ, bắt đầu bằng user
+        if len(messages) == 1 and role == "assistant":
+            continue
+        if messages[-1]["role"] == role:
+            messages[-1]["content"] += f"\n{msg.content}"
         else:
-            context += "\n- Hiện tại chưa có tai nghe nào"
-            
-        context += """
-
-HƯỚNG DẪN TƯ VẤN:
-- Khi khách hỏi về brands: trả lời chính xác số lượng và tên các thương hiệu tai nghe
-- Khi khách hỏi về types: nói về các loại tai nghe có sẵn (bluetooth, wireless, headphones)
-- Khi khách hỏi về tai nghe: mô tả chi tiết từng tai nghe trong kho
-- Luôn dựa vào dữ liệu thực, không bịa đặt
-"""
-        
-        return context
-        
-    except Exception as e:
-        return f"\nLỗi đọc database: {str(e)}\n💡 Hãy liên hệ quản lý để cập nhật thông tin kho hàng."
+            messages.append({"role": role, "content": msg.content})
+
+    if turn_context:
+        message = f"{turn_context}\n\n{message}"
+    if messages[-1]["role"] == "user":
+        messages[-1]["content"] += f"\n{message}"
+    else:
+        messages.append({"role": "user", "content": message})
+    return messages
+
+
+def _build_db_info(db: Session) -> dict:
+    brands = get_brands(db)
+    types = get_types(db)
+    headphones = get_headphones(db)
+    
+    return {
+        "success": True,
+        "brands_count": len(brands),
+        "brands": [b.name for b in brands],
+        "types_count": len(types),
+        "types": [t.name for t in types],
+        "products_count": len(headphones),
+        "products": [{"name": h.name, "price": h.price} for h in headphones]
+    }
+
 
 @router.get("/db-info")
 async def get_database_info(db: Session = Depends(database.get_db)):
     """Lấy thông tin từ database"""
     try:
-        brands = get_brands(db)
-        types = get_types(db)
-        headphones = get_headphones(db)
-        
-        return {
-            "success": True,
-            "brands_count": len(brands),
-            "brands": [b.name for b in brands],
-            "types_count": len(types),
-            "types": [t.name for t in types],
-            "products_count": len(headphones),
-            "products": [{"name": h.name, "price": h.price} for h in headphones]
-        }
+        return _db_info_cache.get(lambda: _build_db_info(db))
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-@router.post("/", response_model=ChatResponse)
-async def chat_endpoint(req: ChatRequest, request: Request, db: Session = Depends(database.get_db)):
-    ai: AIClient = request.app.state.ai_client
-    if ai is None:
-        raise HTTPException(status_code=503, detail="AI service not available")
+_RESPONSE_SCHEMAS = {"brand": BrandSchema, "type": TypeSchema, "headphone": HeadphoneSchema}
+
+
+def _serialize_crud_result(crud: dict, result):
+    """Kết quả execute_crud -> JSON cho /chat/crud"""
+    schema = _RESPONSE_SCHEMAS[crud["resource"]]
+    if crud["action"] == "create_bulk":
+        created, errors = result
+        return {"created": [schema.model_validate(obj).model_dump() for obj in created], "errors": errors}
+    if crud["action"] == "delete":
+        return {"deleted": crud.get("id")}
+    if isinstance(result, list):
+        return [schema.model_validate(obj).model_dump() for obj in result]
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"{crud['resource']} '{crud.get('id')}' not found")
+    return schema.model_validate(result).model_dump()
+
+
+def _run_crud(db: Session, req: CRUDRequest):
+    crud = normalize_crud(req.model_dump(exclude_none=True))
+    return _serialize_crud_result(crud, execute_crud(db, crud))
+
+
+@router.post("/crud", response_model=CRUDResponse)
+def crud_endpoint(req: CRUDRequest, db: Session = Depends(database.get_db)):
+    """Chạy trực tiếp một CRUDRequest (cùng logic với chatbot, không gọi LLM)"""
+    try:
+        return CRUDResponse(result=_run_crud(db, req))
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        print(f"Error in crud_endpoint: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@router.post("/crud/batch", response_model=list[CRUDResponse])
+def crud_batch_endpoint(reqs: list[CRUDRequest]):
+    """Chạy nhiều CRUDRequest trong một transaction: một request lỗi thì rollback cả batch.
+
+    Các hàm crud tự commit; session được gắn vào transaction ngoài với
+    join_transaction_mode="create_savepoint" nên mỗi commit chỉ là SAVEPOINT.
+    """
+    with database.engine.connect() as conn:
+        transaction = conn.begin()
+        if conn.dialect.name == "sqlite":
+            # pysqlite không tự BEGIN trước SAVEPOINT, RELEASE savepoint đầu tiên sẽ commit luôn
+            conn.exec_driver_sql("BEGIN")
+        db = Session(
+            bind=conn, autoflush=False, join_transaction_mode="create_savepoint",
+            info={"defer_catalog_changes": True},
+        )
+        try:
+            results = []
+            for index, req in enumerate(reqs):
+                try:
+                    results.append(CRUDResponse(result=_run_crud(db, req)))
+                except HTTPException as he:
+                    raise HTTPException(status_code=he.status_code, detail={"index": index, "error": he.detail})
+                except ValueError as ve:
+                    raise HTTPException(status_code=400, detail={"index": index, "error": str(ve)})
+            transaction.commit()
+            # Cache catalog chỉ được làm mới sau khi cả batch commit
+            publish_catalog_changes(db)
+        except Exception as e:
+            transaction.rollback()
+            discard_catalog_changes(db)
+            if isinstance(e, HTTPException):
+                raise
+            print(f"Error in crud_batch_endpoint: {e}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        finally:
+            db.close()
+
+    return results
 
-    # 🔥 QUẢN LÝ CHAT SESSION
-    session_id = req.session_id
-    
-    # Tạo session mới nếu chưa có
-    if not session_id:
-        session = create_session(db)
-        session_id = session.id
-    else:
-        # Kiểm tra session có tồn tại không
-        session = get_session_with_messages(db, session_id, limit=10)  # Lấy 10 tin nhắn gần nhất
-        if not session:
-            # Session không tồn tại, tạo mới
-            session = create_session(db)
-            session_id = session.id
-    
-    # Lưu tin nhắn của user
-    add_message(db, session_id, "user", req.message)
-    
-    # Helper function để lưu response
-    def save_and_return(reply: str):
-        """Lưu assistant reply và trả về response"""
-        add_message(db, session_id, "assistant", reply)
-        return ChatResponse(reply=reply, session_id=session_id)
 
-    intent = detect_intent(req.message)
+def _encode_cursor(updated_at: datetime, session_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{updated_at.isoformat()}|{session_id}".encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        updated_at, session_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(updated_at), session_id
+    except (ValueError, UnicodeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="cursor không hợp lệ")
+
+
+@router.get("/sessions", response_model=ChatSessionPage)
+def list_chat_sessions(
+    user_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(database.get_db),
+):
+    """Danh sách session mới cập nhật nhất (kèm số tin nhắn, tin nhắn cuối), phân trang keyset theo updated_at"""
+    rows = list_sessions(db, user_id=user_id, limit=limit + 1, before=_decode_cursor(cursor) if cursor else None)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].updated_at, rows[-1].id)
+    return ChatSessionPage(items=[ChatSessionListItem.model_validate(r) for r in rows], next_cursor=next_cursor)
+
+
+@router.get("/sessions/{session_id}", response_model=ChatSessionSchema)
+def get_chat_session(session_id: str, db: Session = Depends(database.get_db)):
+    """Lịch sử đầy đủ của session; session đã archive được đọc từ file archive"""
+    session = get_session(db, session_id)
+    if session:
+        return ChatSessionSchema(
+            id=session.id, user_id=session.user_id, created_at=session.created_at, updated_at=session.updated_at,
+            summary=session.summary, summary_message_count=session.summary_message_count or 0,
+            messages=get_messages_range(db, session_id, 0, None),
+        )
+
+    archived = load_archived_session(session_id)
+    if archived is None or archived["session"] is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return ChatSessionSchema(**archived["session"], messages=archived["messages"], archived=True)
+
+
+async def _answer(ai: AIClient, db: Session, timer, message: str, history_messages: list, summary: str = None,
+                  session_key: str = None, custom_prompt: str = None, on_token=None, catalog=None) -> tuple[str, str, bool]:
+    """Sinh câu trả lời cho một lượt chat, dùng chung cho /chat/, /chat/batch và /chat/ws.
+
+    Trả về (reply, intent, persist); persist=False với lượt quản lý CRUD
+    (câu trả lời không lưu vào lịch sử session). Có `on_token` thì câu trả lời
+    tư vấn được stream, mỗi đoạn text gọi `await on_token(text)`. `catalog`
+    là snapshot của _catalog_snapshot (WebSocket), không có thì đọc từ cache.
+    """
+    with timer.stage("intent"):
+        intent = detect_intent(message)
+        # Lệnh xem/liệt kê/xoá rõ ràng được parse theo luật, không cần LLM sinh JSON
+        command = parse_command(message) if intent == "product_management" else None
 
     # ===========================
     # 🔍 WEB SEARCH FOR REAL PRODUCTS
@@ -122,13 +274,13 @@ async def chat_endpoint(req: ChatRequest, request: Request, db: Session = Depend
         r'\b(trên thị trường|on market|available)\b',
         r'\b(sản phẩm.*của)\b'
     ]
-    should_search = any(re.search(pattern, req.message.lower()) for pattern in search_keywords)
+    should_search = any(re.search(pattern, message.lower()) for pattern in search_keywords)
     
     web_search_results = None
-    if should_search and intent == "product_management":
+    if should_search and intent == "product_management" and command is None:
         # Extract brand and type from message
-        brand_match = re.search(r'\b(samsung|sony|apple|asus|jbl|bose|beats|sennheiser)\b', req.message.lower())
-        type_match = re.search(r'\b(bluetooth|wireless|gaming|gaming)\b', req.message.lower())
+        brand_match = re.search(r'\b(samsung|sony|apple|asus|jbl|bose|beats|sennheiser)\b', message.lower())
+        type_match = re.search(r'\b(bluetooth|wireless|gaming|gaming)\b', message.lower())
         
         if brand_match:
             brand = brand_match.group(1).capitalize()
@@ -137,7 +289,8 @@ async def chat_endpoint(req: ChatRequest, request: Request, db: Session = Depend
             # Search for real products
             search_client = WebSearchClient()
             try:
-                products = await search_client.search_headphones(brand, product_type, limit=3)
+                with timer.stage("web_search"):
+                    products = await search_client.search_headphones(brand, product_type, limit=3)
                 if products:
                     web_search_results = {
                         "brand": brand,
@@ -151,371 +304,492 @@ async def chat_endpoint(req: ChatRequest, request: Request, db: Session = Depend
     # 🔥 CASE 1 — CRUD MANAGEMENT
     # ===========================
     if intent == "product_management":
-        system_prompt = get_prompt_for_intent("product_management")
-
-        # Add web search results to prompt if available
-        web_context = ""
-        if web_search_results:
-            web_context = f"\n\nSẢN PHẨM THỰC TẾ TÌM ĐƯỢC TRÊN THỊ TRƯỜNG ({web_search_results['brand']} {web_search_results['type']}):\n"
-            for p in web_search_results['products']:
-                price_str = f"{p['price']:,}đ" if p['price'] else "Liên hệ"
-                web_context += f"- {p['name']}: {price_str}\n"
-            web_context += "\nHÃY SỬ DỤNG CÁC TÊN SẢN PHẨM THẬT NÀY thay vì tên chung chung.\n"
-
-        user_prompt = f"{system_prompt}{web_context}\n\nUser: {req.message}\n\nTRẢ VỀ CHỈ 1 JSON:"
-
-        ai_reply = await ai.generate(user_prompt, max_tokens=500, temperature=0)
-
-        # Clean và parse JSON AI trả về
-        try:
-            # Loại bỏ markdown code blocks nếu có
-            ai_reply_clean = ai_reply.strip()
-            if ai_reply_clean.startswith("```"):
-                lines = ai_reply_clean.split("\n")
-                ai_reply_clean = "\n".join(lines[1:])
-            if ai_reply_clean.endswith("```"):
-                lines = ai_reply_clean.rsplit("\n", 1)
-                ai_reply_clean = lines[0]
-            ai_reply_clean = ai_reply_clean.strip()
-            
-            # 🔥 EXTRACT JSON với balanced braces
-            start_idx = ai_reply_clean.find("{")
-            if start_idx == -1:
-                return ChatResponse(reply=f"Không tìm thấy JSON object trong response:\n{ai_reply}")
-            
-            # Đếm số lượng { và } để tìm JSON object hoàn chỉnh
-            brace_count = 0
-            end_idx = -1
-            
-            for i in range(start_idx, len(ai_reply_clean)):
-                char = ai_reply_clean[i]
-                if char == "{":
-                    brace_count += 1
-                elif char == "}":
-                    brace_count -= 1
-                    if brace_count == 0:
-                        end_idx = i
-                        break
-            
-            if end_idx == -1:
-                return ChatResponse(reply=f"JSON không đóng đủ dấu ngoặc:\n{ai_reply}")
-            
-            json_str = ai_reply_clean[start_idx:end_idx+1]
-            
-            # 🔥 LÀM SẠCH JSON - Loại bỏ trailing comma và whitespace
-            json_str = json_str.strip()
-            # Loại bỏ trailing comma trước }
-            json_str = json_str.replace(",\n}", "\n}").replace(", }", " }")
-            json_str = json_str.replace(",}", "}")
-            
-            # Parse JSON
+        crud = command
+        if crud is None:
+            # Backend có structured output -> prompt ngắn, cấu trúc JSON do schema/grammar đảm bảo
+            if ai.structured_output:
+                system_prompt = CRUD_STRUCTURED_PROMPT
+            else:
+                system_prompt = get_prompt_for_intent("product_management")
+
+            # Add web search results to prompt if available
+            web_context = ""
+            if web_search_results:
+                web_context = f"\n\nSẢN PHẨM THỰC TẾ TÌM ĐƯỢC TRÊN THỊ TRƯỜNG ({web_search_results['brand']} {web_search_results['type']}):\n"
+                for p in web_search_results['products']:
+                    price_str = f"{p['price']:,}đ" if p['price'] else "Liên hệ"
+                    web_context += f"- {p['name']}: {price_str}\n"
+                web_context += "\nHÃY SỬ DỤNG CÁC TÊN SẢN PHẨM THẬT NÀY thay vì tên chung chung.\n"
+
+            # System prompt cố định đứng đầu để tái sử dụng prefix cache
+            crud_messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"{web_context}\n\nUser: {message}\n\nTRẢ VỀ CHỈ 1 JSON:".lstrip()},
+            ]
+
+            # Stream completion, dừng generation ngay khi JSON object đóng
+            with timer.stage("llm"):
+                extractor = await ai.generate_json_object(
+                    messages=crud_messages,
+                    max_tokens=500,
+                    temperature=0,
+                    schema=crud_json_schema(),
+                    grammar=crud_gbnf_grammar(),
+                    schema_name="crud_request",
+                    session_key=session_key,
+                )
+            ai_reply = extractor.text
+
+            # Parse JSON AI trả về
             try:
-                crud = json.loads(json_str)
-            except json.JSONDecodeError as parse_err:
-                # Thử làm sạch thêm - loại bỏ comments
-                json_str_clean = "\n".join([
-                    line for line in json_str.split("\n") 
-                    if not line.strip().startswith("//")
-                ])
-                crud = json.loads(json_str_clean)
-            
-            # Clean up data - remove auto-generated fields
-            if "data" in crud and isinstance(crud["data"], dict):
-                crud["data"].pop("id", None)
-                crud["data"].pop("slug", None)
-            
-            if "items" in crud and isinstance(crud["items"], list):
-                for item in crud["items"]:
-                    if isinstance(item, dict):
-                        item.pop("id", None)
-                        item.pop("slug", None)
-            
-            # Validate JSON structure
-            if not isinstance(crud, dict):
-                return ChatResponse(reply=f"JSON phải là object, không phải {type(crud).__name__}:\n{ai_reply}")
-                
-        except json.JSONDecodeError as je:
-            # In ra JSON string để debug
-            debug_info = f"JSON string:\n```\n{json_str if 'json_str' in locals() else 'N/A'}\n```\n\n"
-            return ChatResponse(reply=f"JSON không hợp lệ từ AI: {crud if 'crud' in locals() else ai_reply} Lỗi: {str(je)}\n\n{debug_info}")
-        except Exception as e:
-            return ChatResponse(reply=f"Lỗi parse JSON:\n{ai_reply}\n\nLỗi: {str(e)}")
+                if not extractor.started:
+                    return f"Không tìm thấy JSON object trong response:\n{ai_reply}", intent, False
+                if not extractor.done:
+                    return f"JSON không đóng đủ dấu ngoặc:\n{ai_reply}", intent, False
+
+                json_str = extractor.result
+                crud = None
+                if ai.structured_output:
+                    try:
+                        crud = parse_crud_request(json_str)
+                    except ValidationError as ve:
+                        print(f"Structured CRUD output không khớp schema, parse lỏng: {ve}")
+                if crud is None:
+                    crud = parse_json_object(json_str)
+
+                # Validate JSON structure
+                if not isinstance(crud, dict):
+                    return f"JSON phải là object, không phải {type(crud).__name__}:\n{ai_reply}", intent, False
+
+                # Clean up data - remove auto-generated fields
+                if "data" in crud and isinstance(crud["data"], dict):
+                    crud["data"].pop("id", None)
+                    crud["data"].pop("slug", None)
+
+                if "items" in crud and isinstance(crud["items"], list):
+                    for item in crud["items"]:
+                        if isinstance(item, dict):
+                            item.pop("id", None)
+                            item.pop("slug", None)
+
+            except json.JSONDecodeError as je:
+                # In ra JSON string để debug
+                debug_info = f"JSON string:\n```\n{json_str}\n```\n\n"
+                return f"JSON không hợp lệ từ AI: {ai_reply} Lỗi: {str(je)}\n\n{debug_info}", intent, False
+            except Exception as e:
+                return f"Lỗi parse JSON:\n{ai_reply}\n\nLỗi: {str(e)}", intent, False
 
-        action = crud.get("action")
-        resource = crud.get("resource")
-        item_id = crud.get("id")
-        data = crud.get("data")
-        items = crud.get("items")  # Cho bulk create
-        
-        # 🔥 FALLBACK: Nếu action="create_bulk" nhưng dùng "data" thay vì "items"
-        if action == "create_bulk" and not items and isinstance(data, list):
-            items = data
-            data = None
-
-        # Validate data structure cho CREATE/UPDATE
-        if action in ["create", "update"]:
-            if not isinstance(data, dict):
-                return ChatResponse(reply=f"Lỗi: 'data' phải là object {{}}, không phải {type(data).__name__}.\n\n"
-                                         f"AI trả về:\n{json.dumps(crud, indent=2, ensure_ascii=False)}\n\n"
-                                         f"Nếu bạn muốn tạo nhiều sản phẩm, hãy dùng action 'create_bulk' với 'items':[]")
-            if not data:
-                return ChatResponse(reply=f"Lỗi: 'data' không được rỗng cho action '{action}'")
-        
-        # Validate items structure cho CREATE_BULK
-        if action == "create_bulk":
-            if not isinstance(items, list):
-                return ChatResponse(reply=f"Lỗi: 'items' phải là array [], không phải {type(items).__name__}.\n\n"
-                                         f"AI trả về:\n{json.dumps(crud, indent=2, ensure_ascii=False)}")
-            if not items:
-                return ChatResponse(reply=f"Lỗi: 'items' không được rỗng cho action 'create_bulk'")
+        try:
+            crud = normalize_crud(crud)
+        except CRUDInputError as ie:
+            return f"{ie}\n\nAI trả về:\n{json.dumps(crud, indent=2, ensure_ascii=False)}", intent, False
 
+        crud_started = time.perf_counter()
         try:
-            # ---------- CREATE BULK ----------
-            if action == "create_bulk":
-                if resource == "brand":
-                    brand_schemas = [BrandCreate(**item) for item in items]
-                    created, errors = create_brands_bulk(db, brand_schemas)
-                    
-                    result = f"Đã tạo {len(created)} brands:\n"
-                    result += "\n".join([f"- {b.name}" for b in created])
-                    if errors:
-                        result += f"\n\nLỗi ({len(errors)}):\n" + "\n".join([f"- {e}" for e in errors])
-                    return ChatResponse(reply=result)
-
-                if resource == "type":
-                    type_schemas = [TypeCreate(**item) for item in items]
-                    created, errors = create_types_bulk(db, type_schemas)
-                    
-                    result = f"Đã tạo {len(created)} types:\n"
-                    result += "\n".join([f"- {t.name}" for t in created])
-                    if errors:
-                        result += f"\n\nLỗi ({len(errors)}):\n" + "\n".join([f"- {e}" for e in errors])
-                    return ChatResponse(reply=result)
-
-                if resource == "headphone":
-                    # Auto-infer missing brand_slug and type_slug from user message
-                    for item in items:
-                        # Infer type_slug if missing
-                        if not item.get("type_slug"):
-                            type_keywords = {
-                                "bluetooth": r'\b(bluetooth|bt|wireless)\b',
-                                "gaming": r'\b(gaming|game|chơi game)\b',
-                                "wired": r'\b(wired|có dây)\b',
-                                "over-ear": r'\b(over.ear|overear)\b',
-                            }
-                            for type_name, pattern in type_keywords.items():
-                                if re.search(pattern, req.message.lower()):
-                                    item["type_slug"] = type_name
-                                    break
-                        
-                        # Infer brand_slug if missing
-                        if not item.get("brand_slug"):
-                            brand_keywords = r'\b(samsung|sony|apple|asus|jbl|bose|beats|sennheiser)\b'
-                            brand_match = re.search(brand_keywords, req.message.lower())
-                            if brand_match:
-                                item["brand_slug"] = brand_match.group(1)
-                        
-                        # Validate price
-                        if "price" not in item or item.get("price") is None:
-                            item["price"] = 500000  # Giá mặc định
-                        else:
-                            try:
-                                item["price"] = int(item["price"])
-                            except (ValueError, TypeError):
-                                item["price"] = 500000
-                    
-                    # CRUD sẽ tự động chuyển đổi slug/name thành UUID
-                    headphone_schemas = [HeadphoneCreate(**item) for item in items]
-                    created, errors = create_headphones_bulk(db, headphone_schemas)
-                    
-                    result = f"Đã tạo {len(created)} tai nghe:\n"
-                    for h in created:
-                        brand_info = f" ({h.brand.name})" if h.brand else ""
-                        result += f"- {h.name}{brand_info}\n"
-                    if errors:
-                        result += f"\nLỗi ({len(errors)}):\n" + "\n".join([f"- {e}" for e in errors])
-                    return ChatResponse(reply=result.strip())
-
-            # ---------- CREATE ----------
-            if action == "create":
-                if resource == "brand":
-                    brand_schema = BrandCreate(**data)
-                    new_b = create_brand(db, brand_schema)
-                    return ChatResponse(reply=f"Đã tạo brand: {new_b.name}")
-
-                if resource == "type":
-                    type_schema = TypeCreate(**data)
-                    new_t = create_type(db, type_schema)
-                    return ChatResponse(reply=f"Đã tạo type: {new_t.name}")
-
-                if resource == "headphone":
-                    # Validate dữ liệu headphone
-                    if "name" not in data:
-                        return ChatResponse(reply="Lỗi: Thiếu 'name' (tên tai nghe) trong data")
-                    if "price" not in data or data.get("price") is None:
-                        return ChatResponse(reply="Lỗi: Thiếu 'price' (giá tai nghe). Vui lòng cung cấp giá tiền (VD: 500000)")
-                    
-                    # Auto-infer missing brand_slug and type_slug from user message
-                    if not data.get("type_slug"):
-                        type_keywords = {
-                            "bluetooth": r'\b(bluetooth|bt|wireless)\b',
-                            "gaming": r'\b(gaming|game|chơi game)\b',
-                            "wired": r'\b(wired|có dây)\b',
-                            "over-ear": r'\b(over.ear|overear)\b',
-                        }
-                        for type_name, pattern in type_keywords.items():
-                            if re.search(pattern, req.message.lower()):
-                                data["type_slug"] = type_name
-                                break
-                    
-                    if not data.get("brand_slug"):
-                        brand_keywords = r'\b(samsung|sony|apple|asus|jbl|bose|beats|sennheiser)\b'
-                        brand_match = re.search(brand_keywords, req.message.lower())
-                        if brand_match:
-                            data["brand_slug"] = brand_match.group(1)
-                    
-                    # Validate price là số
-                    try:
-                        price = int(data.get("price"))
-                        if price < 0:
-                            return ChatResponse(reply="Lỗi: Giá không được âm")
-                        data["price"] = price
-                    except (ValueError, TypeError):
-                        return ChatResponse(reply=f"Lỗi: Giá phải là số nguyên, nhận được: {data.get('price')}")
-                    
-                    # CRUD sẽ tự động chuyển đổi slug/name thành UUID
-                    headphone_schema = HeadphoneCreate(**data)
-                    new_h = create_headphone(db, headphone_schema)
-                    
-                    # Thông báo chi tiết
-                    brand_info = f" - Thương hiệu: {new_h.brand.name}" if new_h.brand else ""
-                    type_info = f" - Loại: {new_h.type.name}" if new_h.type else ""
-                    return ChatResponse(reply=f"Đã thêm tai nghe: {new_h.name}{brand_info}{type_info}")
-
-            # ---------- READ ----------
-            if action == "read":
-                if resource == "brand":
-                    if item_id:
-                        brand = get_brand_by_id(db, item_id)
-                        if brand:
-                            return ChatResponse(reply=f"Brand: {brand.name} (ID: {brand.id}, Slug: {brand.slug})")
-                        else:
-                            return ChatResponse(reply=f"Không tìm thấy brand với ID: {item_id}")
-                    else:
-                        brands = get_brands(db)
-                        if brands:
-                            brand_list = "\n".join([f"- {b.name} (ID: {b.id})" for b in brands])
-                            return ChatResponse(reply=f"Danh sách thương hiệu ({len(brands)}):\n{brand_list}")
-                        else:
-                            return ChatResponse(reply="Chưa có thương hiệu nào trong hệ thống.")
-
-                if resource == "type":
-                    if item_id:
-                        type_obj = get_type_by_id(db, item_id)
-                        if type_obj:
-                            return ChatResponse(reply=f"Type: {type_obj.name} (ID: {type_obj.id}, Slug: {type_obj.slug})")
-                        else:
-                            return ChatResponse(reply=f"Không tìm thấy type với ID: {item_id}")
-                    else:
-                        types = get_types(db)
-                        if types:
-                            type_list = "\n".join([f"- {t.name} (ID: {t.id})" for t in types])
-                            return ChatResponse(reply=f"Danh sách loại tai nghe ({len(types)}):\n{type_list}")
-                        else:
-                            return ChatResponse(reply="Chưa có loại tai nghe nào trong hệ thống.")
-
-                if resource == "headphone":
-                    if item_id:
-                        headphone = get_headphone_by_id(db, item_id)
-                        if headphone:
-                            brand_name = headphone.brand.name if headphone.brand else "Chưa rõ"
-                            type_name = headphone.type.name if headphone.type else "Chưa rõ"
-                            price_str = f"{headphone.price:,.0f}đ" if headphone.price else "Liên hệ"
-                            return ChatResponse(reply=f"Tai nghe: {headphone.name}\nThương hiệu: {brand_name}\nLoại: {type_name}\n💰 Giá: {price_str}\nID: {headphone.id}")
-                        else:
-                            return ChatResponse(reply=f"Không tìm thấy tai nghe với ID: {item_id}")
-                    else:
-                        headphones = get_headphones(db)
-                        if headphones:
-                            hp_list = []
-                            for h in headphones:
-                                brand_name = h.brand.name if h.brand else "Chưa rõ"
-                                price_str = f"{h.price:,.0f}đ" if h.price else "Liên hệ"
-                                hp_list.append(f"- {h.name} ({brand_name}) - {price_str}")
-                            hp_text = "\n".join(hp_list)
-                            return ChatResponse(reply=f"Danh sách tai nghe ({len(headphones)}):\n{hp_text}")
-                        else:
-                            return ChatResponse(reply="Chưa có tai nghe nào trong kho.")
-
-            # ---------- UPDATE ----------
-            if action == "update":
-                if not item_id:
-                    return ChatResponse(reply="Cần cung cấp ID để cập nhật.")
-                
-                if resource == "brand":
-                    brand_schema = BrandUpdate(**data)
-                    updated_brand = update_brand(db, item_id, brand_schema)
-                    return ChatResponse(reply=f"Đã cập nhật brand: {updated_brand.name}")
-
-                if resource == "type":
-                    type_schema = TypeUpdate(**data)
-                    updated_type = update_type(db, item_id, type_schema)
-                    return ChatResponse(reply=f"Đã cập nhật type: {updated_type.name}")
-
-                if resource == "headphone":
-                    headphone_schema = HeadphoneUpdate(**data)
-                    updated_headphone = update_headphone(db, item_id, headphone_schema)
-                    return ChatResponse(reply=f"Đã cập nhật tai nghe: {updated_headphone.name}")
-
-            # ---------- DELETE ----------
-            if action == "delete":
-                if resource == "brand":
-                    delete_brand(db, item_id)
-                    return ChatResponse(reply=f"Đã xoá brand: {item_id}")
-
-                if resource == "type":
-                    delete_type(db, item_id)
-                    return ChatResponse(reply=f"Đã xoá type: {item_id}")
-
-                if resource == "headphone":
-                    delete_headphone(db, item_id)
-                    return ChatResponse(reply=f"Đã xoá tai nghe: {item_id}")
-
-            return ChatResponse(reply="Hành động hoặc resource CRUD không hợp lệ.")
-        
+            result = execute_crud(db, crud, message)
+            return format_crud_reply(crud, result), intent, False
+        except CRUDInputError as ie:
+            return str(ie), intent, False
         except ValueError as ve:
-            return ChatResponse(reply=f"Lỗi validation: {str(ve)}")
+            return f"Lỗi validation: {str(ve)}", intent, False
         except Exception as e:
-            return ChatResponse(reply=f"Lỗi xử lý CRUD: {str(e)}")
+            return f"Lỗi xử lý CRUD: {str(e)}", intent, False
+        finally:
+            timer.record("crud", time.perf_counter() - crud_started)
 
     # ===========================
     # 🔥 CASE 2 — NORMAL CHAT / TƯ VẤN
     # ===========================
-    db_context = get_db_context(db)
-    system_prompt = req.system_prompt or get_prompt_for_intent(intent)
-
-    # 🔥 THÊM CHAT HISTORY CONTEXT
-    chat_history = ""
-    if session and session.messages:
-        history_messages = session.messages[:-1]  # Bỏ tin nhắn cuối
-        if history_messages:
-            chat_history = "\n\nLỊCH SỬ HỘI THOẠI:\n"
-            for msg in history_messages[-6:]:
-                role_label = "Khách hàng" if msg.role == "user" else "Trợ lý"
-                chat_history += f"{role_label}: {msg.content}\n"
-            chat_history += "\n"
-
-    prompt = (
-        f"{system_prompt}\n"
-        f"{db_context}\n"
-        f"{chat_history}"
-        f"Khách hàng: {req.message}\n\n"
-        f"Trợ lý:"
+    system_prompt = custom_prompt or get_prompt_for_intent(intent)
+
+    if intent == "customer_service" and RECO_ENABLED:
+        # Chọn sẵn sản phẩm phù hợp thay vì gửi cả catalog cho model
+        with timer.stage("recommend"):
+            recommender = catalog.recommender if catalog else get_recommender(db)
+            recent_user = " ".join(m.content for m in history_messages[-4:] if m.role == "user")
+            query = f"{recent_user} {message}"
+            # Ngân sách/brand lọc cứng trên price index trước khi gọi LLM (lần nhắc giá mới nhất được dùng)
+            constraints = parse_constraints(query, recommender.brand_names)
+            candidates = recommender.recommend(
+                query, k=TOP_K,
+                min_price=constraints.min_price, max_price=constraints.max_price, brand_names=constraints.brands,
+            )
+            db_context = build_candidate_context(recommender.brand_names, recommender.type_names, len(recommender))
+            turn_context = build_candidate_turn(candidates, requirements=constraints.describe())
+    else:
+        turn_context = None
+        with timer.stage("catalog"):
+            db_context = catalog.context if catalog else get_db_context(db)
+
+    # Các lượt cũ hơn đã được gộp vào rolling summary
+    messages = build_chat_messages(
+        system_prompt, db_context, history_messages, message, summary=summary, turn_context=turn_context
     )
 
-    ai_reply = await ai.generate(prompt, max_tokens=900, temperature=0.7)
+    with timer.stage("llm"):
+        if on_token is None:
+            ai_reply = await ai.generate(
+                messages=messages, max_tokens=900, temperature=0.7, session_key=session_key, intent=intent
+            )
+        else:
+            parts = []
+            chunks = ai.stream(messages=messages, max_tokens=900, temperature=0.7, session_key=session_key, intent=intent)
+            async with aclosing(chunks):
+                async for text in chunks:
+                    parts.append(text)
+                    await on_token(text)
+            ai_reply = "".join(parts)
+    return ai_reply, intent, True
+
+
+def _load_session(db: Session, session_id: str):
+    """Session + các tin nhắn chưa nằm trong summary; session đã archive được nạp lại vào DB để chat tiếp"""
+    session = get_session_with_messages(db, session_id, limit=HISTORY_LIMIT)
+    if not session and restore_session(db, session_id):
+        session = get_session_with_messages(db, session_id, limit=HISTORY_LIMIT)
+    if session:
+        session.recent_messages = unsummarized(
+            session.recent_messages, session.message_count or 0, session.summary_message_count or 0
+        )
+    return session
+
+
+@router.post("/", response_model=ChatResponse)
+async def chat_endpoint(req: ChatRequest, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(database.get_db)):
+    ai: AIClient = request.app.state.ai_client
+    if ai is None:
+        raise HTTPException(status_code=503, detail="AI service not available")
+
+    # Đo thời gian từng bước -> header Server-Timing
+    timer = get_stage_timer(request)
+
+    # 🔥 QUẢN LÝ CHAT SESSION
+    session_id = req.session_id
+    
+    with timer.stage("session"):
+        # Tạo session mới nếu chưa có
+        if not session_id:
+            session = create_session(db)
+            session_id = session.id
+        else:
+            # Kiểm tra session có tồn tại không (lấy kèm các tin nhắn gần nhất)
+            session = _load_session(db, session_id)
+            if not session:
+                # Session không tồn tại, tạo mới
+                session = create_session(db)
+                session_id = session.id
+    request.state.chat_session_id = session_id  # traffic capture đọc lại sau khi xử lý xong
+    
+    # Lưu tin nhắn của user
+    with timer.stage("persist_user"):
+        add_message(db, session_id, "user", req.message)
+    
+    # Tin nhắn sau summary (lấy trước khi lưu tin nhắn hiện tại), session mới thì chưa có
+    history_messages = getattr(session, "recent_messages", [])
+    summary = session.summary if session else None
+    ai_reply, intent, persist = await _answer(
+        ai, db, timer, req.message, history_messages, summary, session_key=session_id, custom_prompt=req.system_prompt
+    )
+    request.state.chat_intent = intent
+    if not persist:
+        return ChatResponse(reply=ai_reply)
 
     # Lưu assistant reply
-    add_message(db, session_id, "assistant", ai_reply)
+    with timer.stage("persist_reply"):
+        add_message(db, session_id, "assistant", ai_reply)
+
+        # Tóm tắt lại các lượt cũ trong background khi đã tích lũy đủ
+        if needs_summary_refresh(count_messages(db, session_id), session.summary_message_count or 0):
+            background_tasks.add_task(refresh_session_summary, ai, session_id)
 
     return ChatResponse(reply=ai_reply, session_id=session_id)
+
+
+@router.post("/batch", response_model=list[ChatBatchResult])
+async def chat_batch_endpoint(
+    reqs: list[ChatRequest], request: Request, background_tasks: BackgroundTasks,
+    stream: bool = False, db: Session = Depends(database.get_db),
+):
+    """Xử lý nhiều tin nhắn trong một request (pipeline đánh giá/QA).
+
+    Các tin nhắn cùng session_id chạy tuần tự theo thứ tự gửi (lượt sau thấy lượt trước),
+    các session khác nhau chạy song song tối đa CHAT_BATCH_CONCURRENCY lượt. Session mới
+    được tạo bằng một câu INSERT, tin nhắn được ghi hàng loạt mỗi CHAT_BATCH_FLUSH_SIZE dòng.
+    Kết quả giữ đúng thứ tự request; `?stream=true` trả NDJSON, mỗi dòng gửi ngay khi
+    các lượt trước nó đã xong.
+    """
+    ai: AIClient = request.app.state.ai_client
+    if ai is None:
+        raise HTTPException(status_code=503, detail="AI service not available")
+    if len(reqs) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {BATCH_MAX_ITEMS} tin nhắn mỗi batch")
+
+    # Timer của request chỉ đo các stage cấp batch (session, catalog, persist); mỗi lượt chạy
+    # song song có timer riêng, cộng chung vào đây thì Server-Timing bị thổi phồng
+    timer = get_stage_timer(request)
+
+    with timer.stage("session"):
+        # Nhóm theo session: request không có session_id là một session mới riêng
+        groups = {}
+        for index, req in enumerate(reqs):
+            groups.setdefault(req.session_id or index, []).append(index)
+
+        states, missing = {}, []
+        for key in groups:
+            session = None
+            if isinstance(key, str):
+                session = _load_session(db, key)
+            if session:
+                states[key] = SimpleNamespace(
+                    id=key, history=list(getattr(session, "recent_messages", [])), summary=session.summary,
+                    summary_message_count=session.summary_message_count or 0, persisted=0, new=False,
+                )
+            else:
+                missing.append(key)
+        for key, session_id in zip(missing, create_sessions(db, len(missing))):
+            states[key] = SimpleNamespace(
+                id=session_id, history=[], summary=None, summary_message_count=0, persisted=0, new=True,
+            )
+
+    # Dựng catalog context/recommender một lần trước khi các lượt chạy song song
+    with timer.stage("catalog"):
+        get_db_context(db)
+        if RECO_ENABLED:
+            get_recommender(db)
+
+    # Stream: get_db đóng session của request ngay khi endpoint return, các lượt chạy sau đó
+    # dùng session riêng (đóng trong ndjson() sau finish())
+    work_db = database.SessionLocal() if stream else db
+
+    loop = asyncio.get_running_loop()
+    results = [loop.create_future() for _ in reqs]
+    semaphore = asyncio.Semaphore(max(BATCH_CONCURRENCY, 1))
+    pending, persist_errors = [], {}  # pending: (index, state, row)
+
+    def flush():
+        if not pending:
+            return
+        batch = pending[:]
+        pending.clear()
+        try:
+            with timer.stage("persist"):
+                add_messages_bulk(work_db, [row for _, _, row in batch])
+        except Exception as e:
+            # Lỗi chỉ ảnh hưởng các lượt trong lần ghi này, các session khác vẫn chạy tiếp
+            work_db.rollback()
+            print(f"Chat batch persist error ({len(batch)} messages): {e}")
+            for index, state, _ in batch:
+                state.persisted -= 1
+                persist_errors[index] = f"Không lưu được tin nhắn: {e}"
+
+    def with_persist_error(result):
+        error = persist_errors.get(result.index)
+        if error and not result.error:
+            return result.model_copy(update={"error": error})
+        return result
+
+    async def run_group(key, indices):
+        state = states[key]
+        for index in indices:
+            req = reqs[index]
+            user_at = datetime.utcnow()
+            turn_timer = StageTimer("chat_batch_turn")
+            try:
+                async with semaphore:
+                    reply, _, persist = await _answer(
+                        ai, work_db, turn_timer, req.message, state.history[-HISTORY_LIMIT:], state.summary,
+                        session_key=state.id, custom_prompt=req.system_prompt,
+                    )
+                result = ChatBatchResult(index=index, reply=reply, session_id=state.id if persist else None)
+            except Exception as e:
+                reply, persist = None, False
+                result = ChatBatchResult(index=index, session_id=state.id, error=str(e))
+            finally:
+                turn_timer.finish()
+
+            # Giống /chat/: tin nhắn user luôn được lưu, câu trả lời CRUD thì không
+            pending.append((index, state, (state.id, "user", req.message, user_at)))
+            state.history.append(SimpleNamespace(role="user", content=req.message))
+            if persist:
+                assistant_at = max(datetime.utcnow(), user_at + timedelta(microseconds=1))
+                pending.append((index, state, (state.id, "assistant", reply, assistant_at)))
+                state.history.append(SimpleNamespace(role="assistant", content=reply))
+            state.persisted += 2 if persist else 1
+            if len(pending) >= BATCH_FLUSH_SIZE:
+                flush()
+            results[index].set_result(with_persist_error(result))
+
+    tasks = [asyncio.create_task(run_group(key, indices)) for key, indices in groups.items()]
+
+    def finish():
+        flush()
+        # Tóm tắt lại các session đã tích lũy đủ tin nhắn cũ
+        for state in states.values():
+            total = state.persisted if state.new else count_messages(work_db, state.id)
+            if needs_summary_refresh(total, state.summary_message_count):
+                background_tasks.add_task(refresh_session_summary, ai, state.id)
+
+    if not stream:
+        await asyncio.gather(*tasks)
+        finish()
+        return [with_persist_error(future.result()) for future in results]
+
+    async def ndjson():
+        try:
+            for future in results:
+                yield (await future).model_dump_json() + "\n"
+        finally:
+            # Client ngắt giữa chừng: dừng các lượt còn lại, vẫn ghi những gì đã xong
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                finish()
+            finally:
+                work_db.close()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+def _catalog_snapshot(db: Session, snapshot=None):
+    """Catalog context + recommender giữ trong state của WebSocket, chỉ lấy lại khi catalog version đổi"""
+    version = catalog_version()
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    return SimpleNamespace(
+        version=version, context=get_db_context(db), recommender=get_recommender(db) if RECO_ENABLED else None,
+    )
+
+
+def _persist_messages(rows: list):
+    """Ghi tin nhắn bằng DB session riêng (chạy trong thread, không chặn event loop)"""
+    db = database.SessionLocal()
+    try:
+        add_messages_bulk(db, rows)
+    finally:
+        db.close()
+
+
+def _read_summary(session_id: str) -> tuple:
+    db = database.SessionLocal()
+    try:
+        session = get_session(db, session_id)
+        return (session.summary, session.summary_message_count or 0) if session else (None, 0)
+    finally:
+        db.close()
+
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, session_id: str = None):
+    """Chat qua WebSocket: session gắn với connection, token được stream về client.
+
+    Client gửi `{"message": "...", "system_prompt": "..."}` (hoặc text thuần). Server gửi
+    `{"type": "session", "session_id"}` khi kết nối, `{"type": "token", "text"}` trong lúc
+    sinh, `{"type": "done", "reply", "session_id"}` khi xong và `{"type": "error", "error"}`
+    nếu lượt đó lỗi. Lịch sử, summary và catalog snapshot nằm trong state của connection
+    (không đọc lại DB mỗi lượt); tin nhắn được ghi DB bằng task nền.
+    """
+    ai: AIClient = websocket.app.state.ai_client
+    if ai is None:
+        await websocket.close(code=1011, reason="AI service not available")
+        return
+    await websocket.accept()
+
+    db = database.SessionLocal()
+    session = _load_session(db, session_id) if session_id else None
+    if session:
+        state = SimpleNamespace(
+            id=session_id, history=list(getattr(session, "recent_messages", [])), summary=session.summary,
+            summary_message_count=session.summary_message_count or 0, message_count=count_messages(db, session_id),
+        )
+    else:
+        state = SimpleNamespace(
+            id=create_session(db).id, history=[], summary=None, summary_message_count=0, message_count=0,
+        )
+    state.catalog = _catalog_snapshot(db)
+    state.refresh_task = None
+    # Trả connection về pool: socket có thể mở rất lâu giữa các lượt
+    db.close()
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def writer():
+        # None trong hàng đợi: ghi nốt phần còn lại rồi dừng
+        while True:
+            items = [await queue.get()]
+            while not queue.empty():
+                items.append(queue.get_nowait())
+            rows = [item for item in items if item is not None]
+            if rows:
+                try:
+                    await asyncio.to_thread(_persist_messages, rows)
+                except Exception as e:
+                    print(f"WebSocket persist error ({state.id}): {e}")
+            for _ in items:
+                queue.task_done()
+            if len(rows) < len(items):
+                return
+
+    async def refresh_summary():
+        # Tin nhắn phải vào DB trước khi tóm tắt
+        await queue.join()
+        await refresh_session_summary(ai, state.id)
+        state.summary, state.summary_message_count = await asyncio.to_thread(_read_summary, state.id)
+        state.history = unsummarized(state.history, state.message_count, state.summary_message_count)
+
+    async def send_token(text: str):
+        await websocket.send_json({"type": "token", "text": text})
+
+    writer_task = asyncio.create_task(writer())
+    try:
+        await websocket.send_json({"type": "session", "session_id": state.id})
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                payload = json.loads(raw)
+            except json.JSONDecodeError:
+                payload = {"message": raw}
+            if not isinstance(payload, dict) or not str(payload.get("message") or "").strip():
+                await websocket.send_json({"type": "error", "error": "Thiếu 'message'"})
+                continue
+            message = str(payload["message"])
+
+            user_at = datetime.utcnow()
+            queue.put_nowait((state.id, "user", message, user_at))
+            timer = StageTimer("chat_ws")
+            try:
+                state.catalog = _catalog_snapshot(db, state.catalog)
+                reply, _, persist = await _answer(
+                    ai, db, timer, message, state.history, state.summary, session_key=state.id,
+                    custom_prompt=payload.get("system_prompt"), on_token=send_token, catalog=state.catalog,
+                )
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                reply, persist = None, False
+                await websocket.send_json({"type": "error", "error": str(e)})
+            finally:
+                db.close()
+                timer.finish()
+
+            state.history.append(SimpleNamespace(role="user", content=message))
+            state.message_count += 1
+            if persist:
+                queue.put_nowait((state.id, "assistant", reply, max(datetime.utcnow(), user_at + timedelta(microseconds=1))))
+                state.history.append(SimpleNamespace(role="assistant", content=reply))
+                state.message_count += 1
+            state.history = unsummarized(state.history, state.message_count, state.summary_message_count)
+            if reply is not None:
+                await websocket.send_json({"type": "done", "reply": reply, "session_id": state.id})
+
+            if needs_summary_refresh(state.message_count, state.summary_message_count) and (
+                state.refresh_task is None or state.refresh_task.done()
+            ):
+                state.refresh_task = asyncio.create_task(refresh_summary())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Ghi nốt hàng đợi trước khi đóng; shield để vẫn ghi xong khi handler bị cancel (client ngắt, shutdown)
+        db.close()
+        queue.put_nowait(None)
+        await asyncio.shield(writer_task)
@@ -1,8 +1,9 @@
 import database
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from schemas.headphone import Headphone, HeadphoneCreate, HeadphoneUpdate
+from schemas.headphone import Headphone, HeadphoneCreate, HeadphoneUpdate, HeadphoneSearchResult
 from crud.headphone import get_headphones, create_headphone, get_headphone_by_slug
+from services.product_search import search_headphones
 
 router = APIRouter(prefix="/headphones", tags=["Headphones"])
 
@@ -13,6 +14,22 @@ def get_all_headphones(db: Session = Depends(database.get_db)):
     except Exception as e:
         print(f"Error in get_all_headphones: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Khai báo trước "/{slug}" để "search" không bị hiểu là slug
+@router.get("/search", response_model=HeadphoneSearchResult)
+def search_headphones_endpoint(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(database.get_db),
+):
+    """Tìm tai nghe theo tên/brand/type, không phân biệt dấu và chịu lỗi gõ"""
+    try:
+        result = search_headphones(db, q, limit, offset)
+        return {"query": q, "limit": limit, "offset": offset, **result}
+    except Exception as e:
+        print(f"Error in search_headphones_endpoint: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
     
 @router.get("/{slug}", response_model=Headphone)
 def get_headphone_by_slug_endpoint(slug: str, db: Session = Depends(database.get_db)):
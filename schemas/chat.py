@@ -33,7 +33,28 @@ class ChatSession(ChatSessionBase):
     id: str
     created_at: datetime
     updated_at: datetime
+    summary: Optional[str] = None
+    summary_message_count: int = 0
     messages: List[ChatMessage] = []
+    archived: bool = False  # True khi đọc từ file archive (services.session_archive)
 
     class Config:
         from_attributes = True
+
+
+class ChatSessionListItem(ChatSessionBase):
+    id: str
+    created_at: datetime
+    updated_at: datetime
+    message_count: int = 0
+    last_message_at: Optional[datetime] = None
+    last_message_role: Optional[str] = None
+    last_message_preview: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ChatSessionPage(BaseModel):
+    items: List[ChatSessionListItem]
+    next_cursor: Optional[str] = None  # Truyền lại qua ?cursor= để lấy trang tiếp theo
@@ -1,4 +1,4 @@
-from typing import Optional, Any
+from typing import Optional, Any, Literal
 from pydantic import BaseModel
 
 
@@ -13,11 +13,18 @@ class ChatResponse(BaseModel):
     session_id: Optional[str] = None  # Trả về session_id để client lưu lại
 
 
+class ChatBatchResult(ChatResponse):
+    index: int  # Vị trí trong request /chat/batch
+    reply: Optional[str] = None
+    error: Optional[str] = None  # Lỗi của riêng lượt này (các lượt khác vẫn chạy)
+
+
 class CRUDRequest(BaseModel):
-    action: str  # 'create' | 'read' | 'update' | 'delete'
-    resource: str  # 'headphone' | 'brand' | 'type'
+    action: Literal["create", "read", "update", "delete", "create_bulk"]
+    resource: Literal["headphone", "brand", "type"]
     id: Optional[str] = None
     data: Optional[dict[str, Any]] = None
+    items: Optional[list[dict[str, Any]]] = None  # Cho create_bulk
 
 
 class CRUDResponse(BaseModel):
@@ -70,4 +70,21 @@ class Headphone(HeadphoneBase):
 
     class Config:
         from_attributes = True
-        
\ No newline at end of file
+        
+
+class HeadphoneSearchItem(BaseModel):
+    id: str
+    name: str
+    slug: Optional[str] = None
+    price: Optional[int] = None
+    brand_name: Optional[str] = None
+    type_name: Optional[str] = None
+    score: float
+
+
+class HeadphoneSearchResult(BaseModel):
+    query: str
+    total: int
+    limit: int
+    offset: int
+    items: list[HeadphoneSearchItem]
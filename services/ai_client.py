@@ -1,50 +1,345 @@
+import asyncio
+import json
 import os
-from typing import Optional
+import random
+import time
+import zlib
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional, Tuple
 
 import httpx
 
+from services.json_stream import JSONObjectExtractor
+from services.metrics import LLM_UNEXPECTED_RESPONSES, record_llm_call
+
+
+# Status code mà backend chưa xử lý request (hoặc đang quá tải) -> an toàn để gửi lại
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+async def _prepend(first: Optional[str], rest: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Trả lại dòng đầu tiên đã đọc (lúc chờ byte đầu tiên) rồi tới phần còn lại"""
+    if first is not None:
+        yield first
+    async for item in rest:
+        yield item
+
+
+class HedgePolicy:
+    """Chính sách hedged request + retry cho AIClient.
+
+    - Nếu request đầu tiên chưa có byte phản hồi nào sau ngưỡng percentile của
+      time-to-first-byte (đo trên các stream gần nhất), gửi một request trùng lặp
+      tới endpoint khác, lấy kết quả về trước và huỷ request còn lại. Chỉ có một
+      endpoint thì không hedge.
+    - Lỗi kết nối / status tạm thời được retry với exponential backoff + full jitter.
+
+    Environment variables:
+    - `AI_HEDGE_ENABLED`: bật hedging ("1"/"true")
+    - `AI_HEDGE_PERCENTILE`: percentile latency dùng làm ngưỡng (default 95)
+    - `AI_HEDGE_MIN_DELAY` / `AI_HEDGE_MAX_DELAY`: chặn dưới/trên của ngưỡng (giây)
+    - `AI_MAX_RETRIES`: số lần retry tối đa (default 2)
+    - `AI_RETRY_BASE_DELAY`: delay backoff cơ sở (giây, default 0.25)
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        percentile: float = 95.0,
+        min_delay: float = 1.0,
+        max_delay: float = 20.0,
+        max_retries: int = 2,
+        retry_base_delay: float = 0.25,
+        retry_max_delay: float = 4.0,
+        window: int = 200,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        # Latency tới byte đầu tiên của các request gần nhất
+        self._latencies = deque(maxlen=window)
+
+    @classmethod
+    def from_env(cls) -> "HedgePolicy":
+        return cls(
+            enabled=os.getenv("AI_HEDGE_ENABLED", "").lower() in ("1", "true", "yes"),
+            percentile=float(os.getenv("AI_HEDGE_PERCENTILE", "95")),
+            min_delay=float(os.getenv("AI_HEDGE_MIN_DELAY", "1.0")),
+            max_delay=float(os.getenv("AI_HEDGE_MAX_DELAY", "20.0")),
+            max_retries=int(os.getenv("AI_MAX_RETRIES", "2")),
+            retry_base_delay=float(os.getenv("AI_RETRY_BASE_DELAY", "0.25")),
+        )
+
+    def observe(self, latency: float):
+        """Ghi nhận latency tới byte đầu tiên của một request thành công"""
+        self._latencies.append(latency)
+
+    def hedge_delay(self) -> float:
+        """Ngưỡng chờ trước khi gửi request dự phòng"""
+        if len(self._latencies) < 10:
+            # Chưa đủ mẫu -> dùng ngưỡng trên cho an toàn
+            return self.max_delay
+        ordered = sorted(self._latencies)
+        idx = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return min(self.max_delay, max(self.min_delay, ordered[idx]))
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff với full jitter"""
+        cap = min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt))
+        return random.uniform(0, cap)
+
 
 class AIClient:
     # """OpenAI-compatible AI client for LM Studio.
 
     # Environment variables:
     # - `AI_API_URL`: URL to LM Studio API (e.g., http://localhost:1234/v1/chat/completions)
+    # - `AI_API_URLS`: optional comma-separated extra endpoints used for hedged requests
     # - `AI_MODEL`: model identifier (default `mistralai/mistral-7b-instruct-v0.3`)
     # - `AI_API_KEY`: optional Bearer token
+    # - `AI_STRUCTURED_OUTPUT`: optional `json_schema` (OpenAI response_format) or `gbnf` (llama.cpp grammar)
+    # - `AI_PROMPT_CACHE`: send llama.cpp `cache_prompt` so the shared prefix KV cache is reused
+    # - `AI_SLOT_COUNT`: number of llama.cpp server slots; pins each session to one slot (`id_slot`)
+    # - `AI_MERGE_SYSTEM`: fold system messages into the first user turn (chat templates without system role)
     # """
 
-    def __init__(self, api_url: Optional[str] = None, model: Optional[str] = None, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_url: Optional[str] = None,
+        model: Optional[str] = None,
+        api_key: Optional[str] = None,
+        fallback_urls: Optional[List[str]] = None,
+        hedge: Optional[HedgePolicy] = None,
+        structured_output: Optional[str] = None,
+    ):
         self.api_url = api_url or os.getenv("AI_API_URL")
         self.model = model or os.getenv("AI_MODEL", "mistralai/mistral-7b-instruct-v0.3")
         self.api_key = api_key or os.getenv("AI_API_KEY")
         if not self.api_url:
             raise ValueError("AI_API_URL must be set to call the model endpoint")
 
-    async def generate(self, prompt: str, max_tokens: int = 512, temperature: float = 0.7) -> str:
-        """Send prompt to LM Studio using OpenAI-compatible API format.
-        
-        LM Studio uses the OpenAI chat completions format:
-        POST /v1/chat/completions
-        """
+        if fallback_urls is None:
+            fallback_urls = [u.strip() for u in os.getenv("AI_API_URLS", "").split(",") if u.strip()]
+        self.endpoints = [self.api_url] + [u for u in fallback_urls if u != self.api_url]
+        self.hedge = hedge or HedgePolicy.from_env()
+        self._next_endpoint = 0
+
+        self.structured_output = (structured_output or os.getenv("AI_STRUCTURED_OUTPUT", "")).lower() or None
+        if self.structured_output not in (None, "json_schema", "gbnf"):
+            raise ValueError("AI_STRUCTURED_OUTPUT must be 'json_schema' or 'gbnf'")
+
+        self.prompt_cache = os.getenv("AI_PROMPT_CACHE", "").lower() in ("1", "true", "yes")
+        self.slot_count = int(os.getenv("AI_SLOT_COUNT", "0"))
+        self.merge_system = os.getenv("AI_MERGE_SYSTEM", "").lower() in ("1", "true", "yes")
+
+    def _headers(self) -> dict:
         headers = {"Content-Type": "application/json"}
         if self.api_key:
             headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _pick_endpoint(self) -> str:
+        """Round-robin giữa các endpoint (chỉ 1 endpoint thì luôn dùng nó)"""
+        url = self.endpoints[self._next_endpoint % len(self.endpoints)]
+        self._next_endpoint += 1
+        return url
+
+    async def _post_once(self, client: httpx.AsyncClient, url: str, payload: dict) -> Tuple[dict, float]:
+        started = time.perf_counter()
+        async with client.stream("POST", url, json=payload, headers=self._headers()) as resp:
+            # Headers đã về = byte đầu tiên đã tới (non-streaming: thường là khi đã sinh xong)
+            first_byte = time.perf_counter() - started
+            body = await resp.aread()
+            resp.raise_for_status()
+        return json.loads(body), first_byte
+
+    @staticmethod
+    def _is_retryable(exc: Exception) -> bool:
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code in RETRYABLE_STATUS_CODES
+        return isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError))
+
+    async def _post(self, payload: dict) -> Tuple[dict, float]:
+        """Gửi request (retry), trả về (response JSON, thời gian tới byte đầu tiên)"""
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            attempt = 0
+            while True:
+                try:
+                    return await self._post_once(client, self._pick_endpoint(), payload)
+                except Exception as e:
+                    if attempt >= self.hedge.max_retries or not self._is_retryable(e):
+                        raise
+                    delay = self.hedge.backoff(attempt)
+                    attempt += 1
+                    print(f"AI request failed ({e!r}), retry {attempt}/{self.hedge.max_retries} in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+
+    def _backup_endpoint(self, primary: str) -> Optional[str]:
+        """Endpoint khác cho request dự phòng (gửi trùng vào cùng backend chỉ làm nó chậm thêm)"""
+        if len(self.endpoints) < 2:
+            return None
+        return self.endpoints[(self.endpoints.index(primary) + 1) % len(self.endpoints)]
 
+    async def _open_stream_once(self, client: httpx.AsyncClient, url: str, payload: dict):
+        """Mở request stream và chờ tới dòng đầu tiên; trả về (response, các dòng, thời gian tới byte đầu tiên)"""
+        started = time.perf_counter()
+        resp = await client.send(client.build_request("POST", url, json=payload, headers=self._headers()), stream=True)
+        try:
+            if resp.is_error:
+                await resp.aread()
+            resp.raise_for_status()
+            rest = resp.aiter_lines()
+            first = await anext(rest, None)
+        except BaseException:
+            await resp.aclose()
+            raise
+        return resp, _prepend(first, rest), time.perf_counter() - started
+
+    async def _open_stream_hedged(self, client: httpx.AsyncClient, payload: dict):
+        """Chưa có byte đầu tiên sau ngưỡng percentile thì mở thêm stream tới endpoint khác"""
+        url = self._pick_endpoint()
+        primary = asyncio.create_task(self._open_stream_once(client, url, payload))
+        backup_url = self._backup_endpoint(url) if self.hedge.enabled else None
+        if backup_url is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge.hedge_delay())
+        if done:
+            return primary.result()
+
+        backup = asyncio.create_task(self._open_stream_once(client, backup_url, payload))
+        pending = {primary, backup}
+        winner, error = None, None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        await task.result()[0].aclose()
+            if winner is None:
+                raise error
+            return winner
+        finally:
+            # Huỷ stream thua cuộc (kể cả stream vừa mở xong khi đang huỷ)
+            for task in pending:
+                task.cancel()
+            for result in await asyncio.gather(*pending, return_exceptions=True):
+                if isinstance(result, tuple):
+                    await result[0].aclose()
+
+    async def _open_stream(self, client: httpx.AsyncClient, payload: dict):
+        """Mở stream (hedge + retry như `_post`); chỉ retry trước byte đầu tiên nên không lặp token"""
+        attempt = 0
+        while True:
+            try:
+                resp, lines, first_byte = await self._open_stream_hedged(client, payload)
+                self.hedge.observe(first_byte)
+                return resp, lines
+            except Exception as e:
+                if attempt >= self.hedge.max_retries or not self._is_retryable(e):
+                    raise
+                delay = self.hedge.backoff(attempt)
+                attempt += 1
+                print(f"AI stream failed to open ({e!r}), retry {attempt}/{self.hedge.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def _build_messages(self, prompt: Optional[str], messages: Optional[List[dict]]) -> List[dict]:
+        if messages is None:
+            return [{"role": "user", "content": prompt}]
+        if not self.merge_system:
+            return messages
+
+        # Gộp system vào lượt user đầu tiên, giữ nguyên thứ tự để prefix vẫn ổn định
+        system_parts = [m["content"] for m in messages if m["role"] == "system"]
+        rest = [dict(m) for m in messages if m["role"] != "system"]
+        if system_parts:
+            system_text = "\n\n".join(system_parts)
+            if rest and rest[0]["role"] == "user":
+                rest[0]["content"] = f"{system_text}\n\n{rest[0]['content']}"
+            else:
+                rest.insert(0, {"role": "user", "content": system_text})
+        return rest
+
+    def _build_payload(
+        self,
+        prompt: Optional[str],
+        messages: Optional[List[dict]],
+        max_tokens: int,
+        temperature: float,
+        stream: bool,
+        session_key: Optional[str] = None,
+    ) -> dict:
         # OpenAI-compatible format that LM Studio expects
         payload = {
             "model": self.model,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
+            "messages": self._build_messages(prompt, messages),
             "max_tokens": max_tokens,
             "temperature": temperature,
-            "stream": False
+            "stream": stream
         }
+        if self.prompt_cache:
+            payload["cache_prompt"] = True
+        if self.slot_count > 0 and session_key:
+            # Cùng session -> cùng slot -> KV cache của lượt trước còn nguyên
+            payload["id_slot"] = zlib.crc32(session_key.encode("utf-8")) % self.slot_count
+        return payload
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            resp = await client.post(self.api_url, json=payload, headers=headers)
-            resp.raise_for_status()
-            data = resp.json()
+    async def generate(
+        self,
+        prompt: Optional[str] = None,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        messages: Optional[List[dict]] = None,
+        session_key: Optional[str] = None,
+        intent: str = "general",
+    ) -> str:
+        """Send prompt to LM Studio using OpenAI-compatible API format.
+
+        LM Studio uses the OpenAI chat completions format:
+        POST /v1/chat/completions
+
+        Truyền `messages` (system, catalog, các lượt trước, lượt mới) thay cho
+        `prompt` để backend tái sử dụng KV cache của phần prefix cố định.
+        `intent` chỉ dùng làm label cho metrics.
+        """
+        if self.hedge.enabled and len(self.endpoints) > 1:
+            # Response non-streaming chỉ có byte đầu tiên khi đã sinh xong, không hedge theo
+            # time-to-first-byte được -> đi qua stream (hedge khi mở stream) rồi ghép lại
+            chunks = self.stream(
+                prompt, max_tokens=max_tokens, temperature=temperature, messages=messages,
+                session_key=session_key, intent=intent,
+            )
+            async with aclosing(chunks):
+                return "".join([text async for text in chunks])
+
+        payload = self._build_payload(prompt, messages, max_tokens, temperature, False, session_key)
+
+        started = time.perf_counter()
+        try:
+            data, first_byte = await self._post(payload)
+        except Exception:
+            record_llm_call(intent, self.model, "error", time.perf_counter() - started)
+            raise
+
+        usage = data.get("usage") if isinstance(data, dict) else None
+        usage = usage or {}
+        record_llm_call(
+            intent,
+            self.model,
+            "ok",
+            time.perf_counter() - started,
+            time_to_first_byte=first_byte,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+        )
 
         # Parse OpenAI-format response
         if isinstance(data, dict) and "choices" in data:
@@ -55,6 +350,117 @@ class AIClient:
                     return choice["message"].get("content", "")
                 elif "text" in choice:
                     return choice["text"]
-        
+
         # Fallback parsing
+        LLM_UNEXPECTED_RESPONSES.inc(intent=intent, model=self.model)
+        print(f"Unexpected AI response shape: {str(data)[:200]}")
         return str(data)
+
+    def _structured_fields(self, schema: Optional[dict], grammar: Optional[str], schema_name: str) -> dict:
+        """Tham số ràng buộc output theo chế độ structured_output của backend"""
+        if self.structured_output == "json_schema" and schema:
+            return {"response_format": {"type": "json_schema", "json_schema": {"name": schema_name, "schema": schema}}}
+        if self.structured_output == "gbnf" and grammar:
+            return {"grammar": grammar}
+        return {}
+
+    async def stream(
+        self,
+        prompt: Optional[str] = None,
+        max_tokens: int = 512,
+        temperature: float = 0.7,
+        extra: Optional[dict] = None,
+        messages: Optional[List[dict]] = None,
+        session_key: Optional[str] = None,
+        intent: str = "general",
+    ) -> AsyncIterator[str]:
+        """Stream completion (SSE) và yield từng đoạn text.
+
+        Request mở stream được retry/hedge giống `generate` cho tới khi có byte
+        đầu tiên; sau đó không gửi lại (token đã yield cho caller). Đóng generator (break khỏi vòng lặp) sẽ đóng connection, backend
+        (LM Studio, llama.cpp, vLLM) sẽ dừng generation tương ứng.
+        """
+        payload = self._build_payload(prompt, messages, max_tokens, temperature, True, session_key)
+        # Yêu cầu block `usage` ở chunk cuối (OpenAI / vLLM / LM Studio)
+        payload["stream_options"] = {"include_usage": True}
+        if extra:
+            payload.update(extra)
+
+        started = time.perf_counter()
+        first_token = None
+        chunk_count = 0
+        usage = {}
+        status = "error"
+        try:
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                resp, lines = await self._open_stream(client, payload)
+                try:
+                    async for line in lines:
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except json.JSONDecodeError:
+                            continue
+                        usage = chunk.get("usage") or usage
+                        for choice in chunk.get("choices") or []:
+                            delta = choice.get("delta") or {}
+                            text = delta.get("content") or choice.get("text")
+                            if text:
+                                if first_token is None:
+                                    first_token = time.perf_counter() - started
+                                chunk_count += 1
+                                yield text
+                finally:
+                    await resp.aclose()
+            status = "ok"
+        except GeneratorExit:
+            # Caller dừng sớm (vd. JSON object đã đóng)
+            status = "cancelled"
+            raise
+        finally:
+            total = time.perf_counter() - started
+            record_llm_call(
+                intent,
+                self.model,
+                status,
+                total,
+                time_to_first_byte=first_token,
+                prompt_tokens=usage.get("prompt_tokens"),
+                # Không có usage -> mỗi chunk xấp xỉ một token
+                completion_tokens=usage.get("completion_tokens", chunk_count),
+                generation_time=total - first_token if first_token is not None else None,
+            )
+
+    async def generate_json_object(
+        self,
+        prompt: Optional[str] = None,
+        max_tokens: int = 512,
+        temperature: float = 0,
+        schema: Optional[dict] = None,
+        grammar: Optional[str] = None,
+        schema_name: str = "response",
+        messages: Optional[List[dict]] = None,
+        session_key: Optional[str] = None,
+        intent: str = "product_management",
+    ) -> JSONObjectExtractor:
+        """Stream completion qua JSONObjectExtractor, dừng ngay khi JSON object top-level đóng.
+
+        Nếu bật structured_output, `schema`/`grammar` được gửi kèm để backend
+        chỉ sinh JSON hợp lệ. `session_key` giữ request trên cùng slot (id_slot)
+        để dùng lại prefix cache như các lượt chat.
+        """
+        extractor = JSONObjectExtractor()
+        extra = self._structured_fields(schema, grammar, schema_name)
+        chunks = self.stream(
+            prompt, max_tokens=max_tokens, temperature=temperature, extra=extra, messages=messages,
+            session_key=session_key, intent=intent,
+        )
+        async with aclosing(chunks):
+            async for text in chunks:
+                if extractor.feed(text):
+                    break
+        return extractor
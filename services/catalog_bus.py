@@ -0,0 +1,186 @@
+"""
+Bus invalidation cache catalog (brands, types, headphones) giữa các worker/node.
+
+Mỗi hàm ghi trong crud gọi `mark_catalog_changed(db, resource)` ngay trước commit:
+- Trong process: sau khi commit thành công, catalog version tăng và các callback chạy.
+- PostgreSQL: `pg_notify` chạy trong cùng transaction nên chỉ được gửi khi commit
+  thành công; mỗi worker có một thread LISTEN nhận và tăng version của mình.
+- Database khác (SQLite dev): chỉ có bus trong process, dùng khi chạy 1 worker.
+
+Environment variables:
+- `CATALOG_CACHE_TTL`: tuổi tối đa (giây) của cache catalog, lưới an toàn khi mất
+  notification (default 300, 0 = không giới hạn)
+"""
+import os
+import select
+import threading
+import time
+import uuid
+from typing import Callable, List
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from database import engine
+
+CHANNEL = "catalog_changed"
+# Phân biệt notification do chính process này gửi (pid có thể trùng giữa các node)
+INSTANCE_ID = uuid.uuid4().hex[:12]
+CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+
+_version = 0
+_lock = threading.Lock()
+_callbacks: List[Callable[[int, str], None]] = []
+_listener = None
+_stop = threading.Event()
+
+
+def catalog_version() -> int:
+    return _version
+
+
+def on_catalog_change(callback: Callable[[int, str], None]):
+    """Đăng ký callback(version, resource), gọi mỗi khi catalog đổi (kể cả từ worker khác)"""
+    _callbacks.append(callback)
+    return callback
+
+
+def _bump(resource: str):
+    global _version
+    with _lock:
+        _version += 1
+        version = _version
+    for callback in list(_callbacks):
+        try:
+            callback(version, resource)
+        except Exception as e:
+            print(f"Catalog change callback error: {e}")
+
+
+def _is_postgres() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def mark_catalog_changed(db: Session, resource: str):
+    """Gọi trước `db.commit()` trong các hàm ghi catalog"""
+    db.info.setdefault("catalog_changed", set()).add(resource)
+    if _is_postgres():
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": f"{INSTANCE_ID}:{resource}"})
+
+
+def publish_catalog_changes(db: Session):
+    """Tăng version cho các thay đổi của session có `defer_catalog_changes`, gọi sau khi
+    transaction ngoài (vd batch dùng SAVEPOINT) đã commit"""
+    for resource in db.info.pop("catalog_changed", ()):
+        _bump(resource)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(db: Session):
+    if db.info.get("defer_catalog_changes"):
+        # Commit của session chỉ là SAVEPOINT, dữ liệu chưa hiển thị với worker khác
+        return
+    for resource in db.info.pop("catalog_changed", ()):
+        _bump(resource)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(db: Session):
+    if db.info.get("defer_catalog_changes"):
+        # Chỉ rollback SAVEPOINT (vd lỗi một item trong hàm bulk), thay đổi trước đó vẫn còn;
+        # transaction ngoài rollback thì bên gọi bỏ qua bằng discard_catalog_changes
+        return
+    db.info.pop("catalog_changed", None)
+
+
+def discard_catalog_changes(db: Session):
+    """Bỏ các thay đổi đang chờ của session `defer_catalog_changes` khi transaction ngoài rollback"""
+    db.info.pop("catalog_changed", None)
+
+
+class CatalogCache:
+    """Giá trị dựng từ catalog (context, index...), tự dựng lại khi catalog version đổi"""
+
+    def __init__(self, max_age: float = CACHE_TTL):
+        self.max_age = max_age
+        self._value = None
+        self._version = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, build: Callable[[], object]):
+        version = _version
+        if self._version == version and (not self.max_age or time.monotonic() - self._built_at < self.max_age):
+            return self._value
+        with self._lock:
+            if self._version == version and (not self.max_age or time.monotonic() - self._built_at < self.max_age):
+                return self._value
+            # Lấy version trước khi dựng: nếu catalog đổi trong lúc dựng, lần sau sẽ dựng lại
+            value = build()
+            self._value, self._version, self._built_at = value, version, time.monotonic()
+            return value
+
+    def peek(self):
+        """Giá trị hiện có (có thể đã cũ), dùng để dựng lại từng phần"""
+        return self._value
+
+    def clear(self):
+        with self._lock:
+            self._value, self._version = None, None
+
+
+def _listen_loop():
+    """LISTEN trên connection riêng (psycopg2); tự kết nối lại khi mất kết nối"""
+    while not _stop.is_set():
+        raw = None
+        try:
+            raw = engine.raw_connection()
+            conn = raw.driver_connection
+            # Tách khỏi pool: connection autocommit + LISTEN không được trả lại cho request khác,
+            # raw.close() trong finally đóng hẳn connection
+            raw.detach()
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {CHANNEL}")
+            # Có thể đã lỡ notification khi mất kết nối -> coi như catalog đã đổi
+            _bump("reconnect")
+            while not _stop.is_set():
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    source, _, resource = notify.payload.partition(":")
+                    if source != INSTANCE_ID:
+                        _bump(resource or "unknown")
+        except Exception as e:
+            if not _stop.is_set():
+                print(f"Catalog listener error: {e}, reconnecting in 5s")
+                _stop.wait(5)
+        finally:
+            if raw is not None:
+                try:
+                    raw.close()
+                except Exception:
+                    pass
+
+
+def start_catalog_listener():
+    """Khởi động thread LISTEN (chỉ PostgreSQL)"""
+    global _listener
+    if not _is_postgres() or _listener is not None:
+        return
+    if engine.dialect.driver != "psycopg2":
+        # Vòng LISTEN dùng poll()/notifies của psycopg2
+        print(f"Warning: catalog listener cần driver psycopg2 (đang dùng {engine.dialect.driver}), "
+              f"cache catalog của worker khác chỉ làm mới theo CATALOG_CACHE_TTL")
+        return
+    _stop.clear()
+    _listener = threading.Thread(target=_listen_loop, name="catalog-listener", daemon=True)
+    _listener.start()
+    print(f"Catalog invalidation: LISTEN {CHANNEL}")
+
+
+def stop_catalog_listener():
+    global _listener
+    _stop.set()
+    _listener = None
@@ -0,0 +1,77 @@
+"""
+Dựng catalog context (text) cho prompt của AI
+"""
+
+
+def build_catalog_context(brands: list, types: list, headphones: list) -> str:
+    """Dựng context từ danh sách brands/types/headphones (đã sắp xếp)"""
+    context = """
+THÔNG TIN CỬA HÀNG TAI NGHE:
+
+TỔNG QUAN:"""
+    
+    context += f"\n- Có {len(brands)} thương hiệu: {', '.join([b.name for b in brands])}"
+    context += f"\n- Có {len(types)} loại sản phẩm: {', '.join([t.name for t in types])}"
+    context += f"\n- Có {len(headphones)} tai nghe trong kho"
+    
+    context += """
+
+TAI NGHE HIỆN CÓ:"""
+    
+    if headphones:
+        for h in headphones:
+            brand_name = h.brand.name if h.brand else "Không rõ"
+            type_name = h.type.name if h.type else "Không rõ" 
+            price_str = f"{h.price:,.0f}đ" if h.price else "Liên hệ"
+            context += f"\n- {h.name} ({brand_name} - {type_name}): {price_str}"
+    else:
+        context += "\n- Hiện tại chưa có tai nghe nào"
+        
+    context += """
+
+HƯỚNG DẪN TƯ VẤN:
+- Khi khách hỏi về brands: trả lời chính xác số lượng và tên các thương hiệu tai nghe
+- Khi khách hỏi về types: nói về các loại tai nghe có sẵn (bluetooth, wireless, headphones)
+- Khi khách hỏi về tai nghe: mô tả chi tiết từng tai nghe trong kho
+- Luôn dựa vào dữ liệu thực, không bịa đặt
+"""
+    
+    return context
+
+
+def build_candidate_context(brand_names: list, type_names: list, total: int) -> str:
+    """Context cố định cho tư vấn (system prompt): tổng quan catalog + hướng dẫn.
+
+    Chỉ đổi khi catalog đổi nên prefix system giữ nguyên giữa các lượt (prefix/KV cache);
+    danh sách sản phẩm phù hợp của từng lượt nằm ở build_candidate_turn.
+    """
+    return f"""
+THÔNG TIN CỬA HÀNG TAI NGHE:
+
+TỔNG QUAN:
+- Có {len(brand_names)} thương hiệu: {', '.join(brand_names)}
+- Có {len(type_names)} loại sản phẩm: {', '.join(type_names)}
+- Có {total} tai nghe trong kho
+
+HƯỚNG DẪN TƯ VẤN:
+- Mỗi câu hỏi của khách kèm danh sách tai nghe phù hợp nhất (đã lọc sẵn từ kho)
+- Chỉ gợi ý các tai nghe trong danh sách đó, kèm giá chính xác
+- Nếu không có sản phẩm phù hợp, nói rõ và hỏi thêm nhu cầu của khách
+- Luôn dựa vào dữ liệu thực, không bịa đặt
+"""
+
+
+def build_candidate_turn(candidates: list, requirements: str = "") -> str:
+    """Phần của lượt hiện tại (nối vào tin nhắn cuối của khách): yêu cầu đã trích + sản phẩm phù hợp (dict)"""
+    context = ""
+    if requirements:
+        context += f"YÊU CẦU CỦA KHÁCH: {requirements}\n\n"
+    context += "TAI NGHE PHÙ HỢP NHẤT VỚI YÊU CẦU (đã lọc sẵn từ kho):"
+
+    if candidates:
+        for h in candidates:
+            price_str = f"{h['price']:,.0f}đ" if h["price"] else "Liên hệ"
+            context += f"\n- {h['name']} ({h['brand_name'] or 'Không rõ'} - {h['type_name'] or 'Không rõ'}): {price_str}"
+    else:
+        context += "\n- Không có tai nghe nào thoả yêu cầu"
+    return context
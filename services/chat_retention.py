@@ -0,0 +1,279 @@
+"""
+Bảo trì bảng chat_messages (partition theo tháng trên created_at, PostgreSQL).
+
+- Tạo trước partition cho các tháng sắp tới. Tin nhắn thuộc tháng chưa có partition rơi vào
+  partition DEFAULT (chat_messages_default); khi tạo partition cho tháng đó, các dòng này
+  được tách ra (detach default, tạo partition, chuyển dòng, attach lại)
+- Cảnh báo (log + metric chat_messages_partition_horizon_months /
+  chat_messages_default_partition_rows) khi số tháng partition tạo sẵn còn ít hơn
+  CHAT_PARTITIONS_AHEAD hoặc partition DEFAULT có dữ liệu
+- Retention: xoá cả partition quá hạn bằng DROP TABLE (O(1), không DELETE từng dòng,
+  không để lại bloat), rồi xoá các session không còn tin nhắn nào và đếm lại
+  chat_sessions.message_count của các session còn lại
+- Database khác (SQLite dev): retention bằng DELETE theo created_at
+
+Chạy định kỳ trong app (mỗi CHAT_MAINTENANCE_INTERVAL giây) hoặc từ cron:
+    python -m services.chat_retention [--retention-months N] [--dry-run]
+
+Environment variables:
+- `CHAT_RETENTION_MONTHS`: số tháng tin nhắn được giữ, tính cả tháng hiện tại (default 0 = giữ mãi)
+- `CHAT_PARTITIONS_AHEAD`: số tháng tạo sẵn partition phía trước (default 3)
+- `CHAT_MAINTENANCE_INTERVAL`: chu kỳ chạy trong app, giây (default 3600, 0 = tắt)
+"""
+import argparse
+import asyncio
+import os
+import re
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from database import engine
+
+RETENTION_MONTHS = int(os.getenv("CHAT_RETENTION_MONTHS", "0"))
+PARTITIONS_AHEAD = int(os.getenv("CHAT_PARTITIONS_AHEAD", "3"))
+MAINTENANCE_INTERVAL = float(os.getenv("CHAT_MAINTENANCE_INTERVAL", "3600"))
+
+PARENT = "chat_messages"
+DEFAULT_PARTITION = f"{PARENT}_default"
+_PARTITION_RE = re.compile(r"^chat_messages_p(\d{4})_(\d{2})$")
+# Chỉ một worker chạy bảo trì tại một thời điểm
+_ADVISORY_LOCK_ID = 0x63686174  # "chat"
+
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_p{month:%Y_%m}"
+
+
+def retention_cutoff(retention_months: int, today: Optional[date] = None) -> date:
+    """Tin nhắn trước ngày này bị xoá (giữ `retention_months` tháng, tính cả tháng hiện tại)"""
+    return add_months((today or datetime.utcnow().date()).replace(day=1), 1 - retention_months)
+
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text("SELECT relkind FROM pg_class WHERE relname = :name"), {"name": PARENT}).scalar() == "p"
+
+
+def list_partitions(conn: Connection) -> List[date]:
+    """Tháng của các partition hiện có (theo tên chat_messages_pYYYY_MM)"""
+    rows = conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :name
+    """), {"name": PARENT}).scalars()
+    months = []
+    for name in rows:
+        match = _PARTITION_RE.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def has_default_partition(conn: Connection) -> bool:
+    return conn.execute(text("""
+        SELECT 1 FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :parent AND c.relname = :name
+    """), {"parent": PARENT, "name": DEFAULT_PARTITION}).scalar() is not None
+
+
+def default_partition_months(conn: Connection) -> List[date]:
+    """Các tháng đang có dòng nằm trong partition DEFAULT"""
+    rows = conn.execute(text(
+        f"SELECT DISTINCT date_trunc('month', created_at) FROM {DEFAULT_PARTITION}"
+    )).scalars()
+    return sorted(row.date() for row in rows)
+
+
+def default_partition_rows(conn: Connection) -> int:
+    return conn.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}")).scalar()
+
+
+def create_partition(conn: Connection, month: date, split_default: bool = False):
+    """Tạo partition cho `month`.
+
+    PostgreSQL không cho tạo partition khi partition DEFAULT đang chứa dòng thuộc khoảng đó:
+    `split_default` thì detach DEFAULT, tạo partition, chuyển các dòng sang rồi attach lại
+    (cùng transaction, giữ ACCESS EXCLUSIVE trên chat_messages trong lúc chuyển).
+    """
+    name = partition_name(month)
+    if split_default:
+        conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {DEFAULT_PARTITION}"))
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    ))
+    if split_default:
+        conn.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end RETURNING *
+            )
+            INSERT INTO {name} (id, session_id, role, content, created_at)
+            SELECT id, session_id, role, content, created_at FROM moved
+        """), {"start": month, "end": add_months(month, 1)})
+        conn.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+
+def ensure_partitions(conn: Connection, ahead: int = PARTITIONS_AHEAD, today: Optional[date] = None) -> List[str]:
+    """Tạo partition cho tháng hiện tại, `ahead` tháng tiếp theo và các tháng đang nằm trong
+    partition DEFAULT; trả về tên partition mới"""
+    current = (today or datetime.utcnow().date()).replace(day=1)
+    existing = set(list_partitions(conn))
+    has_default = has_default_partition(conn)
+    if not has_default:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+    spilled = set(default_partition_months(conn)) if has_default else set()
+    created = []
+    for month in sorted({add_months(current, n) for n in range(ahead + 1)} | spilled):
+        if month in existing:
+            continue
+        create_partition(conn, month, split_default=month in spilled)
+        created.append(partition_name(month))
+    return created
+
+
+def partition_horizon(conn: Connection, today: Optional[date] = None) -> int:
+    """Số tháng liên tiếp sau tháng hiện tại đã có partition (-1 nếu tháng hiện tại chưa có)"""
+    current = (today or datetime.utcnow().date()).replace(day=1)
+    existing = set(list_partitions(conn))
+    horizon = -1
+    while add_months(current, horizon + 1) in existing:
+        horizon += 1
+    return horizon
+
+
+def check_partitions(conn: Connection, ahead: int = PARTITIONS_AHEAD) -> dict:
+    """Cập nhật metric và cảnh báo khi partition tạo sẵn sắp hết hoặc DEFAULT có dữ liệu"""
+    from services.metrics import CHAT_DEFAULT_PARTITION_ROWS, CHAT_PARTITION_HORIZON
+
+    horizon = partition_horizon(conn)
+    default_rows = default_partition_rows(conn) if has_default_partition(conn) else 0
+    CHAT_PARTITION_HORIZON.set(horizon)
+    CHAT_DEFAULT_PARTITION_ROWS.set(default_rows)
+    if horizon < ahead:
+        print(f"WARNING: chat_messages chỉ có partition tới {horizon} tháng sau tháng hiện tại (cần {ahead})")
+    if default_rows:
+        print(f"WARNING: {default_rows} tin nhắn nằm trong {DEFAULT_PARTITION} (tháng chưa có partition)")
+    return {"horizon": horizon, "default_rows": default_rows}
+
+
+def drop_expired_partitions(conn: Connection, retention_months: int, today: Optional[date] = None, dry_run: bool = False) -> List[str]:
+    """DROP các partition nằm trọn trước mốc retention"""
+    if retention_months <= 0:
+        return []
+    cutoff = retention_cutoff(retention_months, today)
+    dropped = []
+    for month in list_partitions(conn):
+        if add_months(month, 1) <= cutoff:
+            if not dry_run:
+                conn.execute(text(f"DROP TABLE IF EXISTS {partition_name(month)}"))
+            dropped.append(partition_name(month))
+    return dropped
+
+
+def delete_expired_messages(conn: Connection, retention_months: int, today: Optional[date] = None, dry_run: bool = False) -> int:
+    """Retention cho bảng không partition (SQLite dev): DELETE theo created_at"""
+    if retention_months <= 0:
+        return 0
+    params = {"cutoff": datetime.combine(retention_cutoff(retention_months, today), datetime.min.time())}
+    if dry_run:
+        return conn.execute(text(f"SELECT count(*) FROM {PARENT} WHERE created_at < :cutoff"), params).scalar()
+    return conn.execute(text(f"DELETE FROM {PARENT} WHERE created_at < :cutoff"), params).rowcount
+
+
+def delete_empty_sessions(conn: Connection, retention_months: int, today: Optional[date] = None, dry_run: bool = False) -> int:
+    """Xoá session cũ không còn tin nhắn (tin nhắn đã hết hạn cùng partition)"""
+    if retention_months <= 0:
+        return 0
+    params = {"cutoff": datetime.combine(retention_cutoff(retention_months, today), datetime.min.time())}
+    where = f"""
+        FROM chat_sessions s
+        WHERE s.updated_at < :cutoff
+          AND NOT EXISTS (SELECT 1 FROM {PARENT} m WHERE m.session_id = s.id)
+    """
+    if dry_run:
+        return conn.execute(text(f"SELECT count(*) {where}"), params).scalar()
+    return conn.execute(text(f"DELETE FROM chat_sessions WHERE id IN (SELECT s.id {where})"), params).rowcount
+
+
+def recount_sessions(conn: Connection, retention_months: int, today: Optional[date] = None) -> int:
+    """Đếm lại message_count của các session có thể vừa mất tin nhắn (tạo trước mốc retention)"""
+    params = {"cutoff": datetime.combine(retention_cutoff(retention_months, today), datetime.min.time())}
+    return conn.execute(text(f"""
+        UPDATE chat_sessions
+        SET message_count = (SELECT count(*) FROM {PARENT} m WHERE m.session_id = chat_sessions.id)
+        WHERE created_at < :cutoff
+    """), params).rowcount
+
+
+def run_maintenance(retention_months: int = RETENTION_MONTHS, ahead: int = PARTITIONS_AHEAD, dry_run: bool = False) -> dict:
+    """Một lượt bảo trì; trả về những gì đã tạo/xoá"""
+    result = {"created": [], "dropped": [], "deleted_messages": 0, "deleted_sessions": 0, "recounted_sessions": 0}
+    partitioned = False
+    try:
+        with engine.begin() as conn:
+            if is_partitioned(conn):
+                partitioned = True
+                # Lock theo transaction: worker khác đang chạy thì bỏ qua lượt này
+                if not conn.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": _ADVISORY_LOCK_ID}).scalar():
+                    return result
+                if not dry_run:
+                    result["created"] = ensure_partitions(conn, ahead)
+                result["dropped"] = drop_expired_partitions(conn, retention_months, dry_run=dry_run)
+            else:
+                result["deleted_messages"] = delete_expired_messages(conn, retention_months, dry_run=dry_run)
+            result["deleted_sessions"] = delete_empty_sessions(conn, retention_months, dry_run=dry_run)
+            if not dry_run and (result["dropped"] or result["deleted_messages"]):
+                result["recounted_sessions"] = recount_sessions(conn, retention_months)
+    finally:
+        if partitioned:
+            # Transaction riêng: tạo partition lỗi thì vẫn cảnh báo qua log/metric
+            with engine.connect() as conn:
+                result.update(check_partitions(conn, ahead))
+    return result
+
+
+async def maintenance_loop(interval: float = MAINTENANCE_INTERVAL):
+    """Chạy run_maintenance (và archive session nguội) định kỳ trong thread (không chặn event loop)"""
+    from services.session_archive import IDLE_DAYS, archive_idle_sessions
+
+    while True:
+        if IDLE_DAYS > 0:
+            # Archive trước retention để session cũ được lưu ra file trước khi partition bị xoá
+            try:
+                await asyncio.to_thread(archive_idle_sessions)
+            except Exception as e:
+                print(f"Chat archive failed: {e}")
+        try:
+            result = await asyncio.to_thread(run_maintenance)
+            if result["created"] or result["dropped"] or result["deleted_messages"] or result["deleted_sessions"]:
+                print(f"Chat maintenance: {result}")
+        except Exception as e:
+            print(f"Chat maintenance failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo partition chat_messages và xoá dữ liệu quá hạn")
+    parser.add_argument("--retention-months", type=int, default=RETENTION_MONTHS, help="0 = giữ mãi")
+    parser.add_argument("--ahead", type=int, default=PARTITIONS_AHEAD, help="số tháng tạo sẵn partition")
+    parser.add_argument("--dry-run", action="store_true", help="chỉ liệt kê, không tạo/xoá")
+    args = parser.parse_args()
+    result = run_maintenance(args.retention_months, args.ahead, args.dry_run)
+    for key, value in result.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
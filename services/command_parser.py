@@ -0,0 +1,81 @@
+"""
+Parser lệnh quản lý theo luật, chạy trước LLM cho các lệnh đơn giản (xem/liệt kê/xoá).
+
+"list brands", "xem danh sách tai nghe", "xóa brand <id>"... được dịch thẳng sang
+{action, resource, id} giống JSON mà LLM trả về, bỏ qua bước sinh JSON tốn vài giây GPU.
+Chỉ nhận câu có động từ rõ ràng và mọi từ đều thuộc mẫu đã biết; còn lại trả về None
+để LLM xử lý. Router chỉ gọi parser khi detect_intent đã xác định product_management.
+
+Environment variables:
+- `CRUD_FAST_PATH`: bật parser theo luật (default true)
+"""
+import os
+import re
+from typing import Optional
+
+from services.product_search import fold_text
+
+FAST_PATH_ENABLED = os.getenv("CRUD_FAST_PATH", "true").lower() in ("1", "true", "yes")
+
+_UUID_RE = re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b")
+
+# Cụm từ (đã bỏ dấu) -> vai trò; cụm dài được khớp trước
+_PHRASES = {
+    # "hãng" và "hàng" cùng bỏ dấu thành "hang": chỉ nhận trong cụm không lẫn với "hàng" (sản phẩm)
+    "resource:brand": ["brand", "brands", "thuong hieu", "cac hang", "hang nao", "hang san xuat"],
+    "resource:type": ["type", "types", "loai", "the loai", "loai tai nghe"],
+    "resource:headphone": ["tai nghe", "headphone", "headphones", "san pham", "product", "products"],
+    "action:read": ["list", "show", "get", "view", "display", "xem", "hien thi", "liet ke"],
+    "action:delete": ["delete", "remove", "xoa", "xoa bo", "go", "go bo"],
+    "filler": [
+        "cac", "nhung", "cho", "toi", "minh", "giup", "di", "nhe", "voi", "please", "me", "the", "of",
+        "hien co", "trong kho", "hien tai", "co", "nao", "id", "ma", "a", "an", "with", "by",
+        "danh sach", "tat ca", "all",
+    ],
+}
+_LOOKUP = sorted(
+    ((phrase.split(), role) for role, phrases in _PHRASES.items() for phrase in phrases),
+    key=lambda p: -len(p[0]),
+)
+
+
+def _roles(tokens: list) -> Optional[list]:
+    """Gán vai trò cho từng cụm từ; None nếu có từ lạ"""
+    roles, i = [], 0
+    while i < len(tokens):
+        for words, role in _LOOKUP:
+            if tokens[i:i + len(words)] == words:
+                roles.append(role)
+                i += len(words)
+                break
+        else:
+            return None
+    return roles
+
+
+def parse_command(message: str) -> Optional[dict]:
+    """{action, resource, id?} cho lệnh chắc chắn, None nếu cần LLM"""
+    if not FAST_PATH_ENABLED or len(message) > 200:
+        return None
+    ids = _UUID_RE.findall(message)
+    if len(ids) > 1:
+        return None
+    roles = _roles(fold_text(_UUID_RE.sub(" ", message)).split())
+    if not roles:
+        return None
+
+    resources = {r.split(":")[1] for r in roles if r.startswith("resource:")}
+    actions = {r.split(":")[1] for r in roles if r.startswith("action:")}
+    # Không có động từ ("có những hãng nào?", "tai nghe") là câu hỏi, không phải lệnh
+    if len(resources) != 1 or len(actions) != 1:
+        return None
+    resource = resources.pop()
+    action = actions.pop()
+
+    command = {"action": action, "resource": resource}
+    if ids:
+        command["id"] = ids[0]
+    elif action == "delete":
+        # Xoá theo tên/mô tả cần LLM (hoặc người dùng) xác định đúng ID
+        return None
+    return command
@@ -0,0 +1,170 @@
+"""
+Trích ràng buộc của khách (ngân sách, mục đích dùng, thương hiệu) từ câu chat.
+
+Ví dụ: "dưới 2 triệu", "tầm 5tr", "từ 1tr5 đến 3 củ", "under $100", "tai nghe Sony chơi game".
+Kết quả là bộ lọc cứng chạy trên price index của recommender trước khi gọi LLM,
+model chỉ nhận các sản phẩm đã thoả điều kiện.
+
+Environment variables:
+- `BUDGET_USD_RATE`: tỉ giá quy đổi USD -> VND (default 25000)
+- `BUDGET_AROUND_RATIO`: biên độ cho "tầm/khoảng X" (default 0.2 = ±20%)
+"""
+import os
+import re
+import unicodedata
+from typing import Iterable, List, Optional
+
+USD_RATE = int(os.getenv("BUDGET_USD_RATE", "25000"))
+AROUND_RATIO = float(os.getenv("BUDGET_AROUND_RATIO", "0.2"))
+
+# Mục đích dùng -> cách nói (đã bỏ dấu); key trùng với khái niệm của recommendation.CONCEPTS
+USAGES = {
+    "gaming": ["gaming", "game", "choi game", "esport", "fps"],
+    "music": ["nghe nhac", "music", "am nhac", "hifi"],
+    "work": ["lam viec", "van phong", "work", "office", "hop online", "meeting", "call"],
+    "sport": ["the thao", "chay bo", "running", "sport", "gym", "tap luyen"],
+    "studio": ["kiem am", "studio", "mixing", "thu am"],
+}
+
+_UNITS = {
+    "trieu": 1_000_000, "tr": 1_000_000, "cu": 1_000_000, "m": 1_000_000, "million": 1_000_000,
+    "nghin": 1_000, "ngan": 1_000, "k": 1_000,
+    "usd": USD_RATE, "$": USD_RATE, "do": USD_RATE, "dollar": USD_RATE, "dollars": USD_RATE,
+    "vnd": 1, "d": 1, "dong": 1,
+}
+# Số + đơn vị; "2tr5" = 2.5 triệu, "$100" = 100 USD, "2.000.000d" = 2 triệu
+_AMOUNT = (
+    r"(?P<usd>\$\s*)?"
+    r"(?P<num>\d{1,3}(?:[.,]\d{3})+|\d+(?:[.,]\d+)?)"
+    r"\s*(?P<unit>trieu|tr|cu|million|m|nghin|ngan|k|usd|dollars?|do|vnd|dong|d|\$)?"
+    r"(?P<tail>\d)?(?![a-z0-9])"
+)
+_AMOUNT_RE = re.compile(_AMOUNT)
+_RANGE_RE = re.compile(
+    r"(?:tu|between|from)?\s*(?P<a>" + _AMOUNT.replace("?P<", "?P<a_") + r")"
+    r"\s*(?:den|toi|-|~|to|and)\s*(?P<b>" + _AMOUNT.replace("?P<", "?P<b_") + r")"
+)
+_MAX_RE = re.compile(r"(?:duoi|nho hon|khong qua|toi da|it hon|re hon|under|below|less than|max|maximum|up to|<=?)\s*$")
+_MIN_RE = re.compile(r"(?:tren|hon|it nhat|toi thieu|over|above|more than|at least|min|minimum|>=?)\s*$")
+_AROUND_RE = re.compile(r"(?:tam|khoang|tam gia|around|about|approximately|~)\s*$")
+_BUDGET_RE = re.compile(r"(?:ngan sach|budget|gia|price|co|chi)\s*$")
+_OR_MORE_RE = re.compile(r"\s*(?:tro len|\+|or more)")
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+class Constraints:
+    """Bộ lọc đã trích: giá (VND), mục đích dùng, thương hiệu"""
+
+    def __init__(self, min_price: Optional[int] = None, max_price: Optional[int] = None,
+                 usages: Optional[List[str]] = None, brands: Optional[List[str]] = None):
+        self.min_price = min_price
+        self.max_price = max_price
+        self.usages = usages or []
+        self.brands = brands or []
+
+    @property
+    def has_budget(self) -> bool:
+        return self.min_price is not None or self.max_price is not None
+
+    def __bool__(self):
+        return self.has_budget or bool(self.usages) or bool(self.brands)
+
+    def __repr__(self):
+        return (f"Constraints(min_price={self.min_price}, max_price={self.max_price}, "
+                f"usages={self.usages}, brands={self.brands})")
+
+    def describe(self) -> str:
+        """Mô tả ngắn để đưa vào prompt"""
+        parts = []
+        if self.min_price is not None and self.max_price is not None:
+            parts.append(f"giá từ {self.min_price:,}đ đến {self.max_price:,}đ")
+        elif self.max_price is not None:
+            parts.append(f"giá tối đa {self.max_price:,}đ")
+        elif self.min_price is not None:
+            parts.append(f"giá từ {self.min_price:,}đ")
+        if self.brands:
+            parts.append(f"thương hiệu {', '.join(self.brands)}")
+        if self.usages:
+            parts.append(f"mục đích {', '.join(self.usages)}")
+        return "; ".join(parts)
+
+
+def _normalize(text: str) -> str:
+    # Bỏ dấu nhưng giữ số thập phân và ký hiệu ($, <, -) khác với fold_text
+    text = text.lower().replace("đ", "d")
+    text = unicodedata.normalize("NFD", text).encode("ascii", "ignore").decode("utf-8")
+    return re.sub(r"\s+", " ", text)
+
+
+def _amount(match, prefix: str = "", default_unit: Optional[str] = None) -> Optional[int]:
+    """Giá trị VND của một match _AMOUNT; None nếu không chắc là số tiền"""
+    num, unit = match.group(f"{prefix}num"), match.group(f"{prefix}unit") or default_unit
+    if match.group(f"{prefix}usd"):
+        unit = "usd"
+    if re.fullmatch(r"\d{1,3}(?:[.,]\d{3})+", num):
+        value = float(re.sub(r"[.,]", "", num))
+    else:
+        value = float(num.replace(",", "."))
+    tail = match.group(f"{prefix}tail")
+    if tail and unit in ("trieu", "tr", "cu", "m"):
+        value += int(tail) / 10
+    elif tail:
+        return None
+
+    if unit is None:
+        # Số trơn chỉ được coi là tiền khi đủ lớn (tránh nhầm với tên model như 1000XM5)
+        return int(value) if value >= 10_000 else None
+    return int(value * _UNITS[unit])
+
+
+def _parse_budget(text: str):
+    """(min_price, max_price) của lần nhắc ngân sách cuối cùng"""
+    budget = None
+    for m in _RANGE_RE.finditer(text):
+        # Đơn vị ở số sau áp dụng cho cả số trước: "từ 2 đến 3 triệu"
+        unit_b = m.group("b_unit") or ("usd" if m.group("b_usd") else None)
+        unit_a = m.group("a_unit") or ("usd" if m.group("a_usd") else None)
+        low = _amount(m, "a_", default_unit=unit_b)
+        high = _amount(m, "b_", default_unit=unit_a)
+        if low is not None and high is not None:
+            budget = (m.end(), min(low, high), max(low, high))
+
+    for m in _AMOUNT_RE.finditer(text):
+        if budget and m.start() < budget[0]:
+            continue
+        value = _amount(m)
+        if value is None:
+            continue
+        before = text[max(0, m.start() - 20):m.start()]
+        if _MAX_RE.search(before):
+            bounds = (None, value)
+        elif _MIN_RE.search(before) or _OR_MORE_RE.match(text, m.end()):
+            bounds = (value, None)
+        elif _AROUND_RE.search(before):
+            bounds = (int(value * (1 - AROUND_RATIO)), int(value * (1 + AROUND_RATIO)))
+        elif _BUDGET_RE.search(before):
+            bounds = (None, value)
+        else:
+            # Nhắc số tiền không kèm từ khoá: hiểu là "tầm X"
+            bounds = (int(value * (1 - AROUND_RATIO)), int(value * (1 + AROUND_RATIO)))
+        budget = (m.end(), *bounds)
+    return budget[1:] if budget else (None, None)
+
+
+def parse_constraints(text: str, brand_names: Iterable[str] = ()) -> Constraints:
+    """Trích ràng buộc từ câu chat; brand_names là các thương hiệu có trong catalog"""
+    normalized = _normalize(text)
+    min_price, max_price = _parse_budget(normalized)
+
+    padded = " " + _NON_WORD_RE.sub(" ", normalized) + " "
+    usages = [usage for usage, phrases in USAGES.items() if any(f" {p} " in padded for p in phrases)]
+    brands = []
+    for name in brand_names:
+        folded = _NON_WORD_RE.sub(" ", _normalize(name)).strip()
+        if folded and f" {folded} " in padded:
+            brands.append(name)
+    return Constraints(min_price, max_price, usages, brands)
+
+
+def has_budget(text: str) -> bool:
+    return parse_constraints(text).has_budget
@@ -0,0 +1,230 @@
+"""
+Thực thi CRUDRequest (action/resource/id/data/items) trên brand/type/headphone.
+
+Dùng chung cho chatbot (JSON do LLM hoặc command_parser sinh ra) và endpoint
+/chat/crud (payload có cấu trúc từ công cụ admin, không qua model).
+"""
+import re
+from typing import Any
+
+from sqlalchemy.orm import Session
+
+from crud.brand import create_brand, delete_brand, get_brands, get_brand_by_id, update_brand, create_brands_bulk
+from crud.type import create_type, delete_type, get_types, get_type_by_id, update_type, create_types_bulk
+from crud.headphone import create_headphone, delete_headphone, get_headphones, get_headphone_by_id, update_headphone, create_headphones_bulk
+from schemas.brand import BrandCreate, BrandUpdate
+from schemas.type import TypeCreate, TypeUpdate
+from schemas.headphone import HeadphoneCreate, HeadphoneUpdate
+
+_TYPE_KEYWORDS = {
+    "bluetooth": r'\b(bluetooth|bt|wireless)\b',
+    "gaming": r'\b(gaming|game|chơi game)\b',
+    "wired": r'\b(wired|có dây)\b',
+    "over-ear": r'\b(over.ear|overear)\b',
+}
+_BRAND_KEYWORDS = r'\b(samsung|sony|apple|asus|jbl|bose|beats|sennheiser)\b'
+
+
+class CRUDInputError(ValueError):
+    """Payload CRUD sai cấu trúc hoặc thiếu thông tin"""
+
+
+def normalize_crud(crud: dict) -> dict:
+    """Chuẩn hoá + kiểm tra cấu trúc data/items theo action"""
+    crud = dict(crud)
+    action = crud.get("action")
+    data = crud.get("data")
+    items = crud.get("items")
+
+    # 🔥 FALLBACK: Nếu action="create_bulk" nhưng dùng "data" thay vì "items"
+    if action == "create_bulk" and not items and isinstance(data, list):
+        crud["items"], crud["data"] = data, None
+        items, data = data, None
+
+    # Validate data structure cho CREATE/UPDATE
+    if action in ["create", "update"]:
+        if not isinstance(data, dict):
+            raise CRUDInputError(f"Lỗi: 'data' phải là object {{}}, không phải {type(data).__name__}.")
+        if not data:
+            raise CRUDInputError(f"Lỗi: 'data' không được rỗng cho action '{action}'")
+
+    # Validate items structure cho CREATE_BULK
+    if action == "create_bulk":
+        if not isinstance(items, list):
+            raise CRUDInputError(f"Lỗi: 'items' phải là array [], không phải {type(items).__name__}.")
+        if not items:
+            raise CRUDInputError("Lỗi: 'items' không được rỗng cho action 'create_bulk'")
+    return crud
+
+
+def _infer_slugs(item: dict, message: str):
+    """Tự suy brand_slug/type_slug còn thiếu từ câu chat của người dùng"""
+    if not message:
+        return
+    text = message.lower()
+    if not item.get("type_slug"):
+        for type_name, pattern in _TYPE_KEYWORDS.items():
+            if re.search(pattern, text):
+                item["type_slug"] = type_name
+                break
+    if not item.get("brand_slug"):
+        brand_match = re.search(_BRAND_KEYWORDS, text)
+        if brand_match:
+            item["brand_slug"] = brand_match.group(1)
+
+
+def execute_crud(db: Session, crud: dict, message: str = "") -> Any:
+    """Chạy một CRUD request đã normalize, trả về object/list từ crud (raise ValueError khi lỗi)"""
+    action = crud.get("action")
+    resource = crud.get("resource")
+    item_id = crud.get("id")
+    data = crud.get("data")
+    items = crud.get("items")
+
+    # ---------- CREATE BULK ----------
+    if action == "create_bulk":
+        if resource == "brand":
+            return create_brands_bulk(db, [BrandCreate(**item) for item in items])
+        if resource == "type":
+            return create_types_bulk(db, [TypeCreate(**item) for item in items])
+        if resource == "headphone":
+            for item in items:
+                _infer_slugs(item, message)
+                # Validate price
+                if "price" not in item or item.get("price") is None:
+                    item["price"] = 500000  # Giá mặc định
+                else:
+                    try:
+                        item["price"] = int(item["price"])
+                    except (ValueError, TypeError):
+                        item["price"] = 500000
+            # CRUD sẽ tự động chuyển đổi slug/name thành UUID
+            return create_headphones_bulk(db, [HeadphoneCreate(**item) for item in items])
+
+    # ---------- CREATE ----------
+    if action == "create":
+        if resource == "brand":
+            return create_brand(db, BrandCreate(**data))
+        if resource == "type":
+            return create_type(db, TypeCreate(**data))
+        if resource == "headphone":
+            # Validate dữ liệu headphone
+            if "name" not in data:
+                raise CRUDInputError("Lỗi: Thiếu 'name' (tên tai nghe) trong data")
+            if "price" not in data or data.get("price") is None:
+                raise CRUDInputError("Lỗi: Thiếu 'price' (giá tai nghe). Vui lòng cung cấp giá tiền (VD: 500000)")
+            _infer_slugs(data, message)
+            # Validate price là số
+            try:
+                price = int(data.get("price"))
+            except (ValueError, TypeError):
+                raise CRUDInputError(f"Lỗi: Giá phải là số nguyên, nhận được: {data.get('price')}")
+            if price < 0:
+                raise CRUDInputError("Lỗi: Giá không được âm")
+            data["price"] = price
+            return create_headphone(db, HeadphoneCreate(**data))
+
+    # ---------- READ ----------
+    if action == "read":
+        if resource == "brand":
+            return get_brand_by_id(db, item_id) if item_id else get_brands(db)
+        if resource == "type":
+            return get_type_by_id(db, item_id) if item_id else get_types(db)
+        if resource == "headphone":
+            return get_headphone_by_id(db, item_id) if item_id else get_headphones(db)
+
+    # ---------- UPDATE ----------
+    if action == "update":
+        if not item_id:
+            raise CRUDInputError("Cần cung cấp ID để cập nhật.")
+        if resource == "brand":
+            return update_brand(db, item_id, BrandUpdate(**data))
+        if resource == "type":
+            return update_type(db, item_id, TypeUpdate(**data))
+        if resource == "headphone":
+            return update_headphone(db, item_id, HeadphoneUpdate(**data))
+
+    # ---------- DELETE ----------
+    if action == "delete":
+        if resource == "brand":
+            return delete_brand(db, item_id)
+        if resource == "type":
+            return delete_type(db, item_id)
+        if resource == "headphone":
+            return delete_headphone(db, item_id)
+
+    raise CRUDInputError("Hành động hoặc resource CRUD không hợp lệ.")
+
+
+def format_crud_reply(crud: dict, result: Any) -> str:
+    """Câu trả lời chat cho kết quả của execute_crud"""
+    action = crud.get("action")
+    resource = crud.get("resource")
+    item_id = crud.get("id")
+
+    if action == "create_bulk":
+        created, errors = result
+        if resource == "headphone":
+            reply = f"Đã tạo {len(created)} tai nghe:\n"
+            for h in created:
+                brand_info = f" ({h.brand.name})" if h.brand else ""
+                reply += f"- {h.name}{brand_info}\n"
+            if errors:
+                reply += f"\nLỗi ({len(errors)}):\n" + "\n".join([f"- {e}" for e in errors])
+            return reply.strip()
+        label = "brands" if resource == "brand" else "types"
+        reply = f"Đã tạo {len(created)} {label}:\n"
+        reply += "\n".join([f"- {obj.name}" for obj in created])
+        if errors:
+            reply += f"\n\nLỗi ({len(errors)}):\n" + "\n".join([f"- {e}" for e in errors])
+        return reply
+
+    if action == "create":
+        if resource == "headphone":
+            # Thông báo chi tiết
+            brand_info = f" - Thương hiệu: {result.brand.name}" if result.brand else ""
+            type_info = f" - Loại: {result.type.name}" if result.type else ""
+            return f"Đã thêm tai nghe: {result.name}{brand_info}{type_info}"
+        return f"Đã tạo {resource}: {result.name}"
+
+    if action == "read":
+        if item_id:
+            if result is None:
+                label = "tai nghe" if resource == "headphone" else resource
+                return f"Không tìm thấy {label} với ID: {item_id}"
+            if resource == "headphone":
+                brand_name = result.brand.name if result.brand else "Chưa rõ"
+                type_name = result.type.name if result.type else "Chưa rõ"
+                price_str = f"{result.price:,.0f}đ" if result.price else "Liên hệ"
+                return f"Tai nghe: {result.name}\nThương hiệu: {brand_name}\nLoại: {type_name}\n💰 Giá: {price_str}\nID: {result.id}"
+            return f"{resource.capitalize()}: {result.name} (ID: {result.id}, Slug: {result.slug})"
+
+        if resource == "brand":
+            if not result:
+                return "Chưa có thương hiệu nào trong hệ thống."
+            brand_list = "\n".join([f"- {b.name} (ID: {b.id})" for b in result])
+            return f"Danh sách thương hiệu ({len(result)}):\n{brand_list}"
+        if resource == "type":
+            if not result:
+                return "Chưa có loại tai nghe nào trong hệ thống."
+            type_list = "\n".join([f"- {t.name} (ID: {t.id})" for t in result])
+            return f"Danh sách loại tai nghe ({len(result)}):\n{type_list}"
+        if not result:
+            return "Chưa có tai nghe nào trong kho."
+        hp_list = []
+        for h in result:
+            brand_name = h.brand.name if h.brand else "Chưa rõ"
+            price_str = f"{h.price:,.0f}đ" if h.price else "Liên hệ"
+            hp_list.append(f"- {h.name} ({brand_name}) - {price_str}")
+        hp_text = "\n".join(hp_list)
+        return f"Danh sách tai nghe ({len(result)}):\n{hp_text}"
+
+    if action == "update":
+        label = "tai nghe" if resource == "headphone" else resource
+        return f"Đã cập nhật {label}: {result.name}"
+
+    if action == "delete":
+        label = "tai nghe" if resource == "headphone" else resource
+        return f"Đã xoá {label}: {item_id}"
+
+    return str(result)
@@ -119,6 +119,24 @@ EXAMPLES OF INTELLIGENT PARSING:
 OUTPUT: Return only the JSON object for the current user request. Start with { and end with }.
 """
 
+# Bản rút gọn cho backend có structured output (JSON schema / grammar):
+# cấu trúc JSON đã được ràng buộc, chỉ cần giải thích ngữ nghĩa các field.
+CRUD_STRUCTURED_PROMPT = """
+You are a database management AI for a headphone store. Convert the user's request into one CRUD operation.
+
+FIELDS:
+- action: create | read | update | delete | create_bulk (create_bulk uses "items", others use "data")
+- resource: brand | type | headphone
+- id: UUID for read/update/delete of a single record, otherwise null
+- brand/type data: {"name"}
+- headphone data: {"name", "price" (integer VND), "brand_slug", "type_slug"} - slugs are lowercase brand/type names
+
+RULES:
+- Never include "id" or "slug" inside data/items
+- Use REAL market model names with model numbers (e.g. "Sony WH-1000XM5", not "Sony Wireless") and their real prices
+- For "create <type> của <brand>" create 2-3 different real models of that brand
+"""
+
 
 def get_prompt_for_intent(intent: str = "general") -> str:
     """Get appropriate prompt based on user intent"""
@@ -163,5 +181,10 @@ def detect_intent(message: str) -> str:
     
     if any(re.search(pattern, message_lower) for pattern in service_patterns):
         return "customer_service"
+
+    # "dưới 2 triệu", "tầm 5tr", "under $100"...
+    from services.constraints import has_budget
+    if has_budget(message):
+        return "customer_service"
     
     return "general"
@@ -0,0 +1,95 @@
+"""
+Incremental JSON object extraction for streamed LLM output
+"""
+import json
+import re
+from typing import Optional
+
+
+# Dấu phẩy thừa trước } hoặc ]
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+
+class JSONObjectExtractor:
+    """Tìm JSON object top-level đầu tiên trong một stream text.
+
+    Bỏ qua mọi thứ trước dấu `{` đầu tiên (markdown code fence, lời dẫn...),
+    đếm ngoặc nhưng bỏ qua ngoặc nằm trong string, và báo hoàn tất ngay khi
+    object top-level đóng lại để caller có thể huỷ phần generation còn lại.
+    """
+
+    def __init__(self):
+        self.text = ""  # Toàn bộ text đã nhận (dùng cho thông báo lỗi)
+        self.started = False
+        self.done = False
+        self._start = -1
+        self._end = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> bool:
+        """Nạp thêm text, trả về True khi object đã hoàn chỉnh"""
+        if self.done:
+            return True
+
+        offset = len(self.text)
+        self.text += chunk
+
+        for i, char in enumerate(chunk, start=offset):
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self._start = i
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._end = i
+                    self.done = True
+                    return True
+
+        return False
+
+    @property
+    def result(self) -> Optional[str]:
+        """JSON string của object (None nếu chưa hoàn chỉnh)"""
+        if not self.done:
+            return None
+        return self.text[self._start:self._end + 1]
+
+
+def clean_json_object(json_str: str) -> str:
+    """Làm sạch JSON do AI sinh ra: bỏ comment `//` và dấu phẩy thừa"""
+    lines = [line for line in json_str.strip().split("\n") if not line.strip().startswith("//")]
+    return _TRAILING_COMMA.sub(r'\1', "\n".join(lines))
+
+
+def parse_json_object(json_str: str):
+    """Parse JSON object, thử làm sạch nếu parse trực tiếp thất bại"""
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        return json.loads(clean_json_object(json_str))
+
+
+def extract_json_object(text: str) -> JSONObjectExtractor:
+    """Chạy extractor trên một đoạn text đầy đủ"""
+    extractor = JSONObjectExtractor()
+    extractor.feed(text)
+    return extractor
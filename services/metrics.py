@@ -0,0 +1,261 @@
+"""
+In-process metrics (counter / gauge / histogram) xuất ra định dạng Prometheus text
+
+Metrics nằm trong bộ nhớ của từng process: chạy nhiều worker (uvicorn --workers,
+gunicorn) thì mỗi lần scrape /metrics chỉ thấy số liệu của worker nhận request.
+Đặt `METRICS_MULTIPROC_DIR` (giống PROMETHEUS_MULTIPROC_DIR của prometheus_client)
+để mỗi worker ghi snapshot vào thư mục chung và /metrics cộng dồn mọi worker.
+Thư mục này cần được xoá trước mỗi lần khởi động lại toàn bộ app.
+
+Environment variables:
+- `METRICS_MULTIPROC_DIR`: thư mục chung cho snapshot metrics của các worker (default tắt)
+- `METRICS_FLUSH_INTERVAL`: chu kỳ ghi snapshot (giây, default 1)
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+
+_lock = threading.Lock()
+_registry = []
+_dirty = threading.Event()
+_flusher = None
+# pid + thời điểm khởi động: pid được dùng lại sau restart không ghi đè snapshot của process cũ
+_SNAPSHOT_NAME = f"metrics-{os.getpid()}-{time.time_ns()}.json"
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs += list(extra.items())
+    if not pairs:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _mark_dirty()
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def render(self, values: Optional[dict] = None) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with _lock:
+            for key, value in sorted((self._values if values is None else values).items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        # key -> [value, thời điểm set]; nhiều worker thì lấy giá trị mới nhất
+        self._values: Dict[Tuple[str, ...], list] = {}
+        _registry.append(self)
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with _lock:
+            self._values[key] = [value, time.time()]
+        _mark_dirty()
+
+    @staticmethod
+    def merge(total, value):
+        return list(value) if total is None or value[1] > total[1] else total
+
+    def render(self, values: Optional[dict] = None) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with _lock:
+            for key, (value, _) in sorted((self._values if values is None else values).items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...], labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = labelnames
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+        _mark_dirty()
+
+    @staticmethod
+    def merge(total, value):
+        return list(value) if total is None else [a + b for a, b in zip(total, value)]
+
+    def render(self, values: Optional[dict] = None) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for key, state in sorted((self._values if values is None else values).items()):
+                for i, bound in enumerate(self.buckets):
+                    labels = _format_labels(self.labelnames, key, {"le": repr(float(bound))})
+                    lines.append(f"{self.name}_bucket{labels} {state[i]}")
+                labels = _format_labels(self.labelnames, key, {"le": "+Inf"})
+                lines.append(f"{self.name}_bucket{labels} {state[-1]}")
+                base = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{base} {state[-2]}")
+                lines.append(f"{self.name}_count{base} {state[-1]}")
+        return "\n".join(lines)
+
+
+def _snapshot() -> dict:
+    with _lock:
+        return {metric.name: [[list(key), value] for key, value in metric._values.items()] for metric in _registry}
+
+
+def _write_snapshot():
+    """Ghi snapshot của process này (file tạm rồi thay thế, worker khác không đọc phải file ghi dở)"""
+    _dirty.clear()
+    path = os.path.join(MULTIPROC_DIR, _SNAPSHOT_NAME)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(MULTIPROC_DIR, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_snapshot(), f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Metrics snapshot error: {e}")
+
+
+def _flush_loop():
+    while True:
+        _dirty.wait()
+        time.sleep(FLUSH_INTERVAL)
+        _write_snapshot()
+
+
+def _mark_dirty():
+    global _flusher
+    if not MULTIPROC_DIR:
+        return
+    _dirty.set()
+    if _flusher is None:
+        with _lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+                _flusher.start()
+
+
+def _merged_values() -> Dict[str, dict]:
+    """Cộng dồn snapshot của mọi worker (kể cả worker đã dừng, giống counter của prometheus multiprocess)"""
+    _write_snapshot()
+    metrics = {metric.name: metric for metric in _registry}
+    merged: Dict[str, dict] = {name: {} for name in metrics}
+    for name in sorted(os.listdir(MULTIPROC_DIR)):
+        if not (name.startswith("metrics-") and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(MULTIPROC_DIR, name), encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric_name, entries in snapshot.items():
+            metric = metrics.get(metric_name)
+            if metric is None:
+                continue
+            values = merged[metric_name]
+            for key, value in entries:
+                key = tuple(key)
+                values[key] = metric.merge(values.get(key), value)
+    return merged
+
+
+def render_prometheus() -> str:
+    """Toàn bộ metrics theo Prometheus text exposition format"""
+    if MULTIPROC_DIR:
+        merged = _merged_values()
+        return "\n".join(metric.render(merged[metric.name]) for metric in _registry) + "\n"
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# ===========================
+# LLM metrics
+# ===========================
+_LLM_LABELS = ("intent", "model")
+_TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+_SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+LLM_REQUESTS = Counter("llm_requests_total", "LLM completion calls", _LLM_LABELS + ("status",))
+LLM_UNEXPECTED_RESPONSES = Counter("llm_unexpected_responses_total", "LLM responses without choices", _LLM_LABELS)
+LLM_PROMPT_TOKENS = Histogram("llm_prompt_tokens", "Prompt tokens per call", _TOKEN_BUCKETS, _LLM_LABELS)
+LLM_COMPLETION_TOKENS = Histogram("llm_completion_tokens", "Completion tokens per call", _TOKEN_BUCKETS, _LLM_LABELS)
+LLM_TIME_TO_FIRST_BYTE = Histogram("llm_time_to_first_byte_seconds", "Time until first response byte / token", _SECONDS_BUCKETS, _LLM_LABELS)
+LLM_DURATION = Histogram("llm_request_duration_seconds", "Total LLM call duration", _SECONDS_BUCKETS, _LLM_LABELS)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_tokens_per_second", "Completion tokens per second", (1, 2, 5, 10, 20, 40, 80, 160, 320), _LLM_LABELS
+)
+
+
+def record_llm_call(
+    intent: str,
+    model: str,
+    status: str,
+    total_time: float,
+    time_to_first_byte: Optional[float] = None,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+    generation_time: Optional[float] = None,
+):
+    """Ghi nhận một lần gọi LLM.
+
+    `generation_time` là thời gian sinh token (stream: sau token đầu tiên);
+    không có thì dùng total_time để tính tokens/sec.
+    """
+    labels = {"intent": intent, "model": model}
+    LLM_REQUESTS.inc(status=status, **labels)
+    LLM_DURATION.observe(total_time, **labels)
+    if time_to_first_byte is not None:
+        LLM_TIME_TO_FIRST_BYTE.observe(time_to_first_byte, **labels)
+    if prompt_tokens is not None:
+        LLM_PROMPT_TOKENS.observe(prompt_tokens, **labels)
+    if completion_tokens is not None:
+        LLM_COMPLETION_TOKENS.observe(completion_tokens, **labels)
+        elapsed = generation_time if generation_time and generation_time > 0 else total_time
+        if elapsed > 0:
+            LLM_TOKENS_PER_SECOND.observe(completion_tokens / elapsed, **labels)
+
+
+# ===========================
+# Chat storage metrics
+# ===========================
+CHAT_PARTITION_HORIZON = Gauge(
+    "chat_messages_partition_horizon_months", "Months of chat_messages partitions ready after the current month"
+)
+CHAT_DEFAULT_PARTITION_ROWS = Gauge(
+    "chat_messages_default_partition_rows", "Rows in chat_messages_default (no month partition for their created_at)"
+)
@@ -0,0 +1,184 @@
+"""
+Tìm kiếm sản phẩm không phân biệt dấu, chịu lỗi gõ (trigram) cho GET /headphones/search.
+
+Hai chế độ (`SEARCH_BACKEND`):
+- `memory` (default): index trigram trong process, dựng lại khi catalog đổi (catalog_bus)
+- `pg_trgm`: GIN trigram index trên cột `headphones.search_text` (PostgreSQL)
+
+Cả hai dùng chung `fold_text` nên cách bỏ dấu giống hệt nhau.
+"""
+import heapq
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from services.catalog_bus import CatalogCache
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "memory").lower()
+# Độ giống tối thiểu (tỉ lệ trigram của từ khoá có trong từ của sản phẩm)
+MIN_SIMILARITY = float(os.getenv("SEARCH_MIN_SIMILARITY", "0.5"))
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold_text(value: Optional[str]) -> str:
+    """Bỏ dấu như create_slug_from_name (thêm đ -> d), giữ các từ cách nhau bằng khoảng trắng"""
+    if not value:
+        return ""
+    value = value.lower().replace("đ", "d")
+    value = unicodedata.normalize("NFD", value).encode("ascii", "ignore").decode("utf-8")
+    return " ".join(_WORD_RE.findall(value))
+
+
+def build_search_text(name: str, brand_name: Optional[str] = None, type_name: Optional[str] = None) -> str:
+    """Nội dung được index của một sản phẩm: tên + brand + type"""
+    return " ".join(part for part in (fold_text(name), fold_text(brand_name), fold_text(type_name)) if part)
+
+
+def _trigrams(word: str) -> set:
+    # Chỉ đệm phía trước: từ khoá gõ dở (prefix) vẫn khớp toàn bộ trigram của nó
+    padded = f"  {word}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InMemorySearchIndex:
+    """Index hai tầng: trigram -> từ trong vocabulary, từ -> sản phẩm"""
+
+    def __init__(self, products: List[dict]):
+        # Thứ tự doc = thứ tự ưu tiên khi cùng điểm (tên ngắn trước) -> chỉ cần so sánh doc id
+        self.products = sorted(products, key=lambda p: (len(p["name"] or ""), p["name"] or ""))
+        self._word_ids = {}
+        self._word_docs: List[set] = []
+        self._trigram_words = {}
+
+        for doc, product in enumerate(self.products):
+            for word in set(build_search_text(product["name"], product["brand_name"], product["type_name"]).split()):
+                wid = self._word_ids.get(word)
+                if wid is None:
+                    wid = self._word_ids[word] = len(self._word_docs)
+                    self._word_docs.append(set())
+                    for gram in _trigrams(word):
+                        self._trigram_words.setdefault(gram, []).append(wid)
+                self._word_docs[wid].add(doc)
+        self._words = list(self._word_ids)
+
+    @classmethod
+    def from_headphones(cls, headphones) -> "InMemorySearchIndex":
+        return cls([
+            {
+                "id": h.id,
+                "name": h.name,
+                "slug": h.slug,
+                "price": h.price,
+                "brand_name": h.brand.name if h.brand else None,
+                "type_name": h.type.name if h.type else None,
+            }
+            for h in headphones
+        ])
+
+    def _match_token(self, token: str) -> dict:
+        """{word_id: độ giống} của các từ trong vocabulary gần với token"""
+        exact = self._word_ids.get(token)
+        grams = _trigrams(token)
+        counts = Counter()
+        for gram in grams:
+            counts.update(self._trigram_words.get(gram, ()))
+        matches = {}
+        for wid, shared in counts.items():
+            sim = shared / len(grams)
+            if sim >= MIN_SIMILARITY:
+                # Ưu tiên từ ngắn (khớp gần trọn từ) hơn từ dài chỉ khớp prefix
+                matches[wid] = sim * (0.8 + 0.2 * min(1.0, len(token) / len(self._words[wid])))
+        if exact is not None:
+            matches[exact] = 1.0
+        return matches
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> dict:
+        tokens = fold_text(query).split()
+        if not tokens:
+            return {"total": 0, "items": []}
+
+        per_token = []
+        for token in dict.fromkeys(tokens):
+            matches = self._match_token(token)
+            docs = set().union(*(self._word_docs[w] for w in matches)) if matches else set()
+            per_token.append((matches, docs))
+
+        # Ưu tiên sản phẩm khớp mọi từ khoá; không có thì lấy sản phẩm khớp một phần
+        ordered = sorted(per_token, key=lambda t: len(t[1]))
+        candidates = set.intersection(*(docs for _, docs in ordered)) if ordered else set()
+        if not candidates:
+            candidates = set().union(*(docs for _, docs in ordered))
+
+        # Chia candidates thành các nhóm cùng điểm bằng phép giao set (không duyệt từng sản phẩm)
+        groups = [(0.0, candidates)]
+        for matches, _ in per_token:
+            buckets = {}
+            remaining = set(candidates)
+            for wid, sim in sorted(matches.items(), key=lambda m: -m[1]):
+                hit = self._word_docs[wid] & remaining
+                if hit:
+                    buckets.setdefault(round(sim, 2), set()).update(hit)
+                    remaining -= hit
+                    if not remaining:
+                        break
+            next_groups = []
+            for score, docs in groups:
+                for sim, hit in buckets.items():
+                    part = docs & hit
+                    if part:
+                        next_groups.append((score + sim, part))
+                rest = docs & remaining
+                if rest:
+                    next_groups.append((score, rest))
+            groups = next_groups
+
+        items = []
+        need = offset + limit
+        for score, docs in sorted(groups, key=lambda g: -g[0]):
+            for doc in heapq.nsmallest(need - len(items), docs):
+                items.append({**self.products[doc], "score": round(score / len(per_token), 3)})
+            if len(items) >= need:
+                break
+        return {"total": len(candidates), "items": items[offset:]}
+
+
+_index_cache = CatalogCache()
+
+
+def get_memory_index(db: Session) -> InMemorySearchIndex:
+    """Index dùng chung của process, dựng lại khi catalog version đổi"""
+    from crud.headphone import get_headphones
+    return _index_cache.get(lambda: InMemorySearchIndex.from_headphones(get_headphones(db)))
+
+
+def search_pg_trgm(db: Session, query: str, limit: int = 20, offset: int = 0) -> dict:
+    """Tìm bằng pg_trgm `word_similarity` trên cột search_text (GIN index)"""
+    folded = fold_text(query)
+    if not folded:
+        return {"total": 0, "items": []}
+    db.execute(text("SELECT set_config('pg_trgm.word_similarity_threshold', :t, true)"), {"t": str(MIN_SIMILARITY)})
+    params = {"q": folded, "limit": limit, "offset": offset}
+    total = db.execute(text("SELECT count(*) FROM headphones WHERE :q <% search_text"), params).scalar()
+    rows = db.execute(text("""
+        SELECT h.id, h.name, h.slug, h.price, b.name AS brand_name, t.name AS type_name,
+               word_similarity(:q, h.search_text) AS score
+        FROM headphones h
+        LEFT JOIN brands b ON b.id = h.brand_id
+        LEFT JOIN types t ON t.id = h.type_id
+        WHERE :q <% h.search_text
+        ORDER BY score DESC, length(h.name), h.name
+        LIMIT :limit OFFSET :offset
+    """), params).mappings().all()
+    return {"total": total, "items": [{**row, "score": round(float(row["score"]), 3)} for row in rows]}
+
+
+def search_headphones(db: Session, query: str, limit: int = 20, offset: int = 0) -> dict:
+    if SEARCH_BACKEND == "pg_trgm":
+        return search_pg_trgm(db, query, limit, offset)
+    return get_memory_index(db).search(query, limit, offset)
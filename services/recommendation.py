@@ -0,0 +1,292 @@
+"""
+Gợi ý sản phẩm bằng embedding cục bộ (feature hashing + NumPy), không cần model qua mạng.
+
+Mỗi sản phẩm được biểu diễn bằng vector hashing của từ, char trigram và "khái niệm"
+(gaming, chống ồn, không dây...) gom từ các cách nói Việt/Anh. Câu hỏi của khách được
+vector hoá cùng cách, top-k theo cosine có lọc giá/loại. Danh sách ngắn này thay cho
+toàn bộ catalog trong prompt tư vấn (intent customer_service).
+
+Embeddings lưu ở file `.npy` memory-mapped (các worker dùng chung page cache), `meta.json`
+trỏ tới file hiện hành, và được dựng lại từng phần khi catalog đổi: chỉ sản phẩm mới/đổi
+nội dung mới phải vector hoá lại.
+
+Environment variables:
+- `RECO_ENABLED`: dùng danh sách gợi ý cho customer_service (default false)
+- `RECO_TOP_K`: số sản phẩm đưa vào prompt (default 8)
+- `RECO_DIM`: số chiều vector (default 256)
+- `RECO_INDEX_DIR`: thư mục lưu embeddings (default ./.cache/recommendation)
+"""
+import json
+import os
+import time
+import zlib
+from typing import Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from services.catalog_bus import CatalogCache
+from services.product_search import fold_text
+
+RECO_ENABLED = os.getenv("RECO_ENABLED", "false").lower() in ("1", "true", "yes")
+TOP_K = int(os.getenv("RECO_TOP_K", "8"))
+DIM = int(os.getenv("RECO_DIM", "256"))
+INDEX_DIR = os.getenv("RECO_INDEX_DIR", os.path.join(".", ".cache", "recommendation"))
+# Tăng khi đổi cách trích đặc trưng để bỏ embeddings cũ trên đĩa
+FEATURE_VERSION = 2
+# File embeddings không còn dùng được xoá sau số giây này
+STALE_FILE_AGE = 60
+
+# Khái niệm -> các cách nói (đã bỏ dấu)
+CONCEPTS = {
+    "gaming": ["gaming", "game", "choi game", "esport", "fps"],
+    "anc": ["chong on", "khu on", "anc", "noise cancelling", "noise canceling", "quietcomfort", "nc"],
+    "wireless": ["khong day", "wireless", "bluetooth", "true wireless", "tws"],
+    "wired": ["co day", "wired", "jack", "3 5mm"],
+    "sport": ["the thao", "chay bo", "running", "sport", "gym", "tap luyen", "dan truyen xuong"],
+    "studio": ["kiem am", "studio", "monitor", "mixing", "thu am"],
+    "music": ["nghe nhac", "music", "am nhac", "bass", "hifi"],
+    "work": ["lam viec", "van phong", "work", "office", "hop", "meeting", "call", "mic"],
+    "overear": ["chup tai", "over ear", "headphone", "headphones"],
+    "inear": ["nhet tai", "in ear", "earbuds", "buds", "true wireless"],
+}
+_CONCEPT_PHRASES = sorted(
+    ((f" {phrase} ", concept) for concept, phrases in CONCEPTS.items() for phrase in phrases),
+    key=lambda p: -len(p[0]),
+)
+
+
+def _features(text: str) -> Iterable[tuple]:
+    """(feature, weight) của một đoạn text"""
+    folded = fold_text(text)
+    padded = f" {folded} "
+    for phrase, concept in _CONCEPT_PHRASES:
+        if phrase in padded:
+            yield f"k:{concept}", 2.0
+    for word in folded.split():
+        yield f"w:{word}", 1.0
+        if len(word) > 3 and not word.isdigit():
+            token = f"<{word}>"
+            for i in range(len(token) - 2):
+                yield f"c:{token[i:i + 3]}", 0.3
+
+
+def embed(text: str, dim: int = DIM) -> np.ndarray:
+    """Vector hashing đã chuẩn hoá L2 (crc32 ổn định giữa các process, khác hash())"""
+    vec = np.zeros(dim, dtype=np.float32)
+    for feature, weight in _features(text):
+        h = zlib.crc32(feature.encode("utf-8"))
+        # Bit dấu giảm sai lệch khi hai feature trùng bucket
+        vec[h % dim] += weight if (h >> 31) & 1 else -weight
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def product_text(product: dict) -> str:
+    return " ".join(p for p in (product["name"], product["brand_name"], product["type_name"]) if p)
+
+
+def _read_meta(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _remove_stale_embeddings(directory: str, keep: set):
+    """Xoá các file embeddings không còn được meta.json trỏ tới.
+
+    Giữ bản trước đó (worker khác có thể vừa đọc meta cũ) và file còn mới
+    (worker khác có thể đang ghi, chưa kịp đổi meta).
+    """
+    cutoff = time.time() - STALE_FILE_AGE
+    for entry in os.scandir(directory):
+        if entry.name.startswith("embeddings") and entry.name.endswith(".npy") and entry.name not in keep:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class RecommendationIndex:
+    """Ma trận embeddings + metadata để lọc giá/loại.
+
+    Ma trận lưu theo chiều (DIM x N): vector hashing rất thưa nên khi chấm điểm chỉ
+    cần đọc các hàng ứng với chiều khác 0 của câu hỏi thay vì toàn bộ ma trận.
+    """
+
+    def __init__(self, products: List[dict], embeddings: np.ndarray, hashes: List[int]):
+        self.products = products
+        self.embeddings = embeddings
+        self.hashes = hashes
+        self.prices = np.array([p["price"] if p["price"] is not None else -1 for p in products], dtype=np.int64)
+        self.type_names = sorted({p["type_name"] for p in products if p["type_name"]})
+        self.brand_names = sorted({p["brand_name"] for p in products if p["brand_name"]})
+        type_codes = {name: i for i, name in enumerate(self.type_names)}
+        self.type_codes = np.array([type_codes.get(p["type_name"], -1) for p in products], dtype=np.int32)
+        brand_codes = {name: i for i, name in enumerate(self.brand_names)}
+        self.brand_codes = np.array([brand_codes.get(p["brand_name"], -1) for p in products], dtype=np.int32)
+        # Price index: giá đã sắp xếp + vị trí tương ứng, lọc khoảng giá bằng searchsorted
+        self.price_order = np.argsort(self.prices, kind="stable")
+        self.sorted_prices = self.prices[self.price_order]
+
+    def __len__(self):
+        return len(self.products)
+
+    @classmethod
+    def build(cls, products: List[dict], previous: Optional["RecommendationIndex"] = None, directory: str = INDEX_DIR):
+        """Dựng index, tái sử dụng vector của sản phẩm không đổi nội dung (từ bản trước hoặc từ đĩa)"""
+        previous = previous or cls.load(directory)
+        reuse = {}
+        if previous is not None and previous.embeddings.shape[0] == DIM:
+            reuse = {h: i for i, h in enumerate(previous.hashes)}
+
+        hashes = [zlib.crc32(product_text(p).encode("utf-8")) for p in products]
+        embeddings = np.empty((DIM, len(products)), dtype=np.float32)
+        reused_rows, reused_from, new_rows = [], [], []
+        for row, h in enumerate(hashes):
+            old = reuse.get(h)
+            if old is not None:
+                reused_rows.append(row)
+                reused_from.append(old)
+            else:
+                new_rows.append(row)
+        if reused_rows:
+            embeddings[:, reused_rows] = previous.embeddings[:, reused_from]
+        if new_rows:
+            embeddings[:, new_rows] = np.stack([embed(product_text(products[row])) for row in new_rows], axis=1)
+        embedded = len(new_rows)
+
+        index = cls(products, embeddings, hashes)
+        if embedded or previous is None or len(previous) != len(products):
+            index = index.save(directory)
+        if embedded:
+            print(f"Recommendation index: {embedded}/{len(products)} sản phẩm được vector hoá lại")
+        return index
+
+    def save(self, directory: str = INDEX_DIR) -> "RecommendationIndex":
+        """Ghi embeddings ra file .npy mới rồi đổi meta.json trỏ sang file đó và mở lại dạng memmap chỉ đọc.
+
+        meta.json là con trỏ duy nhất (một lần os.replace): worker khác đọc được bản cũ
+        hoặc bản mới, không bao giờ meta của bản này với embeddings của bản kia.
+        """
+        try:
+            os.makedirs(directory, exist_ok=True)
+            name = f"embeddings-{os.getpid()}-{time.time_ns()}.npy"
+            path = os.path.join(directory, name)
+            out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=self.embeddings.shape)
+            out[:] = self.embeddings
+            out.flush()
+            del out
+            meta_path = os.path.join(directory, "meta.json")
+            previous = _read_meta(meta_path).get("file")
+            meta_tmp = f"{meta_path}.{os.getpid()}.tmp"
+            with open(meta_tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": FEATURE_VERSION, "dim": DIM, "file": name, "hashes": self.hashes}, f)
+            os.replace(meta_tmp, meta_path)
+            self.embeddings = np.load(path, mmap_mode="r")
+            _remove_stale_embeddings(directory, keep={name, previous})
+        except OSError as e:
+            print(f"Không lưu được recommendation index: {e}")
+        return self
+
+    @classmethod
+    def load(cls, directory: str = INDEX_DIR) -> Optional["RecommendationIndex"]:
+        """Embeddings đã lưu (chỉ dùng để tái sử dụng vector, metadata lấy lại từ DB)"""
+        try:
+            meta = _read_meta(os.path.join(directory, "meta.json"))
+            if meta.get("version") != FEATURE_VERSION or meta.get("dim") != DIM:
+                return None
+            embeddings = np.load(os.path.join(directory, os.path.basename(meta["file"])), mmap_mode="r")
+            if embeddings.shape != (DIM, len(meta["hashes"])):
+                return None
+            return cls([], embeddings, meta["hashes"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def price_rows(self, min_price: Optional[int] = None, max_price: Optional[int] = None) -> np.ndarray:
+        """Vị trí các sản phẩm có giá trong [min_price, max_price] (bỏ sản phẩm chưa có giá)"""
+        lo = np.searchsorted(self.sorted_prices, max(min_price or 0, 0), side="left")
+        hi = len(self) if max_price is None else np.searchsorted(self.sorted_prices, max_price, side="right")
+        return self.price_order[lo:hi]
+
+    def _mask(
+        self,
+        min_price: Optional[int],
+        max_price: Optional[int],
+        type_names: Optional[Iterable[str]],
+        brand_names: Optional[Iterable[str]] = None,
+    ):
+        mask = None
+        if min_price is not None or max_price is not None:
+            mask = np.zeros(len(self), dtype=bool)
+            mask[self.price_rows(min_price, max_price)] = True
+        for names, values, codes in (
+            (type_names, self.type_names, self.type_codes),
+            (brand_names, self.brand_names, self.brand_codes),
+        ):
+            if names:
+                # Bảng tra theo code (ô cuối cho code -1 = không rõ), nhanh hơn np.isin
+                lookup = np.zeros(len(values) + 1, dtype=bool)
+                lookup[[values.index(n) for n in names if n in values]] = True
+                matched = lookup[codes]
+                mask = matched if mask is None else mask & matched
+        return mask
+
+    def recommend_batch(
+        self,
+        queries: List[str],
+        k: int = TOP_K,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        type_names: Optional[Iterable[str]] = None,
+        brand_names: Optional[Iterable[str]] = None,
+    ) -> List[List[dict]]:
+        """Top-k cosine cho nhiều câu hỏi cùng lúc (một phép nhân ma trận), sau khi lọc giá/loại/brand"""
+        if not len(self) or not queries:
+            return [[] for _ in queries]
+        mask = self._mask(min_price, max_price, type_names, brand_names)
+        available = len(self) if mask is None else int(mask.sum())
+        if not available:
+            return [[] for _ in queries]
+
+        q = np.stack([embed(text) for text in queries])  # (m, DIM)
+        dims = np.flatnonzero(q.any(axis=0))
+        scores = (q[:, dims] @ self.embeddings[dims]).T  # (N, m), chỉ đọc các chiều cần thiết từ memmap
+        if mask is not None:
+            scores[~mask] = -np.inf
+        k = min(k, available)
+        results = []
+        for j in range(len(queries)):
+            col = scores[:, j]
+            top = np.argpartition(-col, k - 1)[:k] if k < len(col) else np.arange(len(col))
+            top = top[np.argsort(-col[top], kind="stable")][:k]
+            results.append([{**self.products[i], "score": round(float(col[i]), 4)} for i in top])
+        return results
+
+    def recommend(self, query: str, k: int = TOP_K, **filters) -> List[dict]:
+        return self.recommend_batch([query], k, **filters)[0]
+
+
+_index_cache = CatalogCache()
+
+
+def _load_products(db: Session) -> List[dict]:
+    from crud.headphone import get_headphones
+    return [
+        {
+            "id": h.id,
+            "name": h.name,
+            "price": h.price,
+            "brand_name": h.brand.name if h.brand else None,
+            "type_name": h.type.name if h.type else None,
+        }
+        for h in sorted(get_headphones(db), key=lambda h: h.id)
+    ]
+
+
+def get_recommender(db: Session) -> RecommendationIndex:
+    """Index dùng chung của process; khi catalog đổi chỉ vector hoá lại phần thay đổi"""
+    return _index_cache.get(lambda: RecommendationIndex.build(_load_products(db), previous=_index_cache.peek()))
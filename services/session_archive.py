@@ -0,0 +1,297 @@
+"""
+Lưu trữ session chat "nguội" ra file NDJSON nén, giữ bảng chat_sessions/chat_messages nhỏ.
+
+- Session không hoạt động quá CHAT_ARCHIVE_IDLE_DAYS ngày được ghi ra segment
+  `sessions-<thời điểm>-<pid>.ndjson.zst|.gz` rồi xoá khỏi DB theo từng batch.
+- Mỗi session là một frame nén độc lập (dòng đầu là session, các dòng sau là tin nhắn),
+  file `.idx` đi kèm ghi offset/length nên đọc lại một session chỉ cần seek + giải nén 1 frame.
+- GET /chat/sessions/{id} đọc từ archive khi không còn trong DB; chat tiếp trên session đã
+  archive thì session được nạp lại vào DB (restore_session).
+
+Chạy trong vòng bảo trì của app (services.chat_retention) hoặc từ cron:
+    python -m services.session_archive [--idle-days N] [--max-batches N]
+
+Environment variables:
+- `CHAT_ARCHIVE_IDLE_DAYS`: số ngày không hoạt động trước khi archive (default 0 = tắt)
+- `CHAT_ARCHIVE_DIR`: thư mục chứa segment (default ./archive/chat)
+- `CHAT_ARCHIVE_BATCH`: số session mỗi batch xoá (default 200)
+- `CHAT_ARCHIVE_SEGMENT_MB`: kích thước tối đa một segment (default 64)
+- `CHAT_ARCHIVE_COMPRESSION`: `zstd` (cần package zstandard) hoặc `gzip` (default zstd nếu có)
+"""
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import models
+from database import engine
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+IDLE_DAYS = float(os.getenv("CHAT_ARCHIVE_IDLE_DAYS", "0"))
+ARCHIVE_DIR = os.getenv("CHAT_ARCHIVE_DIR", os.path.join(".", "archive", "chat"))
+BATCH_SIZE = int(os.getenv("CHAT_ARCHIVE_BATCH", "200"))
+SEGMENT_MAX_BYTES = int(float(os.getenv("CHAT_ARCHIVE_SEGMENT_MB", "64")) * 1024 * 1024)
+COMPRESSION = os.getenv("CHAT_ARCHIVE_COMPRESSION", "zstd" if zstandard else "gzip").lower()
+if COMPRESSION == "zstd" and zstandard is None:
+    print("Warning: zstandard chưa được cài, archive dùng gzip")
+    COMPRESSION = "gzip"
+
+_EXTENSIONS = {"zstd": ".ndjson.zst", "gzip": ".ndjson.gz"}
+
+
+def _compress(data: bytes) -> bytes:
+    if COMPRESSION == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(segment: str, frame: bytes) -> bytes:
+    if segment.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"Cần package zstandard để đọc {segment}")
+        return zstandard.ZstdDecompressor().decompress(frame)
+    return gzip.decompress(frame)
+
+
+def _encode_session(session: dict, messages: List[dict]) -> bytes:
+    lines = [json.dumps({"type": "session", **session}, ensure_ascii=False, default=str)]
+    lines += [json.dumps({"type": "message", **m}, ensure_ascii=False, default=str) for m in messages]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class ArchiveIndex:
+    """session_id -> (segment, offset, length), nạp từ các file .idx (bản mới nhất thắng)"""
+
+    def __init__(self, directory: str = ARCHIVE_DIR):
+        self.directory = directory
+        self._entries: Dict[str, Tuple[str, int, int]] = {}
+        self._loaded: Dict[str, int] = {}  # file .idx -> số byte đã đọc
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Đọc phần mới của các file .idx (worker khác có thể đang ghi segment riêng)"""
+        if not os.path.isdir(self.directory):
+            return
+        with self._lock:
+            for name in sorted(os.listdir(self.directory)):
+                if not name.endswith(".idx"):
+                    continue
+                path = os.path.join(self.directory, name)
+                start = self._loaded.get(name, 0)
+                if os.path.getsize(path) <= start:
+                    continue
+                segment = name[:-len(".idx")]
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break  # dòng đang ghi dở, đọc lại lần sau
+                        entry = json.loads(line)
+                        self._entries[entry["id"]] = (segment, entry["offset"], entry["length"])
+                        start += len(line)
+                self._loaded[name] = start
+
+    def add(self, session_id: str, segment: str, offset: int, length: int):
+        with self._lock:
+            self._entries[session_id] = (segment, offset, length)
+
+    def lookup(self, session_id: str) -> Optional[Tuple[str, int, int]]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            self.refresh()
+            entry = self._entries.get(session_id)
+        return entry
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SegmentWriter:
+    """Ghi frame nén vào segment hiện tại, tự chuyển segment mới khi vượt SEGMENT_MAX_BYTES"""
+
+    def __init__(self, directory: str = ARCHIVE_DIR, index: Optional[ArchiveIndex] = None):
+        self.directory = directory
+        self.index = index
+        self._data = None
+        self._idx = None
+        self.segment = None
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        self.segment = f"sessions-{stamp}-{os.getpid()}{_EXTENSIONS[COMPRESSION]}"
+        self._data = open(os.path.join(self.directory, self.segment), "ab")
+        self._idx = open(os.path.join(self.directory, f"{self.segment}.idx"), "ab")
+
+    def write(self, session_id: str, payload: bytes):
+        if self._data is None or self._data.tell() >= SEGMENT_MAX_BYTES:
+            self.close()
+            self._open()
+        frame = _compress(payload)
+        offset = self._data.tell()
+        self._data.write(frame)
+        self._idx.write(json.dumps({"id": session_id, "offset": offset, "length": len(frame)}).encode("utf-8") + b"\n")
+        if self.index is not None:
+            self.index.add(session_id, self.segment, offset, len(frame))
+
+    def sync(self):
+        """fsync trước khi xoá khỏi DB: session chỉ mất khỏi DB khi đã nằm chắc trên đĩa"""
+        for f in (self._data, self._idx):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def close(self):
+        self.sync()
+        for f in (self._data, self._idx):
+            if f is not None:
+                f.close()
+        self._data = self._idx = None
+
+
+_index = ArchiveIndex()
+
+
+def get_archive_index() -> ArchiveIndex:
+    return _index
+
+
+def load_archived_session(session_id: str, index: Optional[ArchiveIndex] = None) -> Optional[dict]:
+    """{"session": {...}, "messages": [...]} của session đã archive, None nếu không có"""
+    index = index or _index
+    entry = index.lookup(session_id)
+    if entry is None:
+        return None
+    segment, offset, length = entry
+    with open(os.path.join(index.directory, segment), "rb") as f:
+        f.seek(offset)
+        frame = f.read(length)
+    session, messages = None, []
+    for line in _decompress(segment, frame).decode("utf-8").splitlines():
+        record = json.loads(line)
+        kind = record.pop("type")
+        if kind == "session":
+            session = record
+        else:
+            messages.append(record)
+    return {"session": session, "messages": messages}
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def restore_session(db: Session, session_id: str) -> bool:
+    """Nạp lại session đã archive vào DB (khi người dùng chat tiếp); bản archive vẫn được giữ"""
+    from crud.chat import PREVIEW_CHARS
+
+    archived = load_archived_session(session_id)
+    if archived is None or archived["session"] is None:
+        return False
+    session = dict(archived["session"])
+    for key in ("created_at", "updated_at"):
+        session[key] = _parse_time(session.get(key))
+    messages = [{**m, "created_at": _parse_time(m.get("created_at"))} for m in archived["messages"]]
+    # Bộ đếm tính lại từ tin nhắn (archive ghi theo thứ tự created_at)
+    session["message_count"] = len(messages)
+    if messages:
+        last = messages[-1]
+        session.update(
+            last_message_at=last["created_at"], last_message_role=last["role"],
+            last_message_preview=last["content"][:PREVIEW_CHARS],
+        )
+    try:
+        db.bulk_insert_mappings(models.ChatSession, [session])
+        if messages:
+            db.bulk_insert_mappings(models.ChatMessage, messages)
+        db.commit()
+    except Exception as e:
+        # Vd. partition của tháng cũ đã bị xoá theo retention
+        db.rollback()
+        print(f"Không khôi phục được session {session_id} từ archive: {e}")
+        return False
+    return True
+
+
+def _archive_batch(conn, writer: SegmentWriter, cutoff: datetime) -> List[str]:
+    """Archive + xoá tối đa BATCH_SIZE session trong một transaction"""
+    lock = " FOR UPDATE SKIP LOCKED" if conn.dialect.name == "postgresql" else ""
+    sessions = conn.execute(text(f"""
+        SELECT id, user_id, created_at, updated_at, summary, summary_message_count
+        FROM chat_sessions WHERE updated_at < :cutoff
+        ORDER BY updated_at LIMIT :limit{lock}
+    """), {"cutoff": cutoff, "limit": BATCH_SIZE}).mappings().all()
+    if not sessions:
+        return []
+
+    ids = [s["id"] for s in sessions]
+    params = {f"id{i}": sid for i, sid in enumerate(ids)}
+    in_list = ", ".join(f":id{i}" for i in range(len(ids)))
+    by_session: Dict[str, List[dict]] = {sid: [] for sid in ids}
+    rows = conn.execute(text(f"""
+        SELECT id, session_id, role, content, created_at FROM chat_messages
+        WHERE session_id IN ({in_list}) ORDER BY session_id, created_at
+    """), params).mappings()
+    for row in rows:
+        by_session[row["session_id"]].append(dict(row))
+
+    for session in sessions:
+        writer.write(session["id"], _encode_session(dict(session), by_session[session["id"]]))
+    writer.sync()
+
+    conn.execute(text(f"DELETE FROM chat_messages WHERE session_id IN ({in_list})"), params)
+    conn.execute(text(f"DELETE FROM chat_sessions WHERE id IN ({in_list})"), params)
+    return ids
+
+
+def archive_idle_sessions(idle_days: float = IDLE_DAYS, max_batches: Optional[int] = None) -> int:
+    """Archive các session không hoạt động quá idle_days ngày; trả về số session đã archive"""
+    if idle_days <= 0:
+        return 0
+    from services.session_store import get_session_store
+
+    cutoff = datetime.utcnow() - timedelta(days=idle_days)
+    writer = SegmentWriter(index=_index)
+    total, batches = 0, 0
+    started = time.perf_counter()
+    try:
+        while max_batches is None or batches < max_batches:
+            with engine.begin() as conn:
+                ids = _archive_batch(conn, writer, cutoff)
+            if not ids:
+                break
+            for sid in ids:
+                try:
+                    get_session_store().delete(sid)
+                except Exception as e:
+                    print(f"Session store error (delete): {e}")
+            total += len(ids)
+            batches += 1
+    finally:
+        writer.close()
+    if total:
+        print(f"Chat archive: {total} session -> {ARCHIVE_DIR} ({time.perf_counter() - started:.1f}s)")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive session chat không hoạt động ra file NDJSON nén")
+    parser.add_argument("--idle-days", type=float, default=IDLE_DAYS or 90, help="số ngày không hoạt động")
+    parser.add_argument("--max-batches", type=int, default=None, help="giới hạn số batch mỗi lần chạy")
+    args = parser.parse_args()
+    print(f"archived: {archive_idle_sessions(args.idle_days, args.max_batches)}")
+
+
+if __name__ == "__main__":
+    main()
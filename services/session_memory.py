@@ -0,0 +1,77 @@
+"""
+Rolling summary cho các phiên chat dài
+"""
+import os
+
+from database import SessionLocal
+from crud.chat import get_session, count_messages, get_messages_range, update_session_summary
+
+# Số tin nhắn mới (ngoài cửa sổ gần nhất) cần tích lũy trước khi tóm tắt lại
+SUMMARY_EVERY_N = int(os.getenv("CHAT_SUMMARY_EVERY", "6"))
+# Số tin nhắn gần nhất luôn được gửi nguyên văn, không đưa vào summary
+KEEP_RECENT = int(os.getenv("CHAT_SUMMARY_KEEP_RECENT", "6"))
+# Lịch sử gửi cho model là mọi tin nhắn sau summary (KEEP_RECENT + các tin nhắn chờ tóm tắt);
+# chừa thêm một chu kỳ vì summary được tóm tắt lại trong background
+HISTORY_LIMIT = KEEP_RECENT + 2 * SUMMARY_EVERY_N
+
+SUMMARY_PROMPT = """Bạn tóm tắt hội thoại giữa khách hàng và trợ lý của cửa hàng tai nghe.
+Giữ lại: nhu cầu, ngân sách, thương hiệu/loại yêu thích, sản phẩm đã được gợi ý hoặc đã loại,
+và các câu hỏi còn bỏ ngỏ. Viết ngắn gọn (tối đa 120 từ), không bịa thêm thông tin."""
+
+# Các session đang được tóm tắt trong process này (tránh gọi LLM trùng lặp)
+_refreshing = set()
+
+
+def unsummarized(messages: list, total_messages: int, summary_message_count: int) -> list:
+    """Phần cuối của `messages` chưa nằm trong summary (tối đa HISTORY_LIMIT tin nhắn)"""
+    pending = min(total_messages - summary_message_count, HISTORY_LIMIT)
+    return messages[-pending:] if pending > 0 else []
+
+
+def needs_summary_refresh(total_messages: int, summary_message_count: int) -> bool:
+    """Có đủ tin nhắn cũ chưa được tóm tắt để chạy lại summary chưa"""
+    return total_messages - KEEP_RECENT - summary_message_count >= SUMMARY_EVERY_N
+
+
+async def refresh_session_summary(ai, session_id: str):
+    """Gộp các tin nhắn cũ (ngoài cửa sổ KEEP_RECENT) vào summary của session.
+
+    Chạy trong background task sau khi đã trả lời khách, dùng DB session riêng.
+    """
+    if session_id in _refreshing:
+        return
+    _refreshing.add(session_id)
+
+    db = SessionLocal()
+    try:
+        session = get_session(db, session_id)
+        if not session:
+            return
+
+        summarized = session.summary_message_count or 0
+        upto = count_messages(db, session_id) - KEEP_RECENT
+        if upto <= summarized:
+            return
+
+        new_messages = get_messages_range(db, session_id, summarized, upto - summarized)
+        transcript = "\n".join(
+            f"{'Khách hàng' if m.role == 'user' else 'Trợ lý'}: {m.content}" for m in new_messages
+        )
+        previous = session.summary or "(chưa có)"
+
+        summary = await ai.generate(
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"TÓM TẮT HIỆN CÓ:\n{previous}\n\nHỘI THOẠI MỚI:\n{transcript}\n\nTÓM TẮT CẬP NHẬT:"},
+            ],
+            max_tokens=250,
+            temperature=0.2,
+            intent="summary",
+        )
+        update_session_summary(db, session_id, summary.strip(), upto)
+        print(f"Đã cập nhật summary cho session {session_id} ({upto} tin nhắn)")
+    except Exception as e:
+        print(f"Lỗi tóm tắt session {session_id}: {e}")
+    finally:
+        _refreshing.discard(session_id)
+        db.close()
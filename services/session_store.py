@@ -0,0 +1,224 @@
+"""
+Cache trạng thái phiên chat (summary + các lượt gần nhất) dùng chung giữa worker/node.
+
+PostgreSQL vẫn là nguồn dữ liệu chính: crud/chat.py ghi SQL trước rồi ghi xuyên
+(write-through) vào store, nên mất cache chỉ làm chậm lượt đọc kế tiếp.
+
+Environment variables:
+- `SESSION_STORE`: `sql` (default, không cache), `memory` (1 worker) hoặc `redis`
+- `SESSION_STORE_URL`: vd. `redis://localhost:6379/0`; `fakeredis://` dùng fakeredis cho test/local
+- `SESSION_STORE_TTL`: số giây giữ một phiên không hoạt động (default 3600)
+- `SESSION_STORE_RECENT`: số tin nhắn gần nhất được cache cho mỗi phiên (default 20)
+- `SESSION_STORE_MAX_SESSIONS`: giới hạn số phiên của store memory (default 10000)
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Optional
+
+RECENT_LIMIT = int(os.getenv("SESSION_STORE_RECENT", "20"))
+
+
+class CachedSession(SimpleNamespace):
+    """Snapshot phiên chat lấy từ store, cùng thuộc tính với models.ChatSession mà router dùng"""
+
+    @classmethod
+    def from_state(cls, state: dict, limit: int):
+        recent = state["recent"][-limit:] if limit else []
+        return cls(
+            id=state["id"],
+            summary=state.get("summary"),
+            summary_message_count=state.get("summary_message_count", 0),
+            message_count=state["message_count"],
+            recent_messages=[SimpleNamespace(role=m["role"], content=m["content"]) for m in recent],
+        )
+
+
+def make_state(session_id: str, summary: Optional[str], summary_message_count: int, message_count: int, recent: list) -> dict:
+    return {
+        "id": session_id,
+        "summary": summary,
+        "summary_message_count": summary_message_count or 0,
+        "message_count": message_count,
+        "recent": [{"role": m.role, "content": m.content} for m in recent][-RECENT_LIMIT:],
+    }
+
+
+def _apply_message(state: dict, role: str, content: str) -> dict:
+    state["recent"] = (state["recent"] + [{"role": role, "content": content}])[-RECENT_LIMIT:]
+    state["message_count"] += 1
+    return state
+
+
+class SessionStore:
+    """Store rỗng: mọi lượt đọc đi thẳng xuống SQL (hành vi mặc định)"""
+
+    name = "sql"
+
+    def get(self, session_id: str) -> Optional[dict]:
+        return None
+
+    def set(self, session_id: str, state: dict):
+        pass
+
+    def set_if_absent(self, session_id: str, state: dict) -> bool:
+        return False
+
+    def append_message(self, session_id: str, role: str, content: str):
+        pass
+
+    def update_summary(self, session_id: str, summary: str, summary_message_count: int):
+        pass
+
+    def delete(self, session_id: str):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """LRU trong process. Chỉ an toàn khi chạy 1 worker (các worker không thấy ghi của nhau)."""
+
+    name = "memory"
+
+    def __init__(self, ttl: int = 3600, max_sessions: int = 10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._data = OrderedDict()  # session_id -> (expires_at, state)
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            item = self._data.get(session_id)
+            if not item:
+                return None
+            if item[0] < time.monotonic():
+                del self._data[session_id]
+                return None
+            self._data.move_to_end(session_id)
+            return json.loads(json.dumps(item[1]))  # bản sao, tránh sửa chung object
+
+    def _set(self, session_id: str, state: dict):
+        self._data[session_id] = (time.monotonic() + self.ttl, state)
+        self._data.move_to_end(session_id)
+        while len(self._data) > self.max_sessions:
+            self._data.popitem(last=False)
+
+    def set(self, session_id: str, state: dict):
+        with self._lock:
+            self._set(session_id, state)
+
+    def set_if_absent(self, session_id: str, state: dict) -> bool:
+        with self._lock:
+            item = self._data.get(session_id)
+            if item and item[0] >= time.monotonic():
+                return False
+            self._set(session_id, state)
+            return True
+
+    def _update(self, session_id: str, fn):
+        with self._lock:
+            item = self._data.get(session_id)
+            if item:
+                self._data[session_id] = (time.monotonic() + self.ttl, fn(item[1]))
+
+    def append_message(self, session_id: str, role: str, content: str):
+        self._update(session_id, lambda s: _apply_message(s, role, content))
+
+    def update_summary(self, session_id: str, summary: str, summary_message_count: int):
+        self._update(session_id, lambda s: {**s, "summary": summary, "summary_message_count": summary_message_count})
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._data.pop(session_id, None)
+
+
+class RedisSessionStore(SessionStore):
+    """Store qua giao thức Redis (Redis, Valkey, KeyDB, fakeredis), dùng chung giữa các worker và node"""
+
+    name = "redis"
+
+    def __init__(self, client, ttl: int = 3600, prefix: str = "chat:session:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    def get(self, session_id: str) -> Optional[dict]:
+        raw = self.client.get(self._key(session_id))
+        return json.loads(raw) if raw else None
+
+    def set(self, session_id: str, state: dict):
+        self.client.set(self._key(session_id), json.dumps(state, ensure_ascii=False), ex=self.ttl)
+
+    def set_if_absent(self, session_id: str, state: dict) -> bool:
+        return bool(self.client.set(self._key(session_id), json.dumps(state, ensure_ascii=False), ex=self.ttl, nx=True))
+
+    def _update(self, session_id: str, fn):
+        key = self._key(session_id)
+
+        # WATCH/MULTI: worker khác ghi cùng phiên thì redis-py tự chạy lại
+        def transaction(pipe):
+            raw = pipe.get(key)
+            if not raw:
+                return
+            state = fn(json.loads(raw))
+            pipe.multi()
+            pipe.set(key, json.dumps(state, ensure_ascii=False), ex=self.ttl)
+
+        self.client.transaction(transaction, key)
+
+    def append_message(self, session_id: str, role: str, content: str):
+        self._update(session_id, lambda s: _apply_message(s, role, content))
+
+    def update_summary(self, session_id: str, summary: str, summary_message_count: int):
+        self._update(session_id, lambda s: {**s, "summary": summary, "summary_message_count": summary_message_count})
+
+    def delete(self, session_id: str):
+        self.client.delete(self._key(session_id))
+
+
+def create_session_store() -> SessionStore:
+    backend = os.getenv("SESSION_STORE", "sql").lower()
+    ttl = int(os.getenv("SESSION_STORE_TTL", "3600"))
+
+    if backend == "memory":
+        return MemorySessionStore(ttl=ttl, max_sessions=int(os.getenv("SESSION_STORE_MAX_SESSIONS", "10000")))
+
+    if backend == "redis":
+        url = os.getenv("SESSION_STORE_URL", "redis://localhost:6379/0")
+        try:
+            if url.startswith("fakeredis://"):
+                import fakeredis
+                client = fakeredis.FakeRedis()
+            else:
+                import redis
+                client = redis.Redis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0)
+        except ImportError:
+            print("Warning: SESSION_STORE=redis nhưng chưa cài redis/fakeredis, dùng SQL trực tiếp.")
+            return SessionStore()
+        return RedisSessionStore(client, ttl=ttl)
+
+    return SessionStore()
+
+
+_store = None
+
+
+def get_session_store() -> SessionStore:
+    """Store dùng chung của process (khởi tạo lần đầu từ environment)"""
+    global _store
+    if _store is None:
+        _store = create_session_store()
+        if _store.name != "sql":
+            print(f"Session store: {_store.name}")
+    return _store
+
+
+def set_session_store(store: SessionStore):
+    """Thay store (test hoặc cấu hình thủ công)"""
+    global _store
+    _store = store
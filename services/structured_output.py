@@ -0,0 +1,69 @@
+"""
+Structured output (JSON schema / GBNF grammar) cho CRUD intent
+"""
+import json
+import typing
+from functools import lru_cache
+from typing import Any, Literal, Union
+
+from pydantic import TypeAdapter
+
+from schemas.chatbot import CRUDRequest
+
+# Compile validator một lần cho toàn process
+CRUD_ADAPTER = TypeAdapter(CRUDRequest)
+
+# Các rule JSON chung cho GBNF (theo json.gbnf của llama.cpp)
+_GBNF_JSON_RULES = r'''
+value ::= object | array | string | number | ("true" | "false" | "null")
+object ::= "{" ws ( string ws ":" ws value ( ws "," ws string ws ":" ws value )* )? ws "}"
+array ::= "[" ws ( value ( ws "," ws value )* )? ws "]"
+string ::= "\"" ( [^"\\\x7F\x00-\x1F] | "\\" ( ["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] ) )* "\""
+number ::= "-"? [0-9]+ ( "." [0-9]+ )? ( [eE] [-+]? [0-9]+ )?
+ws ::= [ \t\n]*
+'''
+
+
+@lru_cache(maxsize=None)
+def crud_json_schema() -> dict:
+    """JSON schema của CRUDRequest, dùng cho OpenAI `response_format`"""
+    return CRUDRequest.model_json_schema()
+
+
+def _gbnf_value(annotation) -> str:
+    """Chuyển type annotation của field thành biểu thức GBNF"""
+    origin = typing.get_origin(annotation)
+    if origin is Literal:
+        return "( " + " | ".join(json.dumps(json.dumps(v)) for v in typing.get_args(annotation)) + " )"
+    if origin is Union:
+        return "( " + " | ".join(
+            '"null"' if arg is type(None) else _gbnf_value(arg) for arg in typing.get_args(annotation)
+        ) + " )"
+    if annotation is str:
+        return "string"
+    if annotation in (int, float):
+        return "number"
+    if origin is dict:
+        return "object"
+    if origin is list:
+        return "array"
+    return "value"
+
+
+@lru_cache(maxsize=None)
+def crud_gbnf_grammar() -> str:
+    """GBNF grammar sinh từ các field của CRUDRequest, dùng cho llama.cpp `grammar`"""
+    required, optional = [], []
+    for name, field in CRUDRequest.model_fields.items():
+        member = f'"\\"{name}\\"" ws ":" ws {_gbnf_value(field.annotation)}'
+        (required if field.is_required() else optional).append(member)
+
+    body = ' ws "," ws '.join(required)
+    for member in optional:
+        body += f' ( ws "," ws {member} )?'
+    return f'root ::= "{{" ws {body} ws "}}"' + _GBNF_JSON_RULES
+
+
+def parse_crud_request(json_str: str) -> dict[str, Any]:
+    """Validate JSON bằng TypeAdapter đã compile, trả về dict cho dispatch CRUD"""
+    return CRUD_ADAPTER.validate_json(json_str).model_dump(exclude_none=True)
@@ -0,0 +1,111 @@
+"""
+Đo thời gian từng bước xử lý request (Server-Timing header + OpenTelemetry span tuỳ chọn)
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Tracer OpenTelemetry, chỉ có khi bật OTEL_TRACING_ENABLED và đã cài opentelemetry-sdk
+_tracer = None
+
+
+def init_tracing():
+    """Cấu hình OpenTelemetry nếu được bật.
+
+    Environment variables:
+    - `OTEL_TRACING_ENABLED`: bật tracing ("1"/"true")
+    - `OTEL_TRACES_SAMPLE_RATIO`: tỉ lệ sample (default 0.1)
+    - `OTEL_EXPORTER_OTLP_ENDPOINT`: collector local (vd. http://localhost:4318/v1/traces);
+      không đặt thì in span ra console
+    """
+    global _tracer
+    if os.getenv("OTEL_TRACING_ENABLED", "").lower() not in ("1", "true", "yes"):
+        return
+
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    except ImportError:
+        print("Warning: OTEL_TRACING_ENABLED nhưng chưa cài opentelemetry-sdk, bỏ qua tracing.")
+        return
+
+    ratio = float(os.getenv("OTEL_TRACES_SAMPLE_RATIO", "0.1"))
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "chat-bot-be")}),
+        sampler=ParentBased(TraceIdRatioBased(ratio)),
+    )
+
+    exporter = ConsoleSpanExporter()
+    if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter()
+        except ImportError:
+            print("Warning: chưa cài opentelemetry-exporter-otlp, dùng console exporter.")
+
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("chat-bot-be")
+    print(f"OpenTelemetry tracing enabled (sample ratio {ratio})")
+
+
+class StageTimer:
+    """Ghi lại thời gian của từng stage trong một request"""
+
+    def __init__(self, name: str = "request"):
+        self._stages = {}  # name -> giây, giữ thứ tự stage đầu tiên
+        self._started = time.perf_counter()
+        self._span = _tracer.start_span(name) if _tracer else None
+
+    def _child_span(self, name: str, start_time: Optional[int] = None):
+        if not self._span:
+            return None
+        from opentelemetry import trace
+        return _tracer.start_span(name, context=trace.set_span_in_context(self._span), start_time=start_time)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Đo một stage: `with timer.stage("llm"): ...`"""
+        span = self._child_span(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stages[name] = self._stages.get(name, 0.0) + time.perf_counter() - started
+            if span:
+                span.end()
+
+    def record(self, name: str, seconds: float):
+        """Ghi một stage đã đo sẵn (dùng khi không tiện bọc `with`)"""
+        self._stages[name] = self._stages.get(name, 0.0) + seconds
+        if self._span:
+            end = time.time_ns()
+            self._child_span(name, start_time=end - int(seconds * 1e9)).end(end_time=end)
+
+    def finish(self):
+        if self._span:
+            self._span.end()
+            self._span = None
+
+    @property
+    def stages(self) -> dict:
+        return dict(self._stages)
+
+    def server_timing_header(self) -> str:
+        """Giá trị header Server-Timing, vd. `session;dur=3.1, llm;dur=812.4, total;dur=830.0`"""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self._stages.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self._started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def get_stage_timer(request) -> StageTimer:
+    """Timer của request hiện tại (middleware tạo), hoặc timer rời nếu không có"""
+    timer = getattr(request.state, "timer", None)
+    if timer is None:
+        timer = StageTimer()
+        request.state.timer = timer
+    return timer
@@ -0,0 +1,145 @@
+"""
+Ghi lại traffic chat (đã ẩn danh) ra file NDJSON xoay vòng để replay khi capacity planning.
+
+Bật bằng environment variables:
+- `TRAFFIC_CAPTURE_DIR`: thư mục ghi file (không đặt = tắt)
+- `TRAFFIC_CAPTURE_MAX_MB`: kích thước tối đa mỗi file trước khi xoay (default 50)
+- `TRAFFIC_CAPTURE_SAMPLE`: tỉ lệ request được ghi (default 1.0)
+- `TRAFFIC_CAPTURE_SALT`: salt để hash session_id (mặc định sinh ngẫu nhiên mỗi process).
+  Nhiều worker phải dùng chung salt, nếu không các lượt của một phiên rơi vào worker khác
+  nhau sẽ có hash khác nhau; WEB_CONCURRENCY > 1 mà thiếu salt thì không khởi động được
+
+Mỗi dòng là một request `POST /chat/`, ví dụ:
+    {"ts": 1760000000.123, "session": "9f86d081884c7d65", "new_session": true,
+     "message": "Tư vấn tai nghe dưới 9999999", "intent": "product_consultation",
+     "status": 200, "latency_ms": 812.4, "stages": {"llm": 790.2, ...}}
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import secrets
+import threading
+from datetime import datetime
+from typing import Optional
+
+CAPTURE_PATHS = ("/chat", "/chat/")
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_PHONE_RE = re.compile(r"(?<!\w)(?:\+?84|0)(?:[\s.-]?\d){8,10}(?!\w)")
+_LONG_NUMBER_RE = re.compile(r"\d{7,}")
+_UUID_RE = re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE)
+
+
+def anonymize_message(text: str) -> str:
+    """Xoá email, số điện thoại, dãy số dài; giữ nguyên độ dài tương đối và ý định câu hỏi"""
+    text = _EMAIL_RE.sub("<EMAIL>", text)
+    text = _PHONE_RE.sub("<PHONE>", text)
+    text = _UUID_RE.sub("<ID>", text)
+    # Giá tiền kiểu 8990000 vẫn giữ số chữ số để prompt có độ dài tương đương
+    return _LONG_NUMBER_RE.sub(lambda m: "9" * len(m.group()), text)
+
+
+class TrafficRecorder:
+    """Ghi NDJSON, xoay file khi vượt `max_bytes`. Thread-safe."""
+
+    def __init__(self, directory: str, max_bytes: int = 50 * 1024 * 1024, sample: float = 1.0, salt: Optional[str] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.sample = sample
+        self._salt = (salt or secrets.token_hex(16)).encode()
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._index = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["TrafficRecorder"]:
+        directory = os.getenv("TRAFFIC_CAPTURE_DIR")
+        if not directory:
+            return None
+        salt = os.getenv("TRAFFIC_CAPTURE_SALT")
+        if not salt:
+            if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+                raise RuntimeError("TRAFFIC_CAPTURE_SALT là bắt buộc khi chạy nhiều worker (WEB_CONCURRENCY > 1)")
+            print("WARNING: TRAFFIC_CAPTURE_SALT chưa đặt, dùng salt ngẫu nhiên của process này; "
+                  "chạy nhiều worker thì các lượt của cùng một phiên sẽ không liên kết được khi replay")
+        return cls(
+            directory,
+            max_bytes=int(float(os.getenv("TRAFFIC_CAPTURE_MAX_MB", "50")) * 1024 * 1024),
+            sample=float(os.getenv("TRAFFIC_CAPTURE_SAMPLE", "1.0")),
+            salt=salt,
+        )
+
+    def should_record(self) -> bool:
+        return self.sample >= 1.0 or random.random() < self.sample
+
+    def hash_session(self, session_id: Optional[str]) -> Optional[str]:
+        """Hash ổn định trong cùng salt -> giữ được liên kết các lượt của một phiên"""
+        if not session_id:
+            return None
+        return hashlib.sha256(self._salt + session_id.encode()).hexdigest()[:16]
+
+    def _open_next(self):
+        if self._file:
+            self._file.close()
+        self._index += 1
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"chat-{stamp}-{os.getpid()}-{self._index}.ndjson")
+        self._file = open(path, "a", encoding="utf-8")
+        self._size = 0
+
+    def record(self, entry: dict):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        size = len(line.encode("utf-8"))
+        with self._lock:
+            if self._file is None or self._size + size > self.max_bytes:
+                self._open_next()
+            self._file.write(line)
+            self._file.flush()
+            self._size += size
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def build_entry(recorder: TrafficRecorder, started: float, body: bytes, state, status: int, latency: float) -> Optional[dict]:
+    """Dựng bản ghi từ body request và thông tin endpoint để lại trên request.state"""
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return None
+    message = payload.get("message")
+    if not isinstance(message, str):
+        return None
+
+    timer = getattr(state, "timer", None)
+    session_id = getattr(state, "chat_session_id", None) or payload.get("session_id")
+    return {
+        "ts": round(started, 3),
+        "session": recorder.hash_session(session_id),
+        "new_session": not payload.get("session_id"),
+        "message": anonymize_message(message),
+        "intent": getattr(state, "chat_intent", None),
+        "status": status,
+        "latency_ms": round(latency * 1000, 1),
+        "stages": {k: round(v * 1000, 1) for k, v in timer.stages.items()} if timer else {},
+    }
+
+
+def read_capture(paths) -> list:
+    """Đọc các file NDJSON đã ghi, sắp xếp theo thời điểm gửi"""
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entries.append(json.loads(line))
+    entries.sort(key=lambda e: e.get("ts", 0))
+    return entries
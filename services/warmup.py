@@ -0,0 +1,82 @@
+"""
+Warmup khi khởi động worker: mở sẵn connection DB, dựng catalog context và gửi
+một completion rất ngắn để model (và prefix KV cache) nằm sẵn trong bộ nhớ.
+
+Environment variables:
+- `WARMUP_ENABLED`: bật warmup (default true)
+- `WARMUP_DB_CONNECTIONS`: số connection mở sẵn (default DB_POOL_SIZE hoặc 1)
+- `WARMUP_MODEL`: `background` (default, catalog + model warmup chạy nền, không chặn startup),
+  `blocking` (startup chờ warmup xong) hoặc `off` (chỉ dựng catalog trong nền)
+"""
+import asyncio
+import os
+import time
+
+from sqlalchemy import text
+
+from database import SessionLocal, engine
+
+
+def warmup_enabled() -> bool:
+    return os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def warm_database(connections: int = None) -> int:
+    """Mở đồng thời N connection rồi trả về pool (NullPool thì chỉ kiểm tra kết nối)"""
+    if connections is None:
+        connections = int(os.getenv("WARMUP_DB_CONNECTIONS", os.getenv("DB_POOL_SIZE", "0")) or 0) or 1
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = engine.connect()
+            conn.execute(text("SELECT 1"))
+            opened.append(conn)
+    finally:
+        for conn in opened:
+            conn.close()
+    return len(opened)
+
+
+def prime_catalog() -> str:
+    """Dựng catalog context, search index và recommendation index một lần: cấu hình mapper, compile query, nạp cache"""
+    from routers.chatbot import get_db_context
+    from services.product_search import SEARCH_BACKEND, get_memory_index
+    from services.recommendation import RECO_ENABLED, get_recommender
+
+    db = SessionLocal()
+    try:
+        db_context = get_db_context(db)
+        if SEARCH_BACKEND == "memory":
+            get_memory_index(db)
+        if RECO_ENABLED:
+            get_recommender(db)
+        return db_context
+    finally:
+        db.close()
+
+
+async def warm_up(ai=None):
+    """Dựng catalog trong thread (không chặn event loop) rồi warm model nếu có client"""
+    db_context = ""
+    try:
+        db_context = await asyncio.to_thread(prime_catalog)
+    except Exception as e:
+        print(f"Catalog warmup failed: {e}")
+    if ai is not None:
+        await warm_model(ai, db_context)
+
+
+async def warm_model(ai, db_context: str = "") -> float:
+    """Gửi completion 1 token với system prompt + catalog để model và prefix cache sẵn sàng"""
+    from routers.chatbot import build_chat_messages
+    from services.headphone_prompts import get_prompt_for_intent
+
+    started = time.perf_counter()
+    messages = build_chat_messages(get_prompt_for_intent("general"), db_context, [], "ping")
+    try:
+        await ai.generate(messages=messages, max_tokens=1, temperature=0, intent="warmup")
+    except Exception as e:
+        print(f"Model warmup failed: {e}")
+    elapsed = time.perf_counter() - started
+    print(f"Model warmup: {elapsed * 1000:.0f}ms")
+    return elapsed